@@ -0,0 +1,153 @@
+"""
+Measures the cost of decoding frames into signals with SignalDecoder.
+
+Frames are drawn from the messages of a DBC file (or of a generated one
+with byte aligned and bit packed messages) plus a share of IDs the
+database does not know. Reported are the nanoseconds per frame and the
+CPU share decoding would take at typical bus rates, next to plain
+cantools Database.decode_message().
+
+No CAN interface is needed:
+
+    python3 -m benchmarks.bench_decode
+    python3 -m benchmarks.bench_decode --dbc vehicle.dbc -n 200000
+"""
+
+import os
+import random
+import time
+
+import cantools
+import click
+from cantools.database.can import Database, Message, Signal
+from cantools.database.conversion import BaseConversion
+
+from can_logger.decoding import SignalDecoder
+
+# Frames per second of a fully loaded bus: 8 byte classic CAN frames
+# (~125 bits each) and 64 byte CAN-FD frames (500 kbit/s arbitration,
+# 2 Mbit/s data phase).
+BUS_RATES = {
+    "CAN 500k": 4_000,
+    "CAN 1M": 8_000,
+    "CAN-FD 2M": 2_600,
+    "vcan burst": 100_000,
+}
+
+
+def _generated_database(message_count: int = 64) -> Database:
+    messages = []
+    for i in range(message_count):
+        if i % 2:
+            # Byte aligned little endian signals, some scaled
+            signals = [
+                Signal(
+                    f"Signal{j}",
+                    start=16 * j,
+                    length=16,
+                    is_signed=bool(j % 2),
+                    conversion=BaseConversion.factory(
+                        scale=0.1 if j % 2 else 1, offset=0
+                    ),
+                )
+                for j in range(4)
+            ]
+        else:
+            # Bit packed signals of mixed byte order
+            signals = [
+                Signal("Flag", start=0, length=1),
+                Signal("Counter", start=1, length=4),
+                Signal(
+                    "Value",
+                    start=12,
+                    length=12,
+                    is_signed=True,
+                    conversion=BaseConversion.factory(scale=0.5, offset=-10),
+                ),
+                Signal("Raw", start=39, length=20, byte_order="big_endian"),
+            ]
+        messages.append(Message(0x100 + i, f"Message{i}", 8, signals))
+    return Database(messages)
+
+
+def _frames(
+    database: Database, count: int, unknown_share: float
+) -> list[tuple[int, bytes, bool]]:
+    rng = random.Random(0)
+    messages = database.messages
+    frames = []
+    for _ in range(count):
+        if rng.random() < unknown_share:
+            frames.append((0x700 + rng.randrange(0x80), os.urandom(8), False))
+        else:
+            message = rng.choice(messages)
+            frames.append(
+                (
+                    message.frame_id,
+                    os.urandom(message.length),
+                    message.is_extended_frame,
+                )
+            )
+    return frames
+
+
+def _time_per_frame(decode, frames) -> float:
+    start = time.perf_counter()
+    for arbitration_id, data, is_extended_id in frames:
+        decode(arbitration_id, data, is_extended_id)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def _cantools_decode(database: Database):
+    def decode(arbitration_id, data, is_extended_id):
+        try:
+            return database.decode_message(arbitration_id, data)
+        except KeyError:
+            return None
+
+    return decode
+
+
+@click.command()
+@click.option(
+    "--dbc",
+    "dbc_path",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="DBC file to benchmark, a generated one is used by default.",
+)
+@click.option("-n", "--count", default=100_000, show_default=True)
+@click.option(
+    "--unknown-share",
+    default=0.2,
+    show_default=True,
+    help="Share of frames with IDs missing from the database.",
+)
+def main(dbc_path, count, unknown_share):
+    if dbc_path:
+        database = cantools.database.load_file(dbc_path)
+    else:
+        database = _generated_database()
+    frames = _frames(database, count, unknown_share)
+    decoder = SignalDecoder(database)
+
+    results = {
+        "cantools": _time_per_frame(_cantools_decode(database), frames),
+        "cached": _time_per_frame(decoder.decode, frames),
+    }
+
+    print(f"{len(database.messages)} messages, {count} frames")
+    header = f"{'decoder':<10}{'ns/frame':>10}{'frames/s':>12}"
+    header += "".join(f"{name:>14}" for name in BUS_RATES)
+    print(header)
+    for name, seconds in results.items():
+        line = f"{name:<10}{seconds * 1e9:>10.0f}{1 / seconds:>12.0f}"
+        # CPU share of one core spent decoding at the bus rate
+        line += "".join(
+            f"{rate * seconds:>14.1%}" for rate in BUS_RATES.values()
+        )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
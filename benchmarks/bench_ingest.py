@@ -0,0 +1,373 @@
+"""
+Throughput of the ingestion paths with synthetic traffic on python-can's
+virtual bus.
+
+Paths:
+
+    sniffer   CanSniffer.sniff_db(), the capture engine with the sqlite sink
+    async     can_logger.__main__.async_main(), the capture engine with the
+              console and sqlite sinks
+    database  CANMessageDatabase.add_messages() alone, without a bus
+
+Traffic patterns:
+
+    mixed     classic CAN frames of 64 IDs with DLCs 0-8
+    fd        CAN-FD frames (BRS) with every FD length up to 64 bytes
+    many-ids  8 byte frames of 4096 IDs, half of them extended
+    burst     mixed frames sent in bursts of 2000 with 20 ms pauses
+
+Reported are the sustained frames/s (sent until stored), the CPU time
+per frame (process CPU minus the sender thread), dropped frames (sent
+but never stored) and the database size per million frames. The sender
+runs in the same process, since the virtual bus does not cross
+processes, so frames/s are lower than on a real interface.
+
+Results are compared with a stored baseline, regressions beyond
+--tolerance are listed and exit with status 1. Frames/s and CPU time
+depend on the machine, so baselines are machine-local (and not
+committed): save one with --save-baseline before comparing, comparing
+without one exits with status 2. No CAN interface is needed:
+
+    python3 -m benchmarks.bench_ingest --save-baseline
+    python3 -m benchmarks.bench_ingest
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import can
+import click
+from can.interfaces import virtual
+
+from can_logger.__main__ import async_main
+from can_logger.database import CANMessageDatabase
+from can_logger.receive import DEFAULT_MAX_FRAMES
+from can_logger.sniffer import CanSniffer
+
+PATHS = ("sniffer", "async", "database")
+PATTERNS = ("mixed", "fd", "many-ids", "burst")
+
+FD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+BURST_SIZE = 2_000
+BURST_PAUSE = 0.02
+
+# Time for a logger to subscribe its callbacks after opening the bus
+START_DELAY = 0.5
+# A run ends once nothing was stored for this long after the last send
+STALL_TIMEOUT = 2.0
+POLL_INTERVAL = 0.01
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+DEFAULT_TOLERANCE = 0.2
+# Compared metrics, True if higher is better
+COMPARED_METRICS = {"fps": True, "cpu_us": False, "mb_per_million": False}
+
+
+def traffic(pattern: str, count: int) -> list[can.Message]:
+    rng = random.Random(0)
+    ids = [(rng.randrange(1 << 29), True) for _ in range(2048)]
+    ids += [(rng.randrange(1 << 11), False) for _ in range(2048)]
+
+    frames = []
+    for _ in range(count):
+        if pattern == "fd":
+            frames.append(
+                can.Message(
+                    arbitration_id=0x100 + rng.randrange(64),
+                    is_extended_id=False,
+                    is_fd=True,
+                    bitrate_switch=True,
+                    data=rng.randbytes(rng.choice(FD_LENGTHS)),
+                )
+            )
+        elif pattern == "many-ids":
+            arbitration_id, is_extended_id = rng.choice(ids)
+            frames.append(
+                can.Message(
+                    arbitration_id=arbitration_id,
+                    is_extended_id=is_extended_id,
+                    data=rng.randbytes(8),
+                )
+            )
+        else:
+            frames.append(
+                can.Message(
+                    arbitration_id=0x100 + rng.randrange(64),
+                    is_extended_id=False,
+                    data=rng.randbytes(rng.randrange(9)),
+                )
+            )
+    return frames
+
+
+def _send(
+    channel: str, frames: list[can.Message], burst: bool, cpu: list[float]
+) -> None:
+    bus = can.Bus(channel=channel, interface="virtual")
+    start = time.thread_time()
+    try:
+        for i, msg in enumerate(frames, 1):
+            bus.send(msg)
+            if burst and i % BURST_SIZE == 0:
+                time.sleep(BURST_PAUSE)
+    finally:
+        cpu.append(time.thread_time() - start)
+        bus.shutdown()
+
+
+def _stored(db_path: Path) -> int:
+    try:
+        with contextlib.closing(
+            sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        ) as conn:
+            return conn.execute(
+                "SELECT coalesce(max(id), 0) FROM can_messages"
+            ).fetchone()[0]
+    except sqlite3.Error:
+        return 0
+
+
+def _wait_for_receiver(channel: str) -> None:
+    while not virtual.channels.get(channel):
+        time.sleep(POLL_INTERVAL)
+    time.sleep(START_DELAY)
+
+
+def _drive(
+    channel: str, db_path: Path, frames: list[can.Message], burst: bool
+) -> dict:
+    """Sends the frames and waits until they are stored or stall."""
+    sender_cpu: list[float] = []
+    sender = threading.Thread(
+        target=_send, args=(channel, frames, burst, sender_cpu)
+    )
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    sender.start()
+
+    stored, last_change = 0, start
+    while stored < len(frames):
+        time.sleep(POLL_INTERVAL)
+        now = time.perf_counter()
+        current = _stored(db_path)
+        if current != stored:
+            stored, last_change = current, now
+        elif not sender.is_alive() and now - last_change > STALL_TIMEOUT:
+            break
+    sender.join()
+    cpu = time.process_time() - cpu_start - sender_cpu[0]
+    return {"stored": stored, "seconds": last_change - start, "cpu": cpu}
+
+
+def _run_sniffer(
+    channel: str, db_path: Path, frames: list[can.Message], burst: bool
+) -> dict:
+    sniffer = CanSniffer(channel, bustype="virtual", db_path=db_path)
+    sniffer.connect()
+    thread = threading.Thread(target=sniffer.sniff_db)
+    thread.start()
+    try:
+        _wait_for_receiver(channel)
+        return _drive(channel, db_path, frames, burst)
+    finally:
+        sniffer.shutdown()
+        thread.join()
+
+
+def _run_async(
+    channel: str, db_path: Path, frames: list[can.Message], burst: bool
+) -> dict:
+    started = threading.Event()
+    state = {}
+
+    async def run_logger():
+        state["loop"] = asyncio.get_running_loop()
+        state["task"] = asyncio.current_task()
+        started.set()
+        with contextlib.suppress(asyncio.CancelledError):
+            await async_main([channel], db_path, bustype="virtual")
+
+    thread = threading.Thread(target=asyncio.run, args=(run_logger(),))
+    thread.start()
+    try:
+        started.wait()
+        _wait_for_receiver(channel)
+        return _drive(channel, db_path, frames, burst)
+    finally:
+        # Cancelling runs the shutdown path of async_main
+        state["loop"].call_soon_threadsafe(state["task"].cancel)
+        thread.join()
+
+
+def _run_database(
+    channel: str, db_path: Path, frames: list[can.Message], burst: bool
+) -> dict:
+    async def write():
+        db = CANMessageDatabase(db_path)
+        await db.connect()
+        for i in range(0, len(frames), DEFAULT_MAX_FRAMES):
+            await db.add_messages(frames[i : i + DEFAULT_MAX_FRAMES])
+        await db.disconnect()
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    asyncio.run(write())
+    return {
+        "stored": _stored(db_path),
+        "seconds": time.perf_counter() - start,
+        "cpu": time.process_time() - cpu_start,
+    }
+
+
+RUNNERS = {
+    "sniffer": _run_sniffer,
+    "async": _run_async,
+    "database": _run_database,
+}
+
+
+def _database_size(db_path: Path) -> int:
+    paths = (db_path, db_path.with_name(db_path.name + "-wal"))
+    return sum(path.stat().st_size for path in paths if path.exists())
+
+
+def run(path: str, pattern: str, count: int) -> dict:
+    frames = traffic(pattern, count)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        # Loggers print every frame, which is part of what is measured
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+            devnull
+        ):
+            result = RUNNERS[path](
+                f"bench-{path}-{pattern}", db_path, frames, pattern == "burst"
+            )
+        size = _database_size(db_path)
+
+    stored = result["stored"]
+    return {
+        "frames": stored,
+        "dropped": count - stored,
+        "fps": stored / result["seconds"] if result["seconds"] else 0.0,
+        "cpu_us": result["cpu"] / stored * 1e6 if stored else 0.0,
+        # Bytes per frame are MB per million frames
+        "mb_per_million": size / stored if stored else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lists the metrics that got worse than the baseline by tolerance."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not base[metric]:
+                continue
+            change = result[metric] / base[metric] - 1
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(
+                    f"{name}: {metric} {base[metric]:.1f} ->"
+                    f" {result[metric]:.1f} ({change:+.0%})"
+                )
+        if result["dropped"] > base["dropped"]:
+            regressions.append(
+                f"{name}: dropped {base['dropped']} -> {result['dropped']}"
+            )
+    return regressions
+
+
+@click.command()
+@click.option("-n", "--count", default=50_000, show_default=True)
+@click.option(
+    "--path",
+    "paths",
+    type=click.Choice(PATHS),
+    multiple=True,
+    help="Ingestion path to run, repeatable. All by default.",
+)
+@click.option(
+    "--pattern",
+    "patterns",
+    type=click.Choice(PATTERNS),
+    multiple=True,
+    help="Traffic pattern to run, repeatable. All by default.",
+)
+@click.option(
+    "--baseline",
+    "baseline_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=DEFAULT_BASELINE,
+    show_default=True,
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Store the results as the new baseline.",
+)
+@click.option(
+    "--tolerance",
+    default=DEFAULT_TOLERANCE,
+    show_default=True,
+    help="Relative change of a metric reported as a regression.",
+)
+def main(count, paths, patterns, baseline_path, save_baseline, tolerance):
+    print(
+        f"{'path/pattern':<20}{'frames':>9}{'dropped':>9}{'frames/s':>10}"
+        f"{'cpu us/frame':>14}{'MB/1M frames':>14}"
+    )
+    results = {}
+    for path in paths or PATHS:
+        for pattern in patterns or PATTERNS:
+            if path == "database" and pattern == "burst":
+                # Without a bus there are no pauses, same as "mixed"
+                continue
+            name = f"{path}/{pattern}"
+            result = results[name] = run(path, pattern, count)
+            print(
+                f"{name:<20}{result['frames']:>9}{result['dropped']:>9}"
+                f"{result['fps']:>10.0f}{result['cpu_us']:>14.1f}"
+                f"{result['mb_per_million']:>14.1f}"
+            )
+
+    if save_baseline:
+        baseline = {"count": count, "results": results}
+        if baseline_path.exists():
+            # Keep the baseline of paths and patterns that were not run
+            stored = json.loads(baseline_path.read_text())
+            baseline["results"] = {**stored["results"], **results}
+        baseline_path.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline saved to {baseline_path}")
+        return
+
+    if not baseline_path.exists():
+        raise click.UsageError(
+            f"No baseline at {baseline_path}. Baselines are machine-local,"
+            " store one on this machine with --save-baseline first."
+        )
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline["count"] != count:
+        print(f"Note: the baseline was measured with -n {baseline['count']}")
+    regressions = compare(results, baseline["results"], tolerance)
+    if regressions:
+        print(f"Regressions (tolerance {tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares the CANInterface receive modes ("reader" vs "executor").
+
+A separate process floods the interface with frames while CANInterface
+receives them in one of the modes. Reported are sustained frames/s and the
+latency from the kernel receive timestamp to the moment the frame reaches
+a receive callback.
+
+Requires a (v)can interface, see README:
+
+    python3 -m benchmarks.bench_receive_modes -i vcan0 -n 100000
+"""
+
+import asyncio
+import contextlib
+import multiprocessing
+import statistics
+import time
+
+import can
+import click
+
+from can_logger.can_interface import CANInterface
+
+
+def _send_frames(interface: str, count: int, start_delay: float) -> None:
+    bus = can.Bus(channel=interface, interface="socketcan", fd=True)
+    time.sleep(start_delay)
+    message = can.Message(arbitration_id=0x123, data=bytes(8))
+    try:
+        for i in range(count):
+            message.data[0] = i & 0xFF
+            while True:
+                try:
+                    bus.send(message)
+                    break
+                except can.CanOperationError:
+                    # TX queue full, let the kernel catch up
+                    time.sleep(0.0001)
+    finally:
+        bus.shutdown()
+
+
+async def _run_mode(interface: str, count: int, mode: str) -> dict:
+    latencies: list[float] = []
+    done = asyncio.Event()
+
+    async def on_batch(batch):
+        now = time.time()
+        latencies.extend(now - msg.timestamp for msg in batch)
+        if len(latencies) >= count:
+            done.set()
+
+    iface = CANInterface(interface, receive_mode=mode)
+    iface.add_receive_callback(on_batch, batch=True, block=True)
+    await iface.connect()
+    if not iface.running:
+        raise click.ClickException(f"Cannot open interface {interface}")
+
+    sender = multiprocessing.Process(
+        target=_send_frames, args=(interface, count, 0.5)
+    )
+    sender.start()
+
+    async def drain():
+        # receive_frame() consumers are what async_main runs as well
+        while not done.is_set():
+            await iface.receive_frame(timeout=0.1)
+
+    start = time.perf_counter()
+    drain_task = asyncio.create_task(drain())
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(done.wait(), timeout=count / 1000 + 30)
+    elapsed = time.perf_counter() - start - 0.5
+    drain_task.cancel()
+    await iface.disconnect()
+    sender.join()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "mode": mode,
+        "received": len(latencies),
+        "fps": len(latencies) / elapsed,
+        "p50_us": quantiles[49] * 1e6,
+        "p99_us": quantiles[98] * 1e6,
+        "max_us": max(latencies) * 1e6,
+    }
+
+
+@click.command()
+@click.option("-i", "--interface", default="vcan0", show_default=True)
+@click.option("-n", "--count", default=100_000, show_default=True)
+def main(interface, count):
+    print(
+        f"{'mode':<10}{'received':>10}{'frames/s':>12}"
+        f"{'p50 us':>10}{'p99 us':>10}{'max us':>10}"
+    )
+    for mode in ("executor", "reader"):
+        result = asyncio.run(_run_mode(interface, count, mode))
+        print(
+            f"{result['mode']:<10}{result['received']:>10}"
+            f"{result['fps']:>12.0f}{result['p50_us']:>10.0f}"
+            f"{result['p99_us']:>10.0f}{result['max_us']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
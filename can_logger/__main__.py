@@ -2,45 +2,148 @@ import asyncio
 
 import click
 
-from can_logger.callbacks import format_message
-from can_logger.can_interface import CANInterface
-from can_logger.database import CANMessageDatabase
-
-
-async def async_main(interface, db_path):
-    can_interface = CANInterface(interface)
-    db_interface = CANMessageDatabase(db_path)
-
-    await can_interface.connect()
-    await db_interface.connect()
+from can_logger.can_interface import RECEIVE_MODES, CANInterface
+from can_logger.capture import CaptureEngine
+from can_logger.change_only import DEFAULT_KEYFRAME_INTERVAL
+from can_logger.database import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_PRAGMA_PROFILE,
+    PRAGMA_PROFILES,
+)
+from can_logger.decoding import SignalDecoder
+from can_logger.dispatch import Dispatcher
+from can_logger.filters import CAN_FILTER
+from can_logger.latency import DEFAULT_LATENCY_INTERVAL, LatencyRecorder
+from can_logger.metrics import (
+    DEFAULT_BITRATE,
+    DEFAULT_DATA_BITRATE,
+    DEFAULT_METRICS_INTERVAL,
+    BusMetrics,
+    MetricsExporter,
+)
+from can_logger.receive import DEFAULT_MAX_FRAMES
+from can_logger.segments import DEFAULT_SEGMENTS_PATH
+from can_logger.sharding import SHARD_PERIODS
+from can_logger.sinks import DEFAULT_BINARY_PATH, SINK_TYPES, create_sinks
+from can_logger.top import DEFAULT_REFRESH_INTERVAL
 
-    async def message_printer(message):
-        print(format_message(message))
+DEFAULT_SINKS = ("console", "sqlite")
 
-    async def db_message_handler(message):
-        await db_interface.add_message(message)
 
-    can_interface.add_receive_callback(message_printer)
-    can_interface.add_receive_callback(db_message_handler)
+async def async_main(
+    interfaces,
+    db_path,
+    batch_size=DEFAULT_BATCH_SIZE,
+    flush_interval=DEFAULT_FLUSH_INTERVAL,
+    pragma_profile=DEFAULT_PRAGMA_PROFILE,
+    checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+    receive_mode="auto",
+    recv_batch_size=DEFAULT_MAX_FRAMES,
+    shard_period=None,
+    dbc_path=None,
+    store_signals=False,
+    metrics_port=None,
+    metrics_file=None,
+    metrics_interval=DEFAULT_METRICS_INTERVAL,
+    bitrate=DEFAULT_BITRATE,
+    data_bitrate=DEFAULT_DATA_BITRATE,
+    latency=False,
+    latency_interval=DEFAULT_LATENCY_INTERVAL,
+    bustype="socketcan",
+    sinks=DEFAULT_SINKS,
+    binary_path=DEFAULT_BINARY_PATH,
+    refresh_interval=DEFAULT_REFRESH_INTERVAL,
+    can_filters=None,
+    change_only=False,
+    keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+    segments_path=DEFAULT_SEGMENTS_PATH,
+):
+    decoder = SignalDecoder.from_file(dbc_path) if dbc_path else None
+    metrics = {}
+    exporter = None
+    if metrics_port is not None or metrics_file:
+        metrics = {
+            interface: BusMetrics(interface, bitrate, data_bitrate)
+            for interface in interfaces
+        }
+        exporter = MetricsExporter(
+            list(metrics.values()),
+            metrics_interval,
+            metrics_port,
+            metrics_file,
+        )
+    recorder = LatencyRecorder(latency_interval) if latency else None
+    # One receive task per interface, all feeding the same sinks
+    dispatcher = Dispatcher()
+    can_interfaces = [
+        CANInterface(
+            interface,
+            bustype=bustype,
+            receive_mode=receive_mode,
+            max_frames=recv_batch_size,
+            metrics=metrics.get(interface),
+            latency=recorder,
+            queue_frames=False,
+            can_filters=can_filters,
+            dispatcher=dispatcher,
+        )
+        for interface in interfaces
+    ]
+    engine = CaptureEngine(
+        can_interfaces,
+        create_sinks(
+            sinks,
+            db_path,
+            binary_path,
+            decoder,
+            title=", ".join(interfaces),
+            refresh_interval=refresh_interval,
+            segments_path=segments_path,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            pragma_profile=pragma_profile,
+            checkpoint_interval=checkpoint_interval,
+            shard_period=shard_period,
+            change_only=change_only,
+            keyframe_interval=keyframe_interval,
+            dbc_path=dbc_path if store_signals else None,
+            latency=recorder,
+        ),
+    )
 
+    if exporter is not None:
+        exporter.start()
+    if recorder is not None:
+        recorder.start()
     try:
-        while can_interface.running:
-            await can_interface.receive_frame(timeout=1.0)
-
-    except KeyboardInterrupt:
-        print("Interrupted by user")
+        await engine.run()
     finally:
-        await can_interface.disconnect()
-        await db_interface.disconnect()
+        if exporter is not None:
+            exporter.stop()
+        if recorder is not None:
+            recorder.stop()
 
 
 @click.command()
 @click.option(
     "-i",
     "--interface",
+    "interfaces",
     required=True,
     type=str,
-    help="CAN interface name (e.g., vcan0, can0).",
+    multiple=True,
+    help="CAN interface name (e.g., vcan0, can0), repeatable. Frames of"
+    " all interfaces go to the same sinks with their channel.",
+)
+@click.option(
+    "-b",
+    "--bustype",
+    default="socketcan",
+    show_default=True,
+    type=str,
+    help="python-can bus type.",
 )
 @click.option(
     "-d",
@@ -49,8 +152,239 @@ async def async_main(interface, db_path):
     default="can_messages.db",
     help="Path to SQLite database file for saving messages.",
 )
-def main(interface, db_path):
-    asyncio.run(async_main(interface, db_path))
+@click.option(
+    "--filter",
+    "can_filters",
+    type=CAN_FILTER,
+    multiple=True,
+    help="Only receive frames matching ID:MASK (hex, candump syntax),"
+    " repeatable. IDs with more than 3 digits are extended. Applied in"
+    " the kernel on socketcan.",
+)
+@click.option(
+    "--sink",
+    "sinks",
+    type=click.Choice(SINK_TYPES, case_sensitive=False),
+    multiple=True,
+    default=DEFAULT_SINKS,
+    show_default=True,
+    help="Where captured frames go, repeatable. Every sink has its own"
+    " queue, a slow console never holds up the database.",
+)
+@click.option(
+    "--binary-path",
+    type=str,
+    default=DEFAULT_BINARY_PATH,
+    show_default=True,
+    help="File written by the binary sink.",
+)
+@click.option(
+    "--segments-path",
+    type=str,
+    default=DEFAULT_SEGMENTS_PATH,
+    show_default=True,
+    help="Directory of the segment files written by the segments sink.",
+)
+@click.option(
+    "--refresh-interval",
+    type=float,
+    default=DEFAULT_REFRESH_INTERVAL,
+    show_default=True,
+    help="Seconds between redraws of the top sink's live table.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    help="Number of frames committed to the database in one transaction.",
+)
+@click.option(
+    "--flush-interval",
+    type=float,
+    default=DEFAULT_FLUSH_INTERVAL,
+    show_default=True,
+    help="Maximum time in seconds between database commits.",
+)
+@click.option(
+    "--pragma-profile",
+    type=click.Choice(list(PRAGMA_PROFILES), case_sensitive=False),
+    default=DEFAULT_PRAGMA_PROFILE,
+    show_default=True,
+    help="SQLite tuning profile (synchronous, cache, mmap, autocheckpoint).",
+)
+@click.option(
+    "--checkpoint-interval",
+    type=float,
+    default=DEFAULT_CHECKPOINT_INTERVAL,
+    show_default=True,
+    help="Seconds between background WAL checkpoints (0 disables them and"
+    " leaves checkpoints to SQLite).",
+)
+@click.option(
+    "--receive-mode",
+    type=click.Choice(RECEIVE_MODES, case_sensitive=False),
+    default="auto",
+    show_default=True,
+    help="'reader' reads the socketcan socket on event loop readiness,"
+    " 'executor' polls bus.recv() in a worker thread.",
+)
+@click.option(
+    "--recv-batch-size",
+    type=int,
+    default=DEFAULT_MAX_FRAMES,
+    show_default=True,
+    help="Maximum number of queued frames drained per receive wakeup.",
+)
+@click.option(
+    "--shard",
+    "shard_period",
+    type=click.Choice(list(SHARD_PERIODS), case_sensitive=False),
+    default=None,
+    help="Write hourly or daily shard files plus a manifest next to"
+    " --db-path instead of a single database.",
+)
+@click.option(
+    "--change-only",
+    is_flag=True,
+    default=False,
+    help="Only store frames whose payload differs from the last stored"
+    " one of their ID. Dropped repeats are counted so database_tools"
+    " --expand can restore them.",
+)
+@click.option(
+    "--keyframe-interval",
+    type=float,
+    default=DEFAULT_KEYFRAME_INTERVAL,
+    show_default=True,
+    help="With --change-only, store every ID at least this often (s).",
+)
+@click.option(
+    "--dbc",
+    "dbc_path",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="DBC file used to print the decoded signals of every frame.",
+)
+@click.option(
+    "--signals",
+    "store_signals",
+    is_flag=True,
+    default=False,
+    help="Also store the signals decoded with --dbc in the signals table.",
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics.",
+)
+@click.option(
+    "--metrics-file",
+    type=str,
+    default=None,
+    help="Periodically write the Prometheus metrics to this file.",
+)
+@click.option(
+    "--metrics-interval",
+    type=float,
+    default=DEFAULT_METRICS_INTERVAL,
+    show_default=True,
+    help="Seconds between metrics updates.",
+)
+@click.option(
+    "--bitrate",
+    type=int,
+    default=DEFAULT_BITRATE,
+    show_default=True,
+    help="Nominal bitrate of the bus, used to estimate the bus load.",
+)
+@click.option(
+    "--data-bitrate",
+    type=int,
+    default=DEFAULT_DATA_BITRATE,
+    show_default=True,
+    help="CAN-FD data phase bitrate, used to estimate the bus load.",
+)
+@click.option(
+    "--latency",
+    is_flag=True,
+    default=False,
+    help="Record per-stage latency histograms from the kernel timestamp to"
+    " the commit and report their percentiles to stderr.",
+)
+@click.option(
+    "--latency-interval",
+    type=float,
+    default=DEFAULT_LATENCY_INTERVAL,
+    show_default=True,
+    help="Seconds between latency reports (0 only reports on exit).",
+)
+def main(
+    interfaces,
+    bustype,
+    db_path,
+    can_filters,
+    sinks,
+    binary_path,
+    segments_path,
+    refresh_interval,
+    batch_size,
+    flush_interval,
+    pragma_profile,
+    checkpoint_interval,
+    receive_mode,
+    recv_batch_size,
+    shard_period,
+    change_only,
+    keyframe_interval,
+    dbc_path,
+    store_signals,
+    metrics_port,
+    metrics_file,
+    metrics_interval,
+    bitrate,
+    data_bitrate,
+    latency,
+    latency_interval,
+):
+    if store_signals and not dbc_path:
+        raise click.UsageError("--signals requires --dbc.")
+    try:
+        asyncio.run(
+            async_main(
+                list(dict.fromkeys(interfaces)),
+                db_path,
+                batch_size,
+                flush_interval,
+                pragma_profile,
+                checkpoint_interval,
+                receive_mode,
+                recv_batch_size,
+                shard_period,
+                dbc_path,
+                store_signals,
+                metrics_port,
+                metrics_file,
+                metrics_interval,
+                bitrate,
+                data_bitrate,
+                latency,
+                latency_interval,
+                bustype,
+                sinks,
+                binary_path,
+                refresh_interval,
+                list(can_filters),
+                change_only,
+                keyframe_interval,
+                segments_path,
+            )
+        )
+    except KeyboardInterrupt:
+        print("Interrupted by user")
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
 
 
 if __name__ == "__main__":
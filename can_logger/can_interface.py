@@ -3,30 +3,112 @@ from typing import Iterable, Optional
 
 import can
 
-from can_logger.callbacks import AsyncCanMessageCallback
+from can_logger.callbacks import AsyncCanBatchCallback, AsyncCanMessageCallback
+from can_logger.dispatch import Dispatcher, Subscriber
+from can_logger.latency import LatencyRecorder
+from can_logger.metrics import BusMetrics
+from can_logger.receive import (
+    DEFAULT_MAX_FRAMES,
+    is_socketcan_bus,
+    read_frames,
+    recv_bulk,
+)
+
+RECEIVE_MODES = ("auto", "reader", "executor")
 
 
 class CANInterface:
-    def __init__(self, channel, fd_enabled: bool = True):
+    def __init__(
+        self,
+        channel,
+        fd_enabled: bool = True,
+        bustype: str = "socketcan",
+        receive_mode: str = "auto",
+        max_frames: int = DEFAULT_MAX_FRAMES,
+        metrics: BusMetrics | None = None,
+        latency: LatencyRecorder | None = None,
+        queue_frames: bool = True,
+        bus: can.BusABC | None = None,
+        can_filters: can.typechecking.CanFilters | None = None,
+        dispatcher: Dispatcher | None = None,
+    ):
+        """
+        Args:
+            channel: CAN interface name (e.g. vcan0)
+            fd_enabled: Open the bus in CAN-FD mode
+            bustype: python-can interface type
+            receive_mode: "reader" registers the socketcan socket with the
+                event loop and parses frames on readiness, "executor" polls
+                bus.recv() in a worker thread. "auto" picks "reader"
+                whenever the bus is a socketcan bus.
+            max_frames: Maximum number of frames drained per wakeup
+            metrics: Receive counters updated with every batch
+            latency: Records the receive latency of every frame
+            queue_frames: Also queue every frame for receive_frame(). Off
+                when frames are only consumed by receive callbacks.
+            bus: Bus opened by the caller to receive from, instead of
+                opening one in connect(). It is still shut down by
+                disconnect().
+            can_filters: python-can filters, see filters.parse_can_filter.
+                On socketcan they are installed in the kernel, so other
+                frames never reach Python.
+            dispatcher: Dispatcher shared with other interfaces, so its
+                subscribers get the frames of all of them. It is closed
+                by its owner, not by disconnect().
+        """
+        if receive_mode not in RECEIVE_MODES:
+            raise ValueError(f"Unknown receive mode: {receive_mode}")
+
         self.channel: str = channel
         self.fd_enabled: bool = fd_enabled
+        self.bustype: str = bustype
+        self.receive_mode: str = receive_mode
+        self.max_frames: int = max_frames
+        self.metrics: BusMetrics | None = metrics
+        self.latency: LatencyRecorder | None = latency
+        self.queue_frames: bool = queue_frames
+        self.opened_bus: can.BusABC | None = bus
+        self.can_filters: can.typechecking.CanFilters | None = can_filters
 
         self.bus: Optional[can.interface.Bus] = None
         self.message_queue: Iterable[can.Message] = asyncio.Queue()
         self.running: bool = False
 
-        self.receive_callbacks: list[AsyncCanMessageCallback] = []
+        self.receive_callbacks: list[
+            AsyncCanMessageCallback | AsyncCanBatchCallback
+        ] = []
+        self.owns_dispatcher: bool = dispatcher is None
+        self.dispatcher: Dispatcher = (
+            Dispatcher() if dispatcher is None else dispatcher
+        )
 
     async def connect(self) -> None:
         try:
-            self.bus = can.Bus(
-                channel=self.channel,
-                interface="socketcan",
-                fd=self.fd_enabled,
-            )
+            if self.opened_bus is not None:
+                self.bus = self.opened_bus
+            else:
+                kwargs = {}
+                if self.can_filters:
+                    kwargs["can_filters"] = self.can_filters
+                self.bus = can.Bus(
+                    channel=self.channel,
+                    interface=self.bustype,
+                    fd=self.fd_enabled,
+                    **kwargs,
+                )
+
+            if self.receive_mode == "auto":
+                self.receive_mode = (
+                    "reader" if is_socketcan_bus(self.bus) else "executor"
+                )
 
             self.running = True
-            self.receive_task = asyncio.create_task(self._receive_loop())
+            if self.receive_mode == "reader":
+                self.receive_task = asyncio.create_task(
+                    self._reader_receive_loop()
+                )
+            else:
+                self.receive_task = asyncio.create_task(self._receive_loop())
 
         except Exception:
             self.running = False
@@ -36,37 +118,72 @@ class CANInterface:
 
     async def receive_frame(self, timeout=None) -> can.Message | None:
         try:
-            message: can.Message
-            if timeout is not None:
-                message = await asyncio.wait_for(
-                    self.message_queue.get(), timeout
-                )
-            else:
-                message = await self.message_queue.get()
+            # Unlike wait_for() on Python 3.11, timeout() never swallows a
+            # cancellation that races with a frame arriving
+            async with asyncio.timeout(timeout):
+                message: can.Message = await self.message_queue.get()
 
             self.message_queue.task_done()
             return message
         except asyncio.TimeoutError:
             return None
 
+    async def _handle_messages(self, messages: list[can.Message]) -> None:
+        if self.latency is not None:
+            self.latency.record_messages("receive", messages)
+        if self.metrics is not None:
+            self.metrics.update(messages)
+        if self.queue_frames:
+            for message in messages:
+                self.message_queue.put_nowait(message)
+        await self.dispatcher.publish(messages)
+
+    async def _reader_receive_loop(self) -> None:
+        """
+        Receives frames straight from the socketcan socket.
+
+        The socket is registered with the event loop and the loop only
+        wakes this task when a frame is ready, so there is no thread hop
+        and no polling timeout. Every wakeup drains all queued frames (up
+        to max_frames) at once. While the task is busy publishing, frames
+        wait in the kernel socket buffer.
+        """
+        loop = asyncio.get_running_loop()
+        sock = self.bus.socket
+        readable = asyncio.Event()
+        loop.add_reader(sock.fileno(), readable.set)
+
+        try:
+            while self.running:
+                await readable.wait()
+                readable.clear()
+                try:
+                    messages = read_frames(sock, self.max_frames, self.channel)
+                except OSError:
+                    # await logger.error(f"Error in receive loop: {str(e)}")
+                    await asyncio.sleep(0.1)
+                    continue
+
+                if messages:
+                    await self._handle_messages(messages)
+
+        except asyncio.CancelledError:
+            pass
+
+        finally:
+            loop.remove_reader(sock.fileno())
+
     async def _receive_loop(self) -> None:
-        """Background task that continuously receives CAN frames."""
+        """Background task that receives CAN frames in a worker thread."""
         loop = asyncio.get_running_loop()
 
         while self.running:
             try:
-                message: can.Message = await loop.run_in_executor(
-                    None, self.bus.recv, 0.1
+                messages: list[can.Message] = await loop.run_in_executor(
+                    None, recv_bulk, self.bus, 0.1, self.max_frames
                 )
-                if message is not None:
-                    await self.message_queue.put(message)
-
-                    for callback in self.receive_callbacks:
-                        try:
-                            asyncio.create_task(callback(message))
-                        except Exception:
-                            # await logger.error(f"Error in receive callback: {str(e)}")
-                            raise
+                if messages:
+                    await self._handle_messages(messages)
 
             except asyncio.CancelledError:
                 break
@@ -75,19 +192,32 @@ class CANInterface:
                 # await logger.error(f"Error in receive loop: {str(e)}")
                 await asyncio.sleep(0.1)
 
-    def add_receive_callback(self, callback) -> None:
+    def add_receive_callback(
+        self, callback, batch: bool = False, **kwargs
+    ) -> Subscriber:
         """
         Add a callback to be called when a frame is received.
 
+        Every callback gets its own bounded queue and consumer task, so a
+        slow callback never delays the others or the receive loop.
+
         Args:
-            callback: Async function to call with CANMessage parameter
+            callback: Async function to call with CANMessage parameter,
+                or with a list of messages if batch is True
+            batch: Deliver frames in ordered batches instead of one by one
+            **kwargs: queue_size, max_batch and block, see Subscriber
+
+        Returns:
+            The Subscriber, e.g. to read its dropped frame count
         """
         self.receive_callbacks.append(callback)
+        return self.dispatcher.subscribe(callback, batch=batch, **kwargs)
 
     def remove_receive_callback(self, callback) -> None:
         """Remove a receive callback."""
         if callback in self.receive_callbacks:
             self.receive_callbacks.remove(callback)
+            self.dispatcher.unsubscribe(callback)
 
     async def disconnect(self):
         if not self.running:
@@ -101,6 +231,10 @@ class CANInterface:
             except asyncio.CancelledError:
                 self.receive_task = None
 
+        # Deliver frames still queued for the callbacks
+        if self.owns_dispatcher:
+            await self.dispatcher.close()
+
         # Close the bus
         if self.bus is not None:
             self.bus.shutdown()
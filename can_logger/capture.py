@@ -0,0 +1,106 @@
+import asyncio
+import sys
+
+from can_logger.can_interface import CANInterface
+from can_logger.dispatch import Dispatcher, Subscriber
+from can_logger.sinks import Sink
+
+
+class CaptureEngine:
+    """
+    Receives frames from one or more CANInterfaces and fans them out to
+    sinks.
+
+    Both loggers run on it. Every sink is a dispatcher subscriber with
+    its own batch queue and consumer task, so a sink that falls behind
+    (e.g. console output to a slow terminal) only drops its own frames
+    and never delays the receive loop or database ingestion. Sinks that
+    must not lose frames (block set) apply backpressure instead.
+
+    Several interfaces must share one Dispatcher (see CANInterface).
+    Each runs its own receive task, all of them feed the same sink
+    queues, so e.g. a single database writer commits the frames of every
+    bus together.
+    """
+
+    def __init__(self, can_interfaces: list[CANInterface], sinks: list[Sink]):
+        if len({id(i.dispatcher) for i in can_interfaces}) != 1:
+            raise ValueError("The CAN interfaces must share one dispatcher.")
+        self.can_interfaces: list[CANInterface] = can_interfaces
+        self.sinks: list[Sink] = sinks
+        self.dispatcher: Dispatcher = can_interfaces[0].dispatcher
+        self.subscribers: dict[str, Subscriber] = {}
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+        self._stop_requested: bool = False
+
+    async def start(self) -> None:
+        """Opens the sinks, then the interfaces. Raises if any fails."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+
+        opened = []
+        try:
+            for sink in self.sinks:
+                await sink.open()
+                opened.append(sink)
+        except Exception:
+            await self._close_sinks(opened)
+            raise
+
+        for sink in self.sinks:
+            self.subscribers[sink.name] = self.dispatcher.subscribe(
+                sink.write,
+                batch=True,
+                queue_size=sink.queue_size,
+                block=sink.block,
+            )
+
+        for can_interface in self.can_interfaces:
+            await can_interface.connect()
+            if not can_interface.running:
+                await self._disconnect()
+                await self._close_sinks(self.sinks)
+                raise RuntimeError(
+                    f"Cannot open CAN interface {can_interface.channel}"
+                )
+
+    def stop(self) -> None:
+        """Ends run(). Safe to call from other threads and signal handlers."""
+        self._stop_requested = True
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def run(self) -> None:
+        """Captures until stop() is called or the task is cancelled."""
+        await self.start()
+        try:
+            if not self._stop_requested:
+                await self._stopped.wait()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Stops receiving, delivers queued frames and closes the sinks."""
+        await self._disconnect()
+        for name, subscriber in self.subscribers.items():
+            if subscriber.dropped:
+                print(
+                    f"{name}: {subscriber.dropped} frames dropped",
+                    file=sys.stderr,
+                )
+        await self._close_sinks(self.sinks)
+
+    async def _disconnect(self) -> None:
+        for can_interface in self.can_interfaces:
+            await can_interface.disconnect()
+        # Delivers the frames still queued for the sinks
+        await self.dispatcher.close()
+
+    async def _close_sinks(self, sinks: list[Sink]) -> None:
+        for sink in sinks:
+            try:
+                await sink.close()
+            except Exception as e:
+                print(f"Error closing {sink.name} sink: {e}", file=sys.stderr)
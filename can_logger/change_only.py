@@ -0,0 +1,100 @@
+DEFAULT_KEYFRAME_INTERVAL = 1.0
+
+# One row per run of identical frames that were not stored: the stored
+# frame they repeat (timestamp, ID, channel), how many followed it and
+# when the last of them was received. Frames without a channel have an
+# empty one here, NULLs would never collide in the key.
+CREATE_REPEATS_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS frame_repeats (
+        timestamp_ns INTEGER,
+        arbitration_id INTEGER,
+        is_extended_id INTEGER,
+        channel TEXT NOT NULL DEFAULT '',
+        count INTEGER,
+        last_timestamp_ns INTEGER,
+        PRIMARY KEY (arbitration_id, is_extended_id, channel, timestamp_ns)
+    ) WITHOUT ROWID
+    """
+
+INSERT_REPEATS_QUERY = """
+    INSERT OR REPLACE INTO frame_repeats (
+        timestamp_ns, arbitration_id, is_extended_id, channel, count,
+        last_timestamp_ns
+    )
+    VALUES (?, ?, ?, ?, ?, ?)
+    """
+
+SUPPRESSED_COUNTS_QUERY = """
+    SELECT arbitration_id, is_extended_id, sum(count)
+    FROM frame_repeats
+    GROUP BY arbitration_id, is_extended_id
+    """
+
+
+class ChangeFilter:
+    """
+    Drops can_messages rows that repeat the last stored payload of their
+    ID.
+
+    A row is stored when its ID is new, its payload (dlc, data, FD and
+    error flags) differs from the last stored one or keyframe_interval
+    seconds have passed since the last stored row of the ID. IDs of
+    different channels are tracked separately. Every run of dropped rows
+    is returned as a frame_repeats row once it ends, so DatabaseInterface
+    can expand the stream again. Costs one dict lookup and a tuple
+    comparison per frame.
+    """
+
+    def __init__(self, keyframe_interval: float = DEFAULT_KEYFRAME_INTERVAL):
+        self.keyframe_ns: int = round(keyframe_interval * 1_000_000_000)
+        # (arbitration_id, is_extended_id, channel) -> [payload, timestamp
+        # of the stored row, rows dropped since, timestamp of the last of
+        # them]
+        self._last: dict[tuple[int, int, str | None], list] = {}
+
+    def filter(self, rows: list[tuple]) -> tuple[list[tuple], list[tuple]]:
+        """Returns the rows to store and the frame_repeats rows of ended runs."""
+        last = self._last
+        keyframe_ns = self.keyframe_ns
+        stored = []
+        repeats = []
+        for row in rows:
+            key = (row[1], row[2], row[7])
+            payload = row[3:7]
+            state = last.get(key)
+            if (
+                state is not None
+                and state[0] == payload
+                and row[0] - state[1] < keyframe_ns
+            ):
+                state[2] += 1
+                state[3] = row[0]
+                continue
+
+            if state is not None and state[2]:
+                repeats.append(self._end_run(key, state))
+            last[key] = [payload, row[0], 0, 0]
+            stored.append(row)
+        return stored, repeats
+
+    def finish(self) -> list[tuple]:
+        """Ends all open runs, returns their frame_repeats rows."""
+        repeats = []
+        for key, state in self._last.items():
+            if state[2]:
+                repeats.append(self._end_run(key, state))
+                state[2] = 0
+        return repeats
+
+    @staticmethod
+    def _end_run(key: tuple, state: list) -> tuple:
+        """Returns the frame_repeats row of a run of dropped rows."""
+        arbitration_id, is_extended_id, channel = key
+        return (
+            state[1],
+            arbitration_id,
+            is_extended_id,
+            "" if channel is None else channel,
+            state[2],
+            state[3],
+        )
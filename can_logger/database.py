@@ -1,62 +1,760 @@
+import asyncio
+import contextlib
+import os
+import sqlite3
+import threading
+import time
 from pathlib import Path
+from typing import Generator
 
 import aiosqlite
 import can
 from aiosqlite import Connection, Cursor
 
+from can_logger.change_only import (
+    CREATE_REPEATS_TABLE_QUERY,
+    DEFAULT_KEYFRAME_INTERVAL,
+    INSERT_REPEATS_QUERY,
+    ChangeFilter,
+)
+from can_logger.latency import LatencyRecorder
+from can_logger.sharding import ShardManifest, group_rows_by_shard
+from can_logger.signals import (
+    ADVANCE_MARK_QUERY,
+    CREATE_SIGNAL_TABLE_QUERIES,
+    INSERT_SIGNAL_NAME_QUERY,
+    INSERT_SIGNAL_QUERY,
+    SELECT_SIGNAL_NAMES_QUERY,
+    SIGNAL_PROGRESS_QUERY,
+    SignalIds,
+    setup_signal_tables,
+    signal_decoder,
+    signal_ids_from_rows,
+    signal_names,
+    signal_rows,
+    warn_if_behind,
+)
 
-class CANMessageDatabase:
-    def __init__(self, db_path: str | Path):
+SCHEMA_VERSION = 3
+# Binary columns, but no channel column yet
+V2_SCHEMA_VERSION = 2
+
+CREATE_TABLE_QUERY = """
+                CREATE TABLE IF NOT EXISTS can_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp_ns INTEGER,
+                    arbitration_id INTEGER,
+                    is_extended_id INTEGER,
+                    dlc INTEGER,
+                    data BLOB,
+                    is_fd INTEGER,
+                    is_error_frame INTEGER,
+                    channel TEXT
+                )
+                """
+
+INSERT_QUERY = """
+            INSERT INTO can_messages (timestamp_ns, arbitration_id, is_extended_id, dlc, data, is_fd, is_error_frame, channel)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """
+
+# Not created by the writers, see create_indexes()
+CREATE_INDEX_QUERIES = (
+    """
+    CREATE INDEX IF NOT EXISTS idx_can_messages_id_ts
+    ON can_messages (arbitration_id, timestamp_ns)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_can_messages_ts
+    ON can_messages (timestamp_ns)
+    """,
+)
+
+# Returns (user_version, can_messages table exists)
+SCHEMA_INFO_QUERY = """
+            SELECT
+                (SELECT user_version FROM pragma_user_version),
+                EXISTS(
+                    SELECT 1 FROM sqlite_master
+                    WHERE type = 'table' AND name = 'can_messages'
+                )
+            """
+
+SET_SCHEMA_VERSION_QUERY = f"PRAGMA user_version = {SCHEMA_VERSION}"
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 0.05
+
+# All profiles use WAL so database_tools can read while the logger writes.
+# "fast" disables automatic checkpoints in the writer entirely and leaves
+# them to WalCheckpointer, so commits never pay for a checkpoint. Without
+# a WalCheckpointer the writer falls back to DEFAULT_WAL_AUTOCHECKPOINT.
+PRAGMA_PROFILES: dict[str, dict[str, str | int]] = {
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8_000,
+        "mmap_size": 0,
+        "wal_autocheckpoint": 1_000,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32_000,
+        "mmap_size": 256 * 1024 * 1024,
+        "wal_autocheckpoint": 1_000,
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -128_000,
+        "mmap_size": 1024 * 1024 * 1024,
+        "wal_autocheckpoint": 0,
+    },
+}
+DEFAULT_PRAGMA_PROFILE = "balanced"
+DEFAULT_WAL_AUTOCHECKPOINT = 1_000
+
+DEFAULT_CHECKPOINT_INTERVAL = 5.0
+
+# Shards kept open by a sharded writer: the current one and its predecessor
+KEEP_OPEN_SHARDS = 2
+DEFAULT_MAX_WAL_SIZE = 64 * 1024 * 1024
+
+
+def pragma_statements(profile: str, checkpointer: bool = True) -> list[str]:
+    """
+    Returns the PRAGMA statements applying the given profile. Without a
+    background checkpointer, automatic checkpoints are never disabled, so
+    the WAL cannot grow without bound.
+    """
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    if not checkpointer and not pragmas["wal_autocheckpoint"]:
+        pragmas["wal_autocheckpoint"] = DEFAULT_WAL_AUTOCHECKPOINT
+    return [f"PRAGMA {name} = {value}" for name, value in pragmas.items()]
+
+
+def create_indexes(db_path: str | Path) -> None:
+    """
+    Builds the query indexes and refreshes the planner statistics.
+
+    Index maintenance would slow down every insert, so this runs on
+    shards that rotated out or through 'database_tools --mode optimize'.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        for query in CREATE_INDEX_QUERIES:
+            conn.execute(query)
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE can_messages")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def create_indexes_in_background(db_path: str | Path) -> threading.Thread:
+    thread = threading.Thread(
+        target=create_indexes, args=(db_path,), name="indexer", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def check_schema_version(version: int, table_exists: bool) -> None:
+    """Refuses to append v3 rows to a table with an older layout."""
+    if table_exists and version < SCHEMA_VERSION:
+        raise RuntimeError(
+            "Database uses an old can_messages layout, migrate it first with"
+            " 'python -m can_logger.database_tools -d <db> --mode migrate'."
+        )
+
+
+def group_by_shard(
+    rows: list[tuple], repeats: list[tuple], period_ns: int
+) -> list[tuple[int, list[tuple], list[tuple]]]:
+    """Splits rows and frame_repeats rows by the shard they belong to."""
+    groups: dict[int, tuple[list[tuple], list[tuple]]] = {}
+    for i, table_rows in enumerate((rows, repeats)):
+        for start, group in group_rows_by_shard(table_rows, period_ns):
+            groups.setdefault(start, ([], []))[i].extend(group)
+    return [(start, *groups[start]) for start in sorted(groups)]
+
+
+def message_to_row(message: can.Message) -> tuple:
+    """Converts a CAN message to a row of the can_messages table."""
+    return (
+        round(message.timestamp * 1_000_000_000),
+        message.arbitration_id,
+        int(message.is_extended_id),
+        message.dlc,
+        bytes(message.data),
+        int(message.is_fd),
+        int(message.is_error_frame),
+        message.channel,
+    )
+
+
+def _next_statement(
+    statements: Generator[tuple, int | None, None], rowcount: int | None
+) -> tuple | None:
+    """Sends rowcount to a _write_statements() generator, None when done."""
+    try:
+        return statements.send(rowcount)
+    except StopIteration:
+        return None
+
+
+class _GroupCommitWriter:
+    """
+    Buffering, change filtering, shard routing and the transactions shared
+    by CANMessageDatabase and SQLiteBatchWriter, which only run the
+    statements on their connection type.
+
+    Messages are buffered and written with a single executemany() and
+    commit() once batch_size messages are pending or flush_interval
+    seconds have passed since the last flush, whichever comes first.
+
+    With shard_period set ("hourly" or "daily") db_path names a manifest
+    and every period is written to its own database file.
+
+    With dbc_path set every batch is also decoded into the signals table
+    in the same transaction, see can_logger.signals.
+
+    With latency set the time from the kernel timestamp to add_messages()
+    ("callback") and to the commit ("commit") is recorded for every frame.
+
+    With change_only set frames repeating the last stored payload of
+    their ID are counted in frame_repeats instead of stored, except for
+    a keyframe every keyframe_interval seconds, see ChangeFilter.
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        pragma_profile: str = DEFAULT_PRAGMA_PROFILE,
+        checkpoint_interval: float | None = DEFAULT_CHECKPOINT_INTERVAL,
+        shard_period: str | None = None,
+        dbc_path: str | Path | None = None,
+        latency: LatencyRecorder | None = None,
+        change_only: bool = False,
+        keyframe_interval: float = DEFAULT_KEYFRAME_INTERVAL,
+    ):
         self.db_path: Path = Path(db_path)
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.pragma_profile: str = pragma_profile
+        self.shard_period: str | None = shard_period
+        self.manifest: ShardManifest | None = None
+        self.checkpointer: WalCheckpointer | None = (
+            WalCheckpointer(self.db_path, checkpoint_interval)
+            if checkpoint_interval
+            else None
+        )
+        self.signal_decoder = signal_decoder(dbc_path) if dbc_path else None
+        self.latency: LatencyRecorder | None = latency
+        self.change_filter: ChangeFilter | None = (
+            ChangeFilter(keyframe_interval) if change_only else None
+        )
+
+        # Shard start -> connection of the subclass
+        self._shards: dict[int, object] = {}
+        self._signal_ids: dict[Path, SignalIds] = {}
+        self._pending: list[tuple] = []
+        self._pending_repeats: list[tuple] = []
+        self._last_flush: float = time.monotonic()
+
+    def _pragma_statements(self) -> list[str]:
+        return pragma_statements(
+            self.pragma_profile, self.checkpointer is not None
+        )
+
+    def _setup_queries(self) -> list[str]:
+        """Creates the tables, run once check_schema_version() passed."""
+        queries = [CREATE_TABLE_QUERY]
+        if self.change_filter is not None:
+            queries.append(CREATE_REPEATS_TABLE_QUERY)
+        return [*queries, SET_SCHEMA_VERSION_QUERY]
+
+    def _open_manifest(self) -> None:
+        """Shard files are opened on the first flush into them."""
+        self.manifest = ShardManifest.open(self.db_path, self.shard_period)
+
+    def _started(self) -> None:
+        self._last_flush = time.monotonic()
+        if self.checkpointer is not None:
+            self.checkpointer.start()
+
+    def _queue_messages(self, messages: list[can.Message]) -> None:
+        if self.latency is not None:
+            self.latency.record_messages("callback", messages)
+        rows = list(map(message_to_row, messages))
+        if self.change_filter is not None:
+            rows, repeats = self.change_filter.filter(rows)
+            self._pending_repeats.extend(repeats)
+        self._pending.extend(rows)
+
+    def _flush_due(self) -> bool:
+        return (
+            len(self._pending) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def _finish_runs(self) -> None:
+        if self.change_filter is not None:
+            self._pending_repeats.extend(self.change_filter.finish())
+
+    def _take_batches(
+        self,
+    ) -> list[tuple[int | None, list[tuple], list[tuple]]]:
+        """
+        Empties the pending lists. Returns (shard start, rows, repeats)
+        per file to write, the shard start is None without sharding.
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending and not self._pending_repeats:
+            return []
+
+        rows, self._pending = self._pending, []
+        repeats, self._pending_repeats = self._pending_repeats, []
+        if self.manifest is None:
+            return [(None, rows, repeats)]
+        return group_by_shard(rows, repeats, self.manifest.period_ns)
+
+    def _restore(
+        self, batches: list[tuple[int | None, list[tuple], list[tuple]]]
+    ) -> None:
+        """Puts batches that were not committed back in front of the queue."""
+        self._pending[:0] = [row for _, rows, _ in batches for row in rows]
+        self._pending_repeats[:0] = [
+            row for _, _, repeats in batches for row in repeats
+        ]
+
+    def _path(self, start_ns: int | None) -> Path:
+        if start_ns is None:
+            return self.db_path
+        return self.manifest.shard_path(start_ns)
+
+    def _write_statements(
+        self, path: Path, rows: list[tuple], repeats: list[tuple]
+    ) -> Generator[tuple[bool, str, tuple | list], int, None]:
+        """
+        The statements of one transaction writing rows and repeats to
+        path, as (executemany, query, parameters). The row count of each
+        statement is sent back.
+        """
+        if rows:
+            yield True, INSERT_QUERY, rows
+        if rows and self.signal_decoder is not None:
+            advanced = yield False, ADVANCE_MARK_QUERY, (len(rows),)
+            if advanced == 1:
+                yield True, INSERT_SIGNAL_QUERY, signal_rows(
+                    self.signal_decoder, self._signal_ids[path], rows
+                )
+        if repeats:
+            yield True, INSERT_REPEATS_QUERY, repeats
+
+    def _committed(self, rows: list[tuple]) -> None:
+        if self.latency is not None:
+            self.latency.record_rows("commit", rows)
+
+    def _add_shard(self, start_ns: int, connection: object) -> bool:
+        """
+        Registers the connection of a newly opened shard. Returns True if
+        it is the newest one, which the checkpointer then follows.
+        """
+        self._shards[start_ns] = connection
+        if start_ns != max(self._shards):
+            return False
+        if self.checkpointer is not None:
+            self.checkpointer.retarget(self._path(start_ns))
+        return True
+
+    def _pop_old_shards(self, keep: int) -> list[tuple[int, object]]:
+        """
+        Removes the shards that rotated out. Late frames may still belong
+        to the previous period, so the newest keep shards stay open.
+        """
+        starts = sorted(self._shards)
+        return [
+            (start, self._shards.pop(start))
+            for start in starts[: len(starts) - keep]
+        ]
+
+    def _closed_shard(self, start_ns: int, keep: int) -> None:
+        if keep:
+            # Nothing writes to it any more, index it for the readers
+            create_indexes_in_background(self._path(start_ns))
+
+
+class CANMessageDatabase(_GroupCommitWriter):
+    """
+    Asynchronous group-commit writer for the can_messages table, see
+    _GroupCommitWriter for the parameters. Pending messages are also
+    flushed by a background task when no new frames arrive.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.db_connected: bool | None = None
         self.conn: Connection = None
         self.cursor: Cursor = None
 
+        self._flush_lock: asyncio.Lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    async def _open_connection(self, path: Path) -> tuple[Connection, Cursor]:
+        conn = await aiosqlite.connect(path)
+        cursor = await conn.cursor()
+        for statement in self._pragma_statements():
+            await cursor.execute(statement)
+        await cursor.execute(SCHEMA_INFO_QUERY)
+        check_schema_version(*await cursor.fetchone())
+        for query in self._setup_queries():
+            await cursor.execute(query)
+        await conn.commit()
+        if self.signal_decoder is not None:
+            await self._setup_signal_tables(path, conn, cursor)
+        return conn, cursor
+
+    async def _setup_signal_tables(
+        self, path: Path, conn: Connection, cursor: Cursor
+    ) -> None:
+        for query in CREATE_SIGNAL_TABLE_QUERIES:
+            await cursor.execute(query)
+        await cursor.executemany(
+            INSERT_SIGNAL_NAME_QUERY, signal_names(self.signal_decoder)
+        )
+        await conn.commit()
+        await cursor.execute(SELECT_SIGNAL_NAMES_QUERY)
+        self._signal_ids[path] = signal_ids_from_rows(await cursor.fetchall())
+        await cursor.execute(SIGNAL_PROGRESS_QUERY)
+        warn_if_behind(path, *await cursor.fetchone())
+
+    async def _write_rows(
+        self,
+        path: Path,
+        conn: Connection,
+        cursor: Cursor,
+        rows: list[tuple],
+        repeats: list[tuple],
+    ) -> None:
+        statements = self._write_statements(path, rows, repeats)
+        rowcount = None
+        try:
+            while (
+                statement := _next_statement(statements, rowcount)
+            ) is not None:
+                many, query, params = statement
+                if many:
+                    await cursor.executemany(query, params)
+                else:
+                    await cursor.execute(query, params)
+                rowcount = cursor.rowcount
+            await conn.commit()
+        except BaseException:
+            # Also when cancelled, a later flush must not commit the half
+            await conn.rollback()
+            raise
+        self._committed(rows)
+
     async def connect(self) -> None:
         try:
-            self.conn = await aiosqlite.connect(self.db_path)
-            self.cursor = await self.conn.cursor()
-            await self.cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS can_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp REAL,
-                    arbitration_id TEXT,
-                    dlc INTEGER,
-                    data TEXT,
-                    is_fd INTEGER,
-                    is_error_frame INTEGER
+            if self.shard_period is None:
+                self.conn, self.cursor = await self._open_connection(
+                    self.db_path
                 )
-                """
-            )
-            await self.conn.commit()
+            else:
+                self._open_manifest()
             self.db_connected = True
-        except Exception:
+            self._started()
+        except Exception as e:
             self.db_connected = False
+            print(f"Database connect error: {e}")
 
     async def add_message(self, message: can.Message) -> None:
+        await self.add_messages([message])
+
+    async def add_messages(self, messages: list[can.Message]) -> None:
+        """Buffers a batch of messages, flushing if a threshold is hit."""
         if not self.db_connected:
             raise RuntimeError("First connect to database.")
 
-        # Save message to database
-        await self.cursor.execute(
-            """
-            INSERT INTO can_messages (timestamp, arbitration_id, dlc, data, is_fd, is_error_frame)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                message.timestamp,
-                f"{message.arbitration_id:03X}",
-                message.dlc,
-                " ".join(f"{b:02X}" for b in message.data),
-                int(message.is_fd),
-                int(message.is_error_frame),
-            ),
-        )
-        await self.conn.commit()
+        self._queue_messages(messages)
+        await self._maybe_flush()
+
+    async def _maybe_flush(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+        if self._flush_due():
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes all pending messages in a single transaction per file. If
+        a write fails, it is rolled back and the frames not committed stay
+        pending for the next flush.
+        """
+        async with self._flush_lock:
+            batches = self._take_batches()
+            for i, (start, rows, repeats) in enumerate(batches):
+                try:
+                    conn, cursor = await self._connection(start)
+                    await self._write_rows(
+                        self._path(start), conn, cursor, rows, repeats
+                    )
+                except BaseException:
+                    self._restore(batches[i:])
+                    raise
+            if self.manifest is not None:
+                await self._close_old_shards()
+
+    async def _connection(
+        self, start_ns: int | None
+    ) -> tuple[Connection, Cursor]:
+        if start_ns is None:
+            return self.conn, self.cursor
+        if start_ns not in self._shards:
+            connection = await self._open_connection(self._path(start_ns))
+            if self._add_shard(start_ns, connection):
+                self.conn, self.cursor = connection
+        return self._shards[start_ns]
+
+    async def _close_old_shards(self, keep: int = KEEP_OPEN_SHARDS) -> None:
+        for start, (conn, cursor) in self._pop_old_shards(keep):
+            await cursor.close()
+            await conn.close()
+            self._closed_shard(start, keep)
+
+    async def _flush_loop(self) -> None:
+        """Flushes on the time threshold even when no new frames arrive."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    # The frames stay pending, retried on the next flush
+                    print(f"Database flush error: {e}")
 
     async def disconnect(self) -> None:
         if self.db_connected:
-            await self.cursor.close()
-            await self.conn.close()
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._flush_task
+                self._flush_task = None
+
+            self._finish_runs()
+            await self.flush()
+            if self.checkpointer is not None:
+                await asyncio.to_thread(self.checkpointer.stop)
+            if self.manifest is None:
+                await self.cursor.close()
+                await self.conn.close()
+            else:
+                await self._close_old_shards(keep=0)
             self.db_connected = False
+
+
+class SQLiteBatchWriter(_GroupCommitWriter):
+    """
+    Synchronous counterpart of CANMessageDatabase for scripts and tools
+    without an event loop.
+
+    Call maybe_flush() periodically (e.g. after every recv timeout) so
+    the time threshold is honoured on an idle bus.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conn: sqlite3.Connection | None = None
+        self.connected: bool = False
+
+    def _open_connection(self, path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(path)
+        for statement in self._pragma_statements():
+            conn.execute(statement)
+        check_schema_version(*conn.execute(SCHEMA_INFO_QUERY).fetchone())
+        for query in self._setup_queries():
+            conn.execute(query)
+        conn.commit()
+        if self.signal_decoder is not None:
+            self._signal_ids[path] = setup_signal_tables(
+                conn, self.signal_decoder
+            )
+            warn_if_behind(
+                path, *conn.execute(SIGNAL_PROGRESS_QUERY).fetchone()
+            )
+        return conn
+
+    def _write_rows(
+        self,
+        path: Path,
+        conn: sqlite3.Connection,
+        rows: list[tuple],
+        repeats: list[tuple],
+    ) -> None:
+        statements = self._write_statements(path, rows, repeats)
+        rowcount = None
+        with conn:
+            while (
+                statement := _next_statement(statements, rowcount)
+            ) is not None:
+                many, query, params = statement
+                execute = conn.executemany if many else conn.execute
+                rowcount = execute(query, params).rowcount
+        self._committed(rows)
+
+    def connect(self) -> None:
+        if self.shard_period is None:
+            self.conn = self._open_connection(self.db_path)
+        else:
+            self._open_manifest()
+        self.connected = True
+        self._started()
+
+    def add_message(self, message: can.Message) -> None:
+        self.add_messages([message])
+
+    def add_messages(self, messages: list[can.Message]) -> None:
+        self._queue_messages(messages)
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        if self._flush_due():
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes all pending messages in a single transaction per file. If
+        a write fails, it is rolled back and the frames not committed stay
+        pending for the next flush.
+        """
+        if not self.connected:
+            self._last_flush = time.monotonic()
+            return
+
+        batches = self._take_batches()
+        for i, (start, rows, repeats) in enumerate(batches):
+            try:
+                # The connection context rolls back on errors
+                self._write_rows(
+                    self._path(start), self._connection(start), rows, repeats
+                )
+            except BaseException:
+                self._restore(batches[i:])
+                raise
+        if self.manifest is not None:
+            self._close_old_shards()
+
+    def _connection(self, start_ns: int | None) -> sqlite3.Connection:
+        if start_ns is None:
+            return self.conn
+        if start_ns not in self._shards:
+            conn = self._open_connection(self._path(start_ns))
+            if self._add_shard(start_ns, conn):
+                self.conn = conn
+        return self._shards[start_ns]
+
+    def _close_old_shards(self, keep: int = KEEP_OPEN_SHARDS) -> None:
+        for start, conn in self._pop_old_shards(keep):
+            conn.close()
+            self._closed_shard(start, keep)
+
+    def close(self) -> None:
+        """Flushes pending messages and closes the connection (idempotent)."""
+        if not self.connected:
+            return
+
+        self._finish_runs()
+        self.flush()
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+        if self.manifest is None:
+            self.conn.close()
+        else:
+            self._close_old_shards(keep=0)
+        self.conn = None
+        self.connected = False
+
+
+class WalCheckpointer:
+    """
+    Background WAL checkpoint policy.
+
+    Every interval seconds a PASSIVE checkpoint is run from a dedicated
+    connection, which never waits on the writer or on readers. Once the
+    -wal file grows beyond max_wal_size a TRUNCATE checkpoint is attempted
+    so the file is reset instead of growing without bound.
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+        max_wal_size: int = DEFAULT_MAX_WAL_SIZE,
+    ):
+        self.db_path: Path = Path(db_path)
+        self.wal_path: Path = Path(f"{self.db_path}-wal")
+        self.interval: float = interval
+        self.max_wal_size: int = max_wal_size
+
+        self._stop_event: threading.Event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="wal-checkpointer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def retarget(self, db_path: str | Path) -> None:
+        """Follows a sharded writer to its newest shard."""
+        self.db_path = Path(db_path)
+        self.wal_path = Path(f"{self.db_path}-wal")
+
+    def checkpoint(self, conn: sqlite3.Connection) -> tuple | None:
+        """Runs one checkpoint, returns (busy, wal pages, checkpointed)."""
+        try:
+            wal_size = os.path.getsize(self.wal_path)
+        except OSError:
+            return None
+
+        mode = "TRUNCATE" if wal_size > self.max_wal_size else "PASSIVE"
+        return conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+
+    def _run(self) -> None:
+        conn = None
+        conn_path = None
+        try:
+            while not self._stop_event.wait(self.interval):
+                db_path = self.db_path
+                if not self.wal_path.exists():
+                    continue
+                try:
+                    if conn_path != db_path:
+                        if conn is not None:
+                            conn.close()
+                        conn = sqlite3.connect(db_path, timeout=0.1)
+                        conn_path = db_path
+                    self.checkpoint(conn)
+                except sqlite3.Error as e:
+                    print(f"WAL checkpoint error: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
@@ -1,14 +1,173 @@
 import re
+import sys
+import time
+from datetime import datetime
+from typing import Iterable
 
+import can
 import click
 
-from can_logger.database_tools.database_interface import DatabaseInterface
+from can_logger.database_tools.backfill import backfill_signals
+from can_logger.database_tools.compaction import (
+    CHUNK_CODECS,
+    DEFAULT_CHUNK_BLOCK,
+    DEFAULT_CHUNK_CODEC,
+    compact_database,
+)
+from can_logger.database_tools.conversion import convert_segments
+from can_logger.database_tools.database_interface import (
+    DatabaseInterface,
+    FrameStats,
+    QueryPlan,
+    datetime_range,
+    datetime_to_ns,
+)
+from can_logger.database_tools.export import export_npz, iter_frame_columns
+from can_logger.database_tools.migration import migrate_database
+from can_logger.database_tools.optimize import (
+    database_files,
+    optimize_database,
+)
+from can_logger.database_tools.replay import (
+    DEFAULT_TIME_SCALE,
+    format_replay_stats,
+    iter_replay_rows,
+    replay_messages,
+)
+from can_logger.decoding import SignalDecoder, format_signals
+from can_logger.segments import DEFAULT_SEGMENTS_PATH
+
+
+def format_row(row: tuple) -> str:
+    """Formats a v3 layout row similar to candump -ta output."""
+    row_id, timestamp_ns, arbitration_id, is_extended, dlc, data = row[:6]
+    channel = "" if row[8] is None else row[8]
+    timestamp = datetime.fromtimestamp(timestamp_ns / 1_000_000_000)
+    arbitration_id_str = (
+        f"{arbitration_id:08X}" if is_extended else f"{arbitration_id:03X}"
+    )
+    data_str = data.hex(" ").upper()
+    return (
+        f"{row_id:>8}  {timestamp.isoformat(sep=' ', timespec='microseconds')}"
+        f"  {channel:<5}  {arbitration_id_str:<3}   [{dlc}]  {data_str}"
+    )
+
+
+PRINT_CHUNK_SIZE = 1000
+
+
+def print_messages(
+    messages: Iterable | None, decoder: SignalDecoder | None = None
+) -> None:
+    """
+    Prints rows as they arrive, writing them out in chunks. With a decoder
+    the signals of known frames are printed below them.
+    """
+    if not messages:
+        return
+    write = sys.stdout.write
+    lines = []
+    for mes in messages:
+        lines.append(format_row(mes))
+        if decoder is not None:
+            decoded = decoder.decode_row(mes)
+            if decoded is not None:
+                lines.append(format_signals(*decoded))
+        if len(lines) >= PRINT_CHUNK_SIZE:
+            write("\n".join(lines) + "\n")
+            lines.clear()
+    if lines:
+        write("\n".join(lines) + "\n")
+    sys.stdout.flush()
 
 
-def print_messages(messages: list) -> None:
-    if messages:
-        for mes in messages:
-            print(mes)
+def print_signal_values(values: Iterable | None) -> None:
+    if not values:
+        return
+    for timestamp_ns, value in values:
+        timestamp = datetime.fromtimestamp(timestamp_ns / 1_000_000_000)
+        print(
+            f"{timestamp.isoformat(sep=' ', timespec='microseconds')}  {value}"
+        )
+
+
+def _format_optional(value: float | None, width: int) -> str:
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.1f}"
+
+
+def print_stats(stats: list[FrameStats] | None) -> None:
+    if not stats:
+        return
+    print(
+        f"{'bucket':<27}{'id':>9}{'count':>9}{'rate/s':>10}{'min us':>11}"
+        f"{'max us':>11}{'mean us':>11}{'jitter us':>11}{'changes':>9}"
+    )
+    for row in stats:
+        bucket = (
+            "all"
+            if row.bucket_start_ns is None
+            else datetime.fromtimestamp(
+                row.bucket_start_ns / 1_000_000_000
+            ).isoformat(sep=" ", timespec="milliseconds")
+        )
+        print(
+            f"{bucket:<27}{row.arbitration_id:>9X}{row.count:>9}"
+            f"{_format_optional(row.rate, 10)}"
+            f"{_format_optional(row.min_gap_us, 11)}"
+            f"{_format_optional(row.max_gap_us, 11)}"
+            f"{_format_optional(row.mean_gap_us, 11)}"
+            f"{_format_optional(row.jitter_us, 11)}"
+            f"{row.payload_changes:>9}"
+        )
+
+
+def print_suppressed_counts(counts: list[tuple[int, int, int]]) -> None:
+    if not counts:
+        return
+    print(f"{'id':>9}{'suppressed':>12}")
+    for arbitration_id, is_extended, count in counts:
+        id_str = (
+            f"{arbitration_id:08X}" if is_extended else f"{arbitration_id:X}"
+        )
+        print(f"{id_str:>9}{count:>12}")
+
+
+def print_query_plans(query_plans: list[QueryPlan]) -> None:
+    for query_plan in query_plans:
+        for line in query_plan.plan:
+            print(line)
+        if query_plan.estimated_rows is None:
+            print("Estimated rows: unknown (run --mode optimize)")
+        else:
+            print(f"Estimated rows: {query_plan.estimated_rows}")
+
+
+def replay(
+    db_interface: DatabaseInterface,
+    interface: str,
+    bustype: str,
+    time_scale: float,
+    arbitration_id: str | None,
+    date: str | None,
+    hour: int | None,
+    minute: int | None,
+) -> None:
+    rows = iter_replay_rows(db_interface, arbitration_id, date, hour, minute)
+    if db_interface.explain:
+        for _ in rows:
+            pass
+        return
+    try:
+        bus = can.Bus(channel=interface, interface=bustype, fd=True)
+    except (OSError, can.CanError) as e:
+        print(f"Error: Cannot open CAN interface '{interface}': {e}")
+        return
+    try:
+        print(format_replay_stats(replay_messages(bus, rows, time_scale)))
+    except KeyboardInterrupt:
+        print("Interrupted by user")
+    finally:
+        bus.shutdown()
 
 
 @click.command()
@@ -21,7 +180,24 @@ def print_messages(messages: list) -> None:
 )
 @click.option(
     "--mode",
-    type=click.Choice(["all", "last", "id", "date"], case_sensitive=False),
+    type=click.Choice(
+        [
+            "all",
+            "last",
+            "id",
+            "date",
+            "signal",
+            "stats",
+            "export-npz",
+            "backfill",
+            "migrate",
+            "optimize",
+            "compact",
+            "replay",
+            "convert-segments",
+        ],
+        case_sensitive=False,
+    ),
     default="all",
     help="Choose operation mode.",
 )
@@ -36,14 +212,26 @@ def print_messages(messages: list) -> None:
     "--arbitration-id",
     type=str,
     default=None,
-    help="Arbitration ID (for 'id' mode).",
+    help=(
+        "Arbitration ID (for 'id', 'stats' and 'export-npz' mode, combined"
+        " with --date if given)."
+    ),
+)
+@click.option(
+    "--channel",
+    type=str,
+    default=None,
+    help="Only show frames received on this interface (e.g. can1).",
 )
 @click.option(
     "-d",
     "--date",
     type=str,
     default=None,
-    help="Date in format YYYY-MM-DD (year-month-day) (for 'date' mode).",
+    help=(
+        "Date in format YYYY-MM-DD (year-month-day) (for 'date', 'signal',"
+        " 'stats' and 'export-npz' mode)."
+    ),
 )
 @click.option(
     "-h",
@@ -59,18 +247,225 @@ def print_messages(messages: list) -> None:
     default=None,
     help="Minute (for 'date' mode).",
 )
-def main(db_path, mode, n, arbitration_id, date, hour, minute):
-    db_interface = DatabaseInterface(db_path)
+@click.option(
+    "--interval",
+    type=float,
+    default=None,
+    help="Bucket length in seconds (for 'stats' mode, default: no buckets).",
+)
+@click.option(
+    "--signal",
+    type=str,
+    default=None,
+    help="Signal name, optionally as Message.Signal (for 'signal' mode).",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=str,
+    default="can_messages.npz",
+    help="Output file (for 'export-npz' mode).",
+)
+@click.option(
+    "--dbc",
+    "dbc_path",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help=(
+        "DBC file used to print the decoded signals of every frame (and to"
+        " decode them in 'backfill' mode)."
+    ),
+)
+@click.option(
+    "--older-than",
+    type=float,
+    default=30.0,
+    show_default=True,
+    help="Compact rows older than this many days (for 'compact' mode).",
+)
+@click.option(
+    "--chunk-block",
+    type=float,
+    default=DEFAULT_CHUNK_BLOCK,
+    show_default=True,
+    help="Seconds of one ID's frames per compressed chunk (for 'compact').",
+)
+@click.option(
+    "--codec",
+    type=click.Choice(list(CHUNK_CODECS)),
+    default=DEFAULT_CHUNK_CODEC,
+    show_default=True,
+    help="Chunk compression (for 'compact' mode).",
+)
+@click.option(
+    "--interface",
+    type=str,
+    default=None,
+    help="CAN interface frames are sent to (for 'replay' mode).",
+)
+@click.option(
+    "--bustype",
+    type=str,
+    default="socketcan",
+    show_default=True,
+    help="python-can bus type of --interface (for 'replay' mode).",
+)
+@click.option(
+    "--time-scale",
+    type=float,
+    default=DEFAULT_TIME_SCALE,
+    show_default=True,
+    help=(
+        "Replay speed relative to the recording, 0 sends as fast as"
+        " possible (for 'replay' mode)."
+    ),
+)
+@click.option(
+    "--segments-path",
+    type=str,
+    default=DEFAULT_SEGMENTS_PATH,
+    show_default=True,
+    help=(
+        "Segment directory written by the segments sink (for"
+        " 'convert-segments' mode, limited to --date if given)."
+    ),
+)
+@click.option(
+    "--expand",
+    is_flag=True,
+    default=False,
+    help=(
+        "Restore the repeats dropped by a --change-only logger, so frames"
+        " are shown as received."
+    ),
+)
+@click.option(
+    "--explain",
+    is_flag=True,
+    default=False,
+    help="Show the query plan and row count estimate instead of rows.",
+)
+def main(
+    db_path,
+    mode,
+    n,
+    arbitration_id,
+    channel,
+    date,
+    hour,
+    minute,
+    interval,
+    signal,
+    output,
+    dbc_path,
+    older_than,
+    chunk_block,
+    codec,
+    interface,
+    bustype,
+    time_scale,
+    segments_path,
+    expand,
+    explain,
+):
+    if mode == "optimize":
+        for path in optimize_database(db_path):
+            print(f"Indexed {path}")
+        return
+
+    if mode == "compact":
+        before_ns = round((time.time() - older_than * 86400) * 1_000_000_000)
+        rows, chunks = compact_database(db_path, before_ns, chunk_block, codec)
+        print(f"Compacted {rows} frames into {chunks} chunks.")
+        return
+
+    if mode == "convert-segments":
+        start_ns = end_ns = None
+        if date:
+            start_ns, end_ns = map(
+                datetime_to_ns, datetime_range(date, hour, minute)
+            )
+        count = convert_segments(segments_path, db_path, start_ns, end_ns)
+        print(f"Converted {count} frames from {segments_path} to {db_path}.")
+        return
+
+    if mode == "backfill":
+        if not dbc_path:
+            print("You must provide a DBC file (--dbc) for 'backfill' mode.")
+        else:
+            count = backfill_signals(db_path, dbc_path)
+            print(f"Decoded {count} frames into the signals table.")
+        return
+
+    if mode == "migrate":
+        for path in database_files(db_path):
+            if migrate_database(path):
+                print(f"Migrated {path} to the current (v3) layout.")
+            else:
+                print(f"{path} is already up to date.")
+        return
+
+    decoder = SignalDecoder.from_file(dbc_path) if dbc_path else None
+    db_interface = DatabaseInterface(
+        db_path, explain=explain, expand=expand, channel=channel
+    )
     db_interface.connect()
 
     if mode == "all":
-        print_messages(db_interface.get_all_messages())
+        print_messages(db_interface.iter_all_messages(), decoder)
     elif mode == "last":
-        print_messages(db_interface.get_last_n_messages(n))
+        print_messages(db_interface.get_last_n_messages(n), decoder)
+    elif mode == "id" and date:
+        print_messages(
+            db_interface.iter_messages_by_arbitration_id_and_datetime(
+                arbitration_id, date, hour, minute
+            ),
+            decoder,
+        )
     elif mode == "id":
         print_messages(
-            db_interface.get_messages_by_arbitration_id(arbitration_id)
+            db_interface.iter_messages_by_arbitration_id(arbitration_id),
+            decoder,
         )
+    elif mode == "stats":
+        print_stats(
+            db_interface.get_frame_stats(
+                interval, arbitration_id, date, hour, minute
+            )
+        )
+        if not explain:
+            print_suppressed_counts(db_interface.get_suppressed_counts())
+    elif mode == "signal":
+        if not signal:
+            print("You must provide a signal name for 'signal' mode.")
+        else:
+            print_signal_values(
+                db_interface.iter_signal_values(signal, date, hour, minute)
+            )
+    elif mode == "export-npz" and explain:
+        for _ in iter_frame_columns(
+            db_interface, arbitration_id, date, hour, minute
+        ):
+            pass
+    elif mode == "export-npz":
+        count = export_npz(
+            db_interface, output, arbitration_id, date, hour, minute
+        )
+        print(f"Exported {count} frames to {output}")
+    elif mode == "replay":
+        if not interface:
+            print("You must provide a CAN interface for 'replay' mode.")
+        else:
+            replay(
+                db_interface,
+                interface,
+                bustype,
+                time_scale,
+                arbitration_id,
+                date,
+                hour,
+                minute,
+            )
     elif mode == "date":
         if not date:
             print("You must provide a date for 'date' mode.")
@@ -80,9 +475,11 @@ def main(db_path, mode, n, arbitration_id, date, hour, minute):
                 print("Date must be in format YYYY-MM-DD (year-month-day).")
             else:
                 print_messages(
-                    db_interface.get_messages_by_datetime(date, hour, minute)
+                    db_interface.iter_messages_by_datetime(date, hour, minute),
+                    decoder,
                 )
 
+    print_query_plans(db_interface.query_plans)
     db_interface.disconnect()
 
 
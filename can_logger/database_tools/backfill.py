@@ -0,0 +1,72 @@
+import sqlite3
+from pathlib import Path
+
+from can_logger.database import SCHEMA_INFO_QUERY, check_schema_version
+from can_logger.database_tools.optimize import database_files
+from can_logger.signals import (
+    INSERT_SIGNAL_QUERY,
+    SELECT_BACKFILL_QUERY,
+    SET_MARK_QUERY,
+    setup_signal_tables,
+    signal_decoder,
+    signal_rows,
+)
+
+DEFAULT_BACKFILL_CHUNK = 10_000
+
+
+def backfill_file(
+    path: Path, decoder, chunk_size: int = DEFAULT_BACKFILL_CHUNK
+) -> int:
+    """
+    Decodes the can_messages rows after the high-water mark of one file
+    into its signals table. Every chunk is decoded and the mark moved in
+    one write transaction, so this can run next to a logger writing to the
+    same file. Returns the number of frames processed.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        check_schema_version(*conn.execute(SCHEMA_INFO_QUERY).fetchone())
+        signal_ids = setup_signal_tables(conn, decoder)
+
+        processed = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                (last_message_id,) = conn.execute(
+                    "SELECT last_message_id FROM signal_state"
+                ).fetchone()
+                rows = conn.execute(
+                    SELECT_BACKFILL_QUERY, (last_message_id, chunk_size)
+                ).fetchall()
+                if rows:
+                    conn.executemany(
+                        INSERT_SIGNAL_QUERY,
+                        signal_rows(
+                            decoder, signal_ids, [row[1:] for row in rows]
+                        ),
+                    )
+                    conn.execute(SET_MARK_QUERY, (rows[-1][0],))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+            if not rows:
+                return processed
+            processed += len(rows)
+    finally:
+        conn.close()
+
+
+def backfill_signals(
+    db_path: str | Path,
+    dbc_path: str | Path,
+    chunk_size: int = DEFAULT_BACKFILL_CHUNK,
+) -> int:
+    """Backfills every file (or shard) of the database, see backfill_file()."""
+    decoder = signal_decoder(dbc_path)
+    return sum(
+        backfill_file(path, decoder, chunk_size)
+        for path in database_files(db_path)
+    )
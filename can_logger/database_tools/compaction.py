@@ -0,0 +1,310 @@
+import lzma
+import sqlite3
+import sys
+import zlib
+from array import array
+from itertools import accumulate, groupby
+from pathlib import Path
+from typing import Iterator
+
+from can_logger.database import SCHEMA_INFO_QUERY, check_schema_version
+from can_logger.database_tools.optimize import database_files
+
+DEFAULT_CHUNK_BLOCK = 3600.0
+DEFAULT_CHUNK_CODEC = "zlib"
+CHUNK_CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+# Compacted rows: one compressed chunk per channel, arbitration ID and
+# time block. The data column comes last, so scans over the other columns
+# never read its overflow pages.
+CREATE_CHUNKS_TABLE_QUERIES = (
+    """
+    CREATE TABLE IF NOT EXISTS can_chunks (
+        arbitration_id INTEGER,
+        is_extended_id INTEGER,
+        channel TEXT,
+        block_start_ns INTEGER,
+        first_ns INTEGER,
+        last_ns INTEGER,
+        count INTEGER,
+        codec TEXT,
+        data BLOB
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_can_chunks_id_block
+    ON can_chunks (arbitration_id, is_extended_id, channel, block_start_ns)
+    """,
+)
+
+CHUNKS_TABLE_QUERY = """
+    SELECT EXISTS(
+        SELECT 1 FROM sqlite_master
+        WHERE type = 'table' AND name = 'can_chunks'
+    )
+    """
+
+SELECT_COMPACTED_ROWS_QUERY = """
+    SELECT * FROM can_messages
+    WHERE timestamp_ns < ?
+    ORDER BY arbitration_id, is_extended_id, channel, timestamp_ns / ?, id
+    """
+
+# IS rather than =, rows without a channel have a NULL one
+SELECT_CHUNK_QUERY = """
+    SELECT rowid, data, codec FROM can_chunks
+    WHERE arbitration_id = ? AND is_extended_id = ? AND channel IS ?
+        AND block_start_ns = ?
+    """
+
+INSERT_CHUNK_QUERY = """
+    INSERT INTO can_chunks (
+        arbitration_id, is_extended_id, channel, block_start_ns, first_ns,
+        last_ns, count, codec, data
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+UPDATE_CHUNK_QUERY = """
+    UPDATE can_chunks
+    SET first_ns = ?, last_ns = ?, count = ?, codec = ?, data = ?
+    WHERE rowid = ?
+    """
+
+FLAG_FD = 0x01
+FLAG_ERROR_FRAME = 0x02
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _deltas(values: list[int]) -> array:
+    return array("q", (b - a for a, b in zip([0, *values], values)))
+
+
+def encode_chunk(rows: list[tuple]) -> bytes:
+    """
+    Packs v3 layout rows of one arbitration ID and channel column by
+    column: the row count, delta-encoded row ids and timestamps (int64),
+    the dlc, flags and payload length bytes and the concatenated
+    payloads. Deltas of periodic frames are nearly constant, which
+    compresses well.
+    """
+    return b"".join(
+        (
+            len(rows).to_bytes(4, "little"),
+            _little_endian(_deltas([row[0] for row in rows])),
+            _little_endian(_deltas([row[1] for row in rows])),
+            bytes(row[4] for row in rows),
+            bytes(
+                row[6] * FLAG_FD | row[7] * FLAG_ERROR_FRAME for row in rows
+            ),
+            bytes(len(row[5]) for row in rows),
+            *(row[5] for row in rows),
+        )
+    )
+
+
+def _int64s(raw: bytes, offset: int, count: int) -> array:
+    values = array("q")
+    values.frombytes(raw[offset : offset + 8 * count])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def decode_chunk(
+    raw: bytes,
+    arbitration_id: int,
+    is_extended_id: int,
+    channel: str | None = None,
+) -> list[tuple]:
+    """Unpacks encode_chunk() data back into v3 layout rows."""
+    count = int.from_bytes(raw[:4], "little")
+    ids = accumulate(_int64s(raw, 4, count))
+    timestamps = accumulate(_int64s(raw, 4 + 8 * count, count))
+    offset = 4 + 16 * count
+    dlcs = raw[offset : offset + count]
+    flags = raw[offset + count : offset + 2 * count]
+    lengths = raw[offset + 2 * count : offset + 3 * count]
+    offset += 3 * count
+
+    rows = []
+    for row_id, timestamp_ns, dlc, flag, length in zip(
+        ids, timestamps, dlcs, flags, lengths
+    ):
+        rows.append(
+            (
+                row_id,
+                timestamp_ns,
+                arbitration_id,
+                is_extended_id,
+                dlc,
+                raw[offset : offset + length],
+                flag & FLAG_FD,
+                flag >> 1 & 1,
+                channel,
+            )
+        )
+        offset += length
+    return rows
+
+
+def compress_chunk(rows: list[tuple], codec: str) -> bytes:
+    return CHUNK_CODECS[codec][0](encode_chunk(rows))
+
+
+def decompress_chunk(
+    data: bytes,
+    codec: str,
+    arbitration_id: int,
+    is_extended_id: int,
+    channel: str | None = None,
+) -> list[tuple]:
+    return decode_chunk(
+        CHUNK_CODECS[codec][1](data), arbitration_id, is_extended_id, channel
+    )
+
+
+def iter_chunk_rows(
+    conn: sqlite3.Connection,
+    arbitration_id: int | None = None,
+    start_ns: int | None = None,
+    end_ns: int | None = None,
+    channel: str | None = None,
+    has_channel: bool = True,
+    reverse: bool = False,
+) -> Iterator[tuple]:
+    """
+    Yields the compacted rows of the given ID, channel and time range
+    (bounds included), decompressing only the chunks overlapping it.
+    Chunks are read one time block at a time, rows within a block in id
+    order, or newest block and row first with reverse set. has_channel is
+    False for unmigrated v2 files, their rows get a None channel.
+    """
+    if not conn.execute(CHUNKS_TABLE_QUERY).fetchone()[0]:
+        return
+
+    conditions = []
+    params = ()
+    if arbitration_id is not None:
+        conditions.append("arbitration_id = ?")
+        params += (arbitration_id,)
+    if channel is not None:
+        conditions.append("channel = ?")
+        params += (channel,)
+    if start_ns is not None:
+        conditions.append("last_ns >= ?")
+        params += (start_ns,)
+    if end_ns is not None:
+        conditions.append("first_ns <= ?")
+        params += (end_ns,)
+    query = (
+        "SELECT block_start_ns, arbitration_id, is_extended_id,"
+        f" {'channel' if has_channel else 'NULL'}, codec, data"
+        " FROM can_chunks"
+    )
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY block_start_ns{' DESC' if reverse else ''}"
+
+    for _, chunks in groupby(conn.execute(query, params), key=lambda c: c[0]):
+        rows = []
+        for _, chunk_id, is_extended_id, chunk_channel, codec, data in chunks:
+            rows.extend(
+                row
+                for row in decompress_chunk(
+                    data, codec, chunk_id, is_extended_id, chunk_channel
+                )
+                if (start_ns is None or row[1] >= start_ns)
+                and (end_ns is None or row[1] <= end_ns)
+            )
+        rows.sort(reverse=reverse)
+        yield from rows
+
+
+def _compact_file(
+    path: Path, before_ns: int, block_ns: int, codec: str, vacuum: bool
+) -> tuple[int, int]:
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        check_schema_version(*conn.execute(SCHEMA_INFO_QUERY).fetchone())
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for query in CREATE_CHUNKS_TABLE_QUERIES:
+                conn.execute(query)
+            rows_compacted = chunks_written = 0
+            old_rows = conn.execute(
+                SELECT_COMPACTED_ROWS_QUERY, (before_ns, block_ns)
+            )
+            for key, rows in groupby(
+                old_rows,
+                key=lambda row: (row[2], row[3], row[8], row[1] // block_ns),
+            ):
+                rows = list(rows)
+                rows_compacted += len(rows)
+                key = (*key[:3], key[3] * block_ns)
+                existing = conn.execute(SELECT_CHUNK_QUERY, key).fetchone()
+                if existing is not None:
+                    # The block was partly compacted by an earlier run
+                    rows = sorted(
+                        rows + decompress_chunk(*existing[1:], *key[:3])
+                    )
+                chunk = (
+                    rows[0][1],
+                    rows[-1][1],
+                    len(rows),
+                    codec,
+                    compress_chunk(rows, codec),
+                )
+                if existing is None:
+                    conn.execute(INSERT_CHUNK_QUERY, (*key, *chunk))
+                else:
+                    conn.execute(UPDATE_CHUNK_QUERY, (*chunk, existing[0]))
+                chunks_written += 1
+            conn.execute(
+                "DELETE FROM can_messages WHERE timestamp_ns < ?", (before_ns,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if vacuum and rows_compacted:
+            # Give the pages of the deleted rows back to the file system
+            conn.execute("VACUUM")
+        return rows_compacted, chunks_written
+    finally:
+        conn.close()
+
+
+def compact_database(
+    db_path: str | Path,
+    before_ns: int,
+    block: float = DEFAULT_CHUNK_BLOCK,
+    codec: str = DEFAULT_CHUNK_CODEC,
+    vacuum: bool = True,
+) -> tuple[int, int]:
+    """
+    Moves the rows older than before_ns into compressed can_chunks, one
+    per arbitration ID, channel and block of block seconds (aligned to
+    the epoch), in a single transaction per file. DatabaseInterface reads
+    them back transparently, frame_repeats is kept for expanding them.
+    Returns the number of rows compacted and of chunks written.
+    """
+    if codec not in CHUNK_CODECS:
+        raise ValueError(f"Unknown codec: {codec}")
+
+    block_ns = round(block * 1_000_000_000)
+    rows_compacted = chunks_written = 0
+    for path in database_files(db_path):
+        rows, chunks = _compact_file(path, before_ns, block_ns, codec, vacuum)
+        rows_compacted += rows
+        chunks_written += chunks
+    return rows_compacted, chunks_written
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from can_logger.database import (
+    DEFAULT_BATCH_SIZE,
+    SQLiteBatchWriter,
+    create_indexes,
+)
+from can_logger.segments import SegmentReader
+
+
+def convert_segments(
+    segments_path: str | Path,
+    db_path: str | Path,
+    start_ns: int | None = None,
+    end_ns: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Appends the frames of a segment directory (optionally only those with
+    start_ns <= timestamp <= end_ns) to the can_messages table of db_path,
+    then builds the query indexes. Returns the number of frames.
+    """
+    writer = SQLiteBatchWriter(
+        db_path, batch_size=batch_size, checkpoint_interval=None
+    )
+    writer.connect()
+    count = 0
+    try:
+        batch = []
+        for message in SegmentReader(segments_path).iter_messages(
+            start_ns, end_ns
+        ):
+            batch.append(message)
+            if len(batch) >= batch_size:
+                writer.add_messages(batch)
+                count += len(batch)
+                batch = []
+        writer.add_messages(batch)
+        count += len(batch)
+    finally:
+        writer.close()
+    create_indexes(db_path)
+    return count
@@ -1,34 +1,646 @@
+import heapq
+import math
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import chain, islice
 from pathlib import Path
 from sqlite3 import Connection, Cursor
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import can
+
+from can_logger.change_only import SUPPRESSED_COUNTS_QUERY
+from can_logger.database import (
+    SCHEMA_INFO_QUERY,
+    SCHEMA_VERSION,
+    V2_SCHEMA_VERSION,
+)
+from can_logger.database_tools.compaction import iter_chunk_rows
+from can_logger.sharding import ShardManifest, is_sharded
+
+LEGACY_SCHEMA_VERSION = 1
+DEFAULT_QUERY_WORKERS = 4
+DEFAULT_FETCH_SIZE = 5000
+
+ID_TIMESTAMP_INDEX = "idx_can_messages_id_ts"
+TIMESTAMP_INDEX = "idx_can_messages_ts"
+
+REPEATS_TABLE_QUERY = """
+    SELECT EXISTS(
+        SELECT 1 FROM sqlite_master
+        WHERE type = 'table' AND name = 'frame_repeats'
+    )
+    """
+# Stored rows followed by the count and last timestamp of the identical
+# frames the change-only writer dropped after them, see expand_rows().
+# frame_repeats stores a NULL channel as an empty one.
+EXPANDED_COLUMNS = "m.{columns}, r.count, r.last_timestamp_ns"
+# The same columns from a file without frame_repeats
+UNEXPANDED_COLUMNS = "m.{columns}, NULL, NULL"
+EXPANDED_FROM = (
+    "{table} m LEFT JOIN frame_repeats r"
+    " ON r.arbitration_id = m.arbitration_id"
+    " AND r.is_extended_id = m.is_extended_id"
+    " AND r.channel = IFNULL(m.channel, '')"
+    " AND r.timestamp_ns = m.timestamp_ns"
+)
+# v2 tables have no channel column
+V2_EXPANDED_FROM = (
+    "{table} m LEFT JOIN frame_repeats r"
+    " USING (arbitration_id, is_extended_id, timestamp_ns)"
+)
+# The same join for one compacted row, whose stored frame has left
+# can_messages
+CHUNK_REPEATS_QUERY = """
+    SELECT count, last_timestamp_ns FROM frame_repeats
+    WHERE arbitration_id = ? AND is_extended_id = ? AND channel = ?
+        AND timestamp_ns = ?
+    """
+V2_CHUNK_REPEATS_QUERY = """
+    SELECT count, last_timestamp_ns FROM frame_repeats
+    WHERE arbitration_id = ? AND is_extended_id = ? AND timestamp_ns = ?
+    """
+NO_SUPPRESSED_COUNTS_QUERY = "SELECT NULL, NULL, NULL WHERE 0"
+
+
+class QueryPlan(NamedTuple):
+    plan: list[str]
+    estimated_rows: int | None
+
+
+class FrameStats(NamedTuple):
+    """Statistics of one arbitration ID in one time bucket."""
+
+    bucket_start_ns: int | None
+    arbitration_id: int
+    count: int
+    rate: float | None
+    min_gap_us: float | None
+    max_gap_us: float | None
+    mean_gap_us: float | None
+    jitter_us: float | None
+    payload_changes: int
+
+
+# Per (bucket, ID) partial aggregates. The gaps to the previous frame of
+# the same ID and payload changes come from window functions. Sums rather
+# than averages are returned so results of several shards can be merged.
+STATS_QUERY = """
+    SELECT
+        bucket,
+        arbitration_id,
+        count(*),
+        count(gap),
+        total(gap),
+        total(gap * gap),
+        min(gap),
+        max(gap),
+        total(changed),
+        min(timestamp_ns),
+        max(timestamp_ns)
+    FROM (
+        SELECT
+            {bucket} AS bucket,
+            arbitration_id,
+            timestamp_ns,
+            (timestamp_ns - lag(timestamp_ns) OVER w) / 1000.0 AS gap,
+            lag(data) OVER w IS NOT NULL
+                AND data IS NOT lag(data) OVER w AS changed
+        FROM can_messages
+        {where}
+        WINDOW w AS (PARTITION BY {partition} ORDER BY timestamp_ns)
+    )
+    GROUP BY bucket, arbitration_id
+    """
+
+# The first frame of every stream, the bare data column is taken from the
+# row with min(timestamp_ns)
+FIRST_FRAMES_QUERY = """
+    SELECT arbitration_id, {channel}, min(timestamp_ns), data
+    FROM can_messages
+    {where}
+    GROUP BY {partition}
+    """
+
+
+def merge_stats(
+    rows: list[tuple], interval_ns: int | None
+) -> list[FrameStats]:
+    """
+    Combines the partial aggregates of STATS_QUERY (possibly from several
+    shards) into FrameStats, ordered by bucket and ID. The rate is frames
+    per second of the bucket, or of the logged span without buckets.
+    """
+    merged: dict[tuple, list] = {}
+    for bucket, arbitration_id, *values in rows:
+        key = (bucket, arbitration_id)
+        if key not in merged:
+            merged[key] = values
+            continue
+        acc = merged[key]
+        for i in (0, 1, 2, 3, 6):
+            acc[i] += values[i]
+        for i, pick in ((4, min), (5, max), (7, min), (8, max)):
+            present = [v for v in (acc[i], values[i]) if v is not None]
+            acc[i] = pick(present, default=None)
+
+    stats = []
+    for (bucket, arbitration_id), values in sorted(merged.items()):
+        count, gaps, gap_sum, gap_sq_sum, min_gap, max_gap = values[:6]
+        changes, first_ns, last_ns = values[6:]
+        if interval_ns is not None:
+            rate = count / (interval_ns / 1e9)
+        elif last_ns > first_ns:
+            rate = (count - 1) / ((last_ns - first_ns) / 1e9)
+        else:
+            rate = None
+
+        mean_gap = jitter = None
+        if gaps:
+            mean_gap = gap_sum / gaps
+            jitter = math.sqrt(max(gap_sq_sum / gaps - mean_gap**2, 0.0))
+        stats.append(
+            FrameStats(
+                None if interval_ns is None else bucket * interval_ns,
+                arbitration_id,
+                count,
+                rate,
+                min_gap,
+                max_gap,
+                mean_gap,
+                jitter,
+                int(changes),
+            )
+        )
+    return stats
+
+
+def row_stats(
+    rows: Iterable[tuple], interval_ns: int | None
+) -> tuple[list[tuple], dict[tuple, tuple[int, bytes]]]:
+    """
+    Computes the STATS_QUERY partial aggregates of v3 layout rows in
+    Python, for rows that are not in can_messages. The rows of a stream
+    (ID and channel) must come in time order. Also returns the timestamp
+    and payload of the last row of every stream.
+    """
+    aggregates: dict[tuple[int, int], list] = {}
+    last: dict[tuple, tuple[int, bytes]] = {}
+    for row in rows:
+        timestamp_ns, arbitration_id, data = row[1], row[2], row[5]
+        bucket = 0 if interval_ns is None else timestamp_ns // interval_ns
+        values = aggregates.get((bucket, arbitration_id))
+        if values is None:
+            values = [0, 0, 0.0, 0.0, None, None, 0, timestamp_ns, None]
+            aggregates[(bucket, arbitration_id)] = values
+        values[0] += 1
+        values[8] = timestamp_ns
+
+        stream = (arbitration_id, row[8])
+        previous = last.get(stream)
+        last[stream] = (timestamp_ns, data)
+        if previous is None:
+            continue
+        gap = (timestamp_ns - previous[0]) / 1000.0
+        values[1] += 1
+        values[2] += gap
+        values[3] += gap * gap
+        values[4] = gap if values[4] is None else min(values[4], gap)
+        values[5] = gap if values[5] is None else max(values[5], gap)
+        values[6] += data != previous[1]
+    return [(*key, *values) for key, values in aggregates.items()], last
+
+
+def datetime_to_ns(dt: datetime) -> int:
+    return round(dt.timestamp() * 1_000_000_000)
+
+
+def datetime_range(
+    date: str, hour: int = None, minute: int = None
+) -> tuple[datetime, datetime]:
+    """Start and end of the given day, hour of the day or minute."""
+    if hour is not None and minute is not None:
+        dt_start = datetime.strptime(
+            f"{date} {hour:02d}:{minute:02d}:00", "%Y-%m-%d %H:%M:%S"
+        )
+        dt_end = datetime.strptime(
+            f"{date} {hour:02d}:{minute:02d}:59.999999",
+            "%Y-%m-%d %H:%M:%S.%f",
+        )
+    elif hour is not None:
+        dt_start = datetime.strptime(
+            f"{date} {hour:02d}:00:00", "%Y-%m-%d %H:%M:%S"
+        )
+        dt_end = datetime.strptime(
+            f"{date} {hour:02d}:59:59.999999", "%Y-%m-%d %H:%M:%S.%f"
+        )
+    else:
+        dt_start = datetime.strptime(f"{date} 00:00:00", "%Y-%m-%d %H:%M:%S")
+        dt_end = datetime.strptime(
+            f"{date} 23:59:59.999999", "%Y-%m-%d %H:%M:%S.%f"
+        )
+    return dt_start, dt_end
+
+
+def open_readonly(db_path: Path, **kwargs) -> Connection:
+    """
+    Opens a read-only connection. With the logger writing in WAL mode
+    readers see the last committed snapshot and never block ingestion.
+    """
+    return sqlite3.connect(
+        f"{db_path.absolute().as_uri()}?mode=ro", uri=True, **kwargs
+    )
+
+
+def _has_repeats_table(conn: Connection) -> bool:
+    return bool(conn.execute(REPEATS_TABLE_QUERY).fetchone()[0])
+
+
+def _build_query(
+    conn: Connection, query: str | Callable[[Connection], str]
+) -> str:
+    return query(conn) if callable(query) else query
+
+
+def legacy_row_to_row(row: tuple) -> tuple:
+    """Converts a v1 (hex TEXT) row to the v3 row layout."""
+    row_id, timestamp, arbitration_id, dlc, data, is_fd, is_error = row
+    arbitration_id = int(arbitration_id, 16)
+    return (
+        row_id,
+        round(timestamp * 1_000_000_000),
+        arbitration_id,
+        int(arbitration_id > 0x7FF),
+        dlc,
+        bytes.fromhex(data),
+        is_fd,
+        is_error,
+        None,
+    )
+
+
+def expand_rows(
+    rows: Iterable[tuple], end_ns: int | None = None
+) -> Iterator[tuple]:
+    """
+    Expands the rows of a change-only database (v3 layout plus the
+    EXPANDED_COLUMNS repeat count and last timestamp) to the logical
+    frame sequence.
+
+    The dropped repeats of a row are yielded with its id and payload, at
+    timestamps spread evenly up to the last of them, merged in time
+    order with the following rows. Repeats after end_ns are left out. A
+    heap holds the next repeat of every pending run, so memory is
+    bounded by the number of IDs.
+    """
+    pending: list[tuple] = []
+    order = 0
+    for row in rows:
+        stored, count, last_ns = row[:-2], row[-2], row[-1]
+        timestamp_ns = stored[1]
+        while pending and pending[0][0] <= timestamp_ns:
+            yield _pop_repeat(pending)
+        yield stored
+        if not count:
+            continue
+        first_ns = timestamp_ns + (last_ns - timestamp_ns) // count
+        if end_ns is None or first_ns <= end_ns:
+            order += 1
+            heapq.heappush(
+                pending, (first_ns, order, stored, 1, count, last_ns, end_ns)
+            )
+    while pending:
+        yield _pop_repeat(pending)
+
+
+def _pop_repeat(pending: list[tuple]) -> tuple:
+    """Removes the earliest repeat and queues the next one of its run."""
+    timestamp_ns, order, stored, i, count, last_ns, end_ns = heapq.heappop(
+        pending
+    )
+    if i < count:
+        start_ns = stored[1]
+        next_ns = start_ns + (last_ns - start_ns) * (i + 1) // count
+        if end_ns is None or next_ns <= end_ns:
+            heapq.heappush(
+                pending,
+                (next_ns, order, stored, i + 1, count, last_ns, end_ns),
+            )
+    return (stored[0], timestamp_ns, *stored[2:])
+
+
+def row_to_message(row: tuple) -> can.Message:
+    """Builds a can.Message from a v3 layout row."""
+    _, timestamp_ns, arbitration_id, is_extended, dlc, data, is_fd = row[:7]
+    error, channel = row[7:9]
+    return can.Message(
+        timestamp=timestamp_ns / 1_000_000_000,
+        arbitration_id=arbitration_id,
+        is_extended_id=bool(is_extended),
+        dlc=dlc,
+        data=data,
+        is_fd=bool(is_fd),
+        is_error_frame=bool(error),
+        channel=channel,
+        check=False,
+    )
 
 
 class DatabaseInterface:
-    def __init__(self, db_path: str | Path):
+    """
+    Read access to a can_messages database.
+
+    The legacy v1 layout (hex TEXT columns, float timestamps), the v2
+    layout and the v3 layout are supported. Rows are always returned in
+    the v3 layout: (id, timestamp_ns, arbitration_id, is_extended_id, dlc,
+    data, is_fd, is_error_frame, channel), with a None channel for older
+    databases.
+
+    For a sharded database (db_path names the manifest, or the base file
+    does not exist but its manifest does) queries are routed only to the
+    shards overlapping the requested time range and run on up to
+    max_workers shards in parallel. Row ids are unique per shard only.
+
+    The get_* methods return lists. The iter_* variants stream the same
+    rows in fetch_size chunks, shard by shard, so memory use does not grow
+    with the size of the result.
+
+    With explain set, queries are not run. Their plan and a row count
+    estimate are collected in query_plans instead.
+
+    With expand set, databases written in change-only mode (see
+    can_logger.change_only) are read back as the logical frame sequence:
+    the message getters include the dropped repeats, see expand_rows().
+    get_last_n_messages() returns stored rows only. Shards without a
+    frame_repeats table are read as they are.
+
+    With channel set, only frames received on that interface are read.
+    This needs the v3 layout, as do all shards of a sharded database.
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        max_workers: int = DEFAULT_QUERY_WORKERS,
+        explain: bool = False,
+        fetch_size: int = DEFAULT_FETCH_SIZE,
+        expand: bool = False,
+        channel: str | None = None,
+    ):
         self.db_path: Path = Path(db_path)
         self.tab_name: str = "can_messages"
         self.conn: Connection = None
         self.cursor: Cursor = None
         self.connected: bool = False
+        self.schema_version: int = SCHEMA_VERSION
+        self.manifest: ShardManifest | None = None
+        self.max_workers: int = max_workers
+        self.explain: bool = explain
+        self.fetch_size: int = fetch_size
+        self.query_plans: list[QueryPlan] = []
+        self.expand: bool = expand
+        self.has_repeats: bool = False
+        self.channel: str | None = channel
 
     def _check_connection(self):
         if not self.connected:
             raise RuntimeError("First connect to database!")
 
-    def _execute_query(self, query: str, params: tuple = ()) -> list | None:
+    def _execute_query(
+        self,
+        query: str | Callable[[Connection], str],
+        params: tuple = (),
+        time_range: tuple[int | None, int | None] = (None, None),
+    ) -> list | None:
+        """
+        query may be a function building it for the connection it runs
+        on, see _messages_query().
+        """
+        try:
+            if self.explain:
+                self.query_plans.append(
+                    self.explain_query(query, params, time_range)
+                )
+                return []
+
+            if self.manifest is not None:
+                return self._query_shards(
+                    self._shard_paths(*time_range), query, params
+                )
+
+            self.cursor.execute(_build_query(self.conn, query), params)
+            rows = self.cursor.fetchall()
+            if self.is_legacy:
+                rows = [legacy_row_to_row(row) for row in rows]
+            return rows
+
+        except Exception as e:
+            print(f"Database error: {e}")
+            return None
+
+    def _iter_query(
+        self,
+        query: str,
+        params: tuple = (),
+        time_range: tuple[int | None, int | None] = (None, None),
+    ) -> Iterator[tuple]:
+        """Streaming counterpart of _execute_query()."""
+        for rows in self._iter_chunks(query, params, time_range):
+            if self.is_legacy:
+                rows = [legacy_row_to_row(row) for row in rows]
+            yield from rows
+
+    def _iter_chunks(
+        self,
+        query: str | Callable[[Connection], str],
+        params: tuple = (),
+        time_range: tuple[int | None, int | None] = (None, None),
+    ) -> Iterator[list[tuple]]:
+        """Yields the raw result in fetch_size chunks, shard by shard."""
         try:
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            if self.explain:
+                self.query_plans.append(
+                    self.explain_query(query, params, time_range)
+                )
+                return
+
+            if self.manifest is not None:
+                for path in self._shard_paths(*time_range):
+                    conn = open_readonly(path)
+                    try:
+                        yield from self._iter_cursor(
+                            conn.execute(_build_query(conn, query), params)
+                        )
+                    finally:
+                        conn.close()
+                return
+
+            # A separate cursor, so other queries can run meanwhile
+            yield from self._iter_cursor(
+                self.conn.execute(_build_query(self.conn, query), params)
+            )
 
         except Exception as e:
             print(f"Database error: {e}")
+
+    def _iter_cursor(self, cursor: Cursor) -> Iterator[list[tuple]]:
+        try:
+            while rows := cursor.fetchmany(self.fetch_size):
+                yield rows
+        finally:
+            cursor.close()
+
+    def _shard_paths(
+        self, start_ns: int | None = None, end_ns: int | None = None
+    ) -> list[Path]:
+        self.manifest.reload()
+        return [
+            path
+            for path in self.manifest.shards_overlapping(start_ns, end_ns)
+            if path.exists()
+        ]
+
+    @staticmethod
+    def _query_file(
+        path: Path, query: str | Callable[[Connection], str], params: tuple
+    ) -> list:
+        conn = open_readonly(path)
+        try:
+            return conn.execute(_build_query(conn, query), params).fetchall()
+        finally:
+            conn.close()
+
+    def _query_shards(
+        self,
+        paths: list[Path],
+        query: str | Callable[[Connection], str],
+        params: tuple,
+    ) -> list:
+        """Runs the query on every shard, results are kept in shard order."""
+        if len(paths) <= 1 or self.max_workers <= 1:
+            results = [self._query_file(path, query, params) for path in paths]
+        else:
+            with ThreadPoolExecutor(
+                min(len(paths), self.max_workers)
+            ) as executor:
+                results = executor.map(
+                    lambda path: self._query_file(path, query, params), paths
+                )
+        return [row for rows in results for row in rows]
+
+    def explain_query(
+        self,
+        query: str | Callable[[Connection], str],
+        params: tuple = (),
+        time_range: tuple[int | None, int | None] = (None, None),
+    ) -> QueryPlan:
+        """Returns the query plan and an estimate of the rows returned."""
+        if self.manifest is None:
+            return self._explain(self.conn, query, params, time_range)
+
+        plan = []
+        estimates = []
+        for path in self._shard_paths(*time_range):
+            conn = open_readonly(path)
+            try:
+                shard_plan = self._explain(conn, query, params, time_range)
+            finally:
+                conn.close()
+            plan.extend(f"{path.name}: {line}" for line in shard_plan.plan)
+            estimates.append(shard_plan.estimated_rows)
+
+        if None in estimates:
+            return QueryPlan(plan, None)
+        return QueryPlan(plan, sum(estimates))
+
+    def _explain(
+        self,
+        conn: Connection,
+        query: str | Callable[[Connection], str],
+        params: tuple,
+        time_range: tuple[int | None, int | None],
+    ) -> QueryPlan:
+        query = _build_query(conn, query)
+        plan = [
+            row[3]
+            for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        ]
+        return QueryPlan(plan, self._estimate_rows(conn, plan, time_range))
+
+    def _estimate_rows(
+        self,
+        conn: Connection,
+        plan: list[str],
+        time_range: tuple[int | None, int | None],
+    ) -> int | None:
+        """
+        Estimates the result size from the ANALYZE statistics: the table
+        size, narrowed to the average rows per ID when the plan searches by
+        arbitration_id, and scaled by the share of the logged time span
+        covered by time_range. None if the database was never optimized
+        or the query does not read can_messages.
+        """
+        if self.is_legacy or not any(self.tab_name in line for line in plan):
             return None
+        try:
+            stats = dict(
+                conn.execute(
+                    "SELECT idx, stat FROM sqlite_stat1 WHERE tbl = ?",
+                    (self.tab_name,),
+                ).fetchall()
+            )
+        except sqlite3.OperationalError:
+            return None
+        if TIMESTAMP_INDEX not in stats or ID_TIMESTAMP_INDEX not in stats:
+            return None
+
+        estimate = float(stats[TIMESTAMP_INDEX].split()[0])
+        if any("arbitration_id=" in line for line in plan):
+            estimate = float(stats[ID_TIMESTAMP_INDEX].split()[1])
+
+        start_ns, end_ns = time_range
+        if start_ns is not None or end_ns is not None:
+            # min() / max() are single index lookups
+            first_ns, last_ns = conn.execute(
+                f"SELECT min(timestamp_ns), max(timestamp_ns)"
+                f" FROM {self.tab_name}"
+            ).fetchone()
+            if first_ns is None:
+                return 0
+            start_ns = first_ns if start_ns is None else start_ns
+            end_ns = last_ns if end_ns is None else end_ns
+            overlap = min(end_ns, last_ns) - max(start_ns, first_ns)
+            if overlap < 0:
+                return 0
+            if last_ns > first_ns:
+                estimate *= overlap / (last_ns - first_ns)
+
+        return round(estimate)
+
+    def _detect_schema_version(self) -> int:
+        version, table_exists = self.conn.execute(SCHEMA_INFO_QUERY).fetchone()
+        if not table_exists:
+            return max(version, SCHEMA_VERSION)
+        if version < V2_SCHEMA_VERSION:
+            return LEGACY_SCHEMA_VERSION
+        return version
 
     def connect(self) -> None:
+        """Opens read-only connections, see open_readonly()."""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            if is_sharded(self.db_path):
+                # Shards are opened per query, possibly from worker threads
+                self.manifest = ShardManifest.load(self.db_path)
+                # Checked per shard, see _messages_query()
+                self.has_repeats = self.expand
+                self.connected = True
+                return
+
+            self.conn = open_readonly(self.db_path)
             self.cursor = self.conn.cursor()
+            self.schema_version = self._detect_schema_version()
+            self.has_repeats = _has_repeats_table(self.conn)
             self.connected = True
         except Exception as e:
             self.connected = False
@@ -36,61 +648,580 @@ class DatabaseInterface:
 
     def disconnect(self) -> None:
         if self.connected:
-            self.cursor.close()
-            self.conn.close()
+            if self.manifest is None:
+                self.cursor.close()
+                self.conn.close()
             self.connected = False
 
-    def get_all_messages(self) -> list | None:
-        self._check_connection()
-        return self._execute_query(f"SELECT * FROM {self.tab_name}")
+    @property
+    def is_legacy(self) -> bool:
+        return self.schema_version == LEGACY_SCHEMA_VERSION
 
-    def get_last_n_messages(self, n: int) -> list | None:
-        self._check_connection()
-        return self._execute_query(
-            f"SELECT * FROM {self.tab_name} ORDER BY id DESC LIMIT ?", (n,)
+    @property
+    def has_channel(self) -> bool:
+        return self.schema_version >= SCHEMA_VERSION
+
+    @property
+    def _row_columns(self) -> str:
+        """
+        Selects whole rows in the v3 layout. v1 rows are converted by
+        legacy_row_to_row() instead.
+        """
+        if self.has_channel or self.is_legacy:
+            return "*"
+        return "*, NULL AS channel"
+
+    def _check_channel_column(self) -> None:
+        if self.channel is not None and not self.has_channel:
+            raise RuntimeError(
+                f"{self.db_path} has no channel column, run --mode migrate"
+                " first."
+            )
+
+    @property
+    def _expands(self) -> bool:
+        return self.expand and self.has_repeats and not self.is_legacy
+
+    def _compacted_connections(
+        self, time_range: tuple[int | None, int | None]
+    ) -> Iterator[Connection]:
+        """The connections of the files that may hold compacted rows."""
+        if self.is_legacy or self.explain:
+            return
+        if self.manifest is None:
+            yield self.conn
+            return
+        for path in self._shard_paths(*time_range):
+            conn = open_readonly(path)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def _iter_compacted(
+        self,
+        arbitration_id: str | int | None,
+        time_range: tuple[int | None, int | None],
+        expand: bool = False,
+    ) -> Iterator[tuple]:
+        """
+        Rows moved into can_chunks by compact_database(), only the
+        chunks overlapping time_range are decompressed. With expand set,
+        their repeat counts are looked up in frame_repeats.
+        """
+        for conn in self._compacted_connections(time_range):
+            rows = self._chunk_rows(conn, arbitration_id, time_range)
+            if expand:
+                rows = self._with_repeats(conn, rows)
+            yield from rows
+
+    def _chunk_rows(
+        self,
+        conn: Connection,
+        arbitration_id: str | int | None,
+        time_range: tuple[int | None, int | None],
+        reverse: bool = False,
+    ) -> Iterator[tuple]:
+        if arbitration_id is not None:
+            arbitration_id = self._arbitration_id_param(arbitration_id)
+        return iter_chunk_rows(
+            conn,
+            arbitration_id,
+            *time_range,
+            self.channel,
+            self.has_channel,
+            reverse,
         )
 
-    def get_messages_by_arbitration_id(
-        self, arbitration_id: str
-    ) -> list | None:
-        self._check_connection()
-        return self._execute_query(
-            f"SELECT * FROM {self.tab_name} WHERE arbitration_id = ?",
-            (arbitration_id,),
+    def _compacted_stats(
+        self,
+        arbitration_id: str | int | None,
+        time_range: tuple[int | None, int | None],
+        interval_ns: int | None,
+        where: str,
+        params: tuple,
+    ) -> list[tuple]:
+        """
+        STATS_QUERY partial aggregates of the compacted rows, computed
+        chunk by chunk while they are decompressed. Also counts the gap
+        from the last compacted frame of every stream to its first frame
+        in can_messages.
+        """
+        stats = []
+        for conn in self._compacted_connections(time_range):
+            rows, last = row_stats(
+                self._chunk_rows(conn, arbitration_id, time_range),
+                interval_ns,
+            )
+            if not rows:
+                continue
+            stats.extend(rows)
+            query = FIRST_FRAMES_QUERY.format(
+                channel="channel" if self.has_channel else "NULL",
+                where=where,
+                partition=(
+                    "arbitration_id, channel"
+                    if self.has_channel
+                    else "arbitration_id"
+                ),
+            )
+            for arbitration_id, channel, timestamp_ns, data in conn.execute(
+                query, params
+            ):
+                previous = last.get((arbitration_id, channel))
+                if previous is None:
+                    continue
+                gap = (timestamp_ns - previous[0]) / 1000.0
+                bucket = (
+                    0 if interval_ns is None else timestamp_ns // interval_ns
+                )
+                # One gap and no frames, merge_stats() adds it up
+                stats.append(
+                    (
+                        bucket,
+                        arbitration_id,
+                        0,
+                        1,
+                        gap,
+                        gap * gap,
+                        gap,
+                        gap,
+                        int(data != previous[1]),
+                        None,
+                        None,
+                    )
+                )
+        return stats
+
+    def _with_compacted_tail(
+        self, conn: Connection, rows: list, n: int
+    ) -> list:
+        """Merges the newest n compacted rows into rows, newest first."""
+        if self.is_legacy:
+            return rows
+        tail = islice(
+            self._chunk_rows(conn, None, (None, None), reverse=True), n
         )
+        return sorted([*rows, *tail], reverse=True)[:n]
 
-    def get_messages_by_datetime(
-        self, date: str, hour: int = None, minute: int = None
+    def _with_repeats(
+        self, conn: Connection, rows: Iterable[tuple]
+    ) -> Iterator[tuple]:
+        """Appends the EXPANDED_COLUMNS repeat count and last timestamp."""
+        if not _has_repeats_table(conn):
+            for row in rows:
+                yield row + (None, None)
+            return
+        for row in rows:
+            if self.has_channel:
+                channel = "" if row[8] is None else row[8]
+                params = (row[2], row[3], channel, row[1])
+                repeat = conn.execute(CHUNK_REPEATS_QUERY, params)
+            else:
+                params = (row[2], row[3], row[1])
+                repeat = conn.execute(V2_CHUNK_REPEATS_QUERY, params)
+            yield row + (repeat.fetchone() or (None, None))
+
+    def _get_messages(
+        self,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
     ) -> list | None:
+        """Compacted rows first, then the rows of can_messages."""
+        query, params, time_range = self._messages_query(
+            arbitration_id, date, hour, minute
+        )
+        rows = self._execute_query(query, params, time_range)
+        if rows is None or self.explain:
+            return rows
+        rows = [
+            *self._iter_compacted(arbitration_id, time_range, self._expands),
+            *rows,
+        ]
+        if not self._expands:
+            return rows
+        return list(expand_rows(rows, time_range[1]))
+
+    def _iter_messages(
+        self,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> Iterator[tuple]:
+        query, params, time_range = self._messages_query(
+            arbitration_id, date, hour, minute
+        )
+        rows = chain(
+            self._iter_compacted(arbitration_id, time_range, self._expands),
+            self._iter_query(query, params, time_range),
+        )
+        if not self._expands:
+            return rows
+        return expand_rows(rows, time_range[1])
+
+    def get_suppressed_counts(self) -> list[tuple[int, int, int]]:
+        """
+        (arbitration_id, is_extended_id, count) of the frames a
+        change-only writer dropped, per ID.
+        """
         self._check_connection()
+        if self.manifest is None and not self.has_repeats:
+            return []
+        counts: dict[tuple[int, int], int] = {}
+        for arbitration_id, is_extended_id, count in (
+            self._execute_query(
+                lambda conn: (
+                    SUPPRESSED_COUNTS_QUERY
+                    if _has_repeats_table(conn)
+                    else NO_SUPPRESSED_COUNTS_QUERY
+                )
+            )
+            or []
+        ):
+            key = (arbitration_id, is_extended_id)
+            counts[key] = counts.get(key, 0) + count
+        return [(*key, count) for key, count in sorted(counts.items())]
 
-        if hour is not None and minute is not None:
-            dt_start = datetime.strptime(
-                f"{date} {hour:02d}:{minute:02d}:00", "%Y-%m-%d %H:%M:%S"
+    def _timestamp_range(
+        self, dt_start: datetime, dt_end: datetime, prefix: str = ""
+    ) -> tuple[str, tuple]:
+        """Returns the WHERE clause and parameters for a time range."""
+        if self.is_legacy:
+            return (
+                f"{prefix}timestamp >= ? AND {prefix}timestamp <= ?",
+                (dt_start.timestamp(), dt_end.timestamp()),
             )
-            dt_end = datetime.strptime(
-                f"{date} {hour:02d}:{minute:02d}:59.999999",
-                "%Y-%m-%d %H:%M:%S.%f",
+        return (
+            f"{prefix}timestamp_ns >= ? AND {prefix}timestamp_ns <= ?",
+            (datetime_to_ns(dt_start), datetime_to_ns(dt_end)),
+        )
+
+    def _arbitration_id_param(self, arbitration_id: str | int) -> str | int:
+        if self.is_legacy:
+            if isinstance(arbitration_id, int):
+                return f"{arbitration_id:03X}"
+            return arbitration_id
+        if isinstance(arbitration_id, str):
+            return int(arbitration_id, 16)
+        return arbitration_id
+
+    def _where(
+        self,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+        alias: str = "",
+    ) -> tuple[str, tuple, tuple[int | None, int | None]]:
+        """
+        Returns the WHERE clause, its parameters and the time range.
+        Columns are qualified with alias if given.
+        """
+        prefix = f"{alias}." if alias else ""
+        conditions = []
+        params = ()
+        time_range = (None, None)
+        if arbitration_id is not None:
+            conditions.append(f"{prefix}arbitration_id = ?")
+            params += (self._arbitration_id_param(arbitration_id),)
+        if self.channel is not None:
+            self._check_channel_column()
+            conditions.append(f"{prefix}channel = ?")
+            params += (self.channel,)
+        if date is not None:
+            dt_start, dt_end = datetime_range(date, hour, minute)
+            where, range_params = self._timestamp_range(
+                dt_start, dt_end, prefix
             )
-        elif hour is not None:
-            dt_start = datetime.strptime(
-                f"{date} {hour:02d}:00:00", "%Y-%m-%d %H:%M:%S"
+            conditions.append(where)
+            params += range_params
+            time_range = (datetime_to_ns(dt_start), datetime_to_ns(dt_end))
+
+        if not conditions:
+            return "", params, time_range
+        return "WHERE " + " AND ".join(conditions), params, time_range
+
+    def _messages_query(
+        self,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+        columns: str | None = None,
+    ) -> tuple[
+        str | Callable[[Connection], str],
+        tuple,
+        tuple[int | None, int | None],
+    ]:
+        """
+        Returns the query, its parameters and the time range it covers.
+        Without columns whole rows are selected.
+        """
+        table = self.tab_name
+        expands = columns is None and self._expands
+        where, params, time_range = self._where(
+            arbitration_id, date, hour, minute, "m" if expands else ""
+        )
+        where = f" {where}" if where else ""
+        if expands:
+            source = EXPANDED_FROM if self.has_channel else V2_EXPANDED_FROM
+            query = (
+                "SELECT"
+                f" {EXPANDED_COLUMNS.format(columns=self._row_columns)}"
+                f" FROM {source.format(table=table)}{where}"
             )
-            dt_end = datetime.strptime(
-                f"{date} {hour:02d}:59:59.999999", "%Y-%m-%d %H:%M:%S.%f"
+            if self.manifest is not None:
+                # Shards written without change_only have no frame_repeats
+                unexpanded = (
+                    "SELECT"
+                    f" {UNEXPANDED_COLUMNS.format(columns=self._row_columns)}"
+                    f" FROM {table} m{where}"
+                )
+                return (
+                    lambda conn: (
+                        query if _has_repeats_table(conn) else unexpanded
+                    ),
+                    params,
+                    time_range,
+                )
+            return query, params, time_range
+
+        columns = columns or self._row_columns
+        return f"SELECT {columns} FROM {table}{where}", params, time_range
+
+    def iter_column_chunks(
+        self,
+        columns: str,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> Iterator[list[tuple]]:
+        """
+        Streams the given SQL column expressions of the matching rows in
+        can_messages in fetch_size chunks, see iter_compacted_chunks()
+        for the compacted ones. Not for the legacy layout.
+        """
+        self._check_connection()
+        if self.is_legacy:
+            raise RuntimeError(
+                f"{self.db_path} uses the legacy layout, run --mode migrate"
+                " first."
             )
-        else:
-            dt_start = datetime.strptime(
-                f"{date} 00:00:00", "%Y-%m-%d %H:%M:%S"
+        query, params, time_range = self._messages_query(
+            arbitration_id, date, hour, minute, columns=columns
+        )
+        return self._iter_chunks(query, params, time_range)
+
+    def iter_compacted_chunks(
+        self,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> Iterator[list[tuple]]:
+        """
+        Streams the matching compacted rows, unexpanded and in the
+        can_messages layout, in fetch_size chunks as they are
+        decompressed.
+        """
+        self._check_connection()
+        _, _, time_range = self._where(arbitration_id, date, hour, minute)
+        rows = self._iter_compacted(arbitration_id, time_range)
+        while chunk := list(islice(rows, self.fetch_size)):
+            yield chunk
+
+    def _signal_query(
+        self,
+        signal: str,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> tuple[str, tuple, tuple[int | None, int | None]]:
+        """
+        Query of the materialized values of "Message.Signal" (or of every
+        signal with that name), an index range read on idx_signals_id_ts.
+        """
+        if self.is_legacy:
+            raise RuntimeError(
+                f"{self.db_path} uses the legacy layout, run --mode migrate"
+                " first."
             )
-            dt_end = datetime.strptime(
-                f"{date} 23:59:59.999999", "%Y-%m-%d %H:%M:%S.%f"
+        message, _, name = signal.rpartition(".")
+        if message:
+            query = (
+                "SELECT timestamp_ns, value FROM signals WHERE signal_id IN"
+                " (SELECT id FROM signal_names WHERE message = ? AND signal = ?)"
             )
+            params = (message, name)
+        else:
+            query = (
+                "SELECT timestamp_ns, value FROM signals WHERE signal_id IN"
+                " (SELECT id FROM signal_names WHERE signal = ?)"
+            )
+            params = (name,)
 
-        ts_start = dt_start.timestamp()
-        ts_end = dt_end.timestamp()
+        time_range = (None, None)
+        if date is not None:
+            dt_start, dt_end = datetime_range(date, hour, minute)
+            time_range = (datetime_to_ns(dt_start), datetime_to_ns(dt_end))
+            query += " AND timestamp_ns >= ? AND timestamp_ns <= ?"
+            params += time_range
+        return query + " ORDER BY timestamp_ns", params, time_range
 
+    def get_signal_values(
+        self,
+        signal: str,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> list | None:
+        """(timestamp_ns, value) rows of a signal, see backfill_signals()."""
+        self._check_connection()
         return self._execute_query(
-            f"SELECT * FROM {self.tab_name} WHERE timestamp >= ? AND timestamp <= ?",
-            (ts_start, ts_end),
+            *self._signal_query(signal, date, hour, minute)
+        )
+
+    def iter_signal_values(
+        self,
+        signal: str,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> Iterator[tuple]:
+        self._check_connection()
+        return chain.from_iterable(
+            self._iter_chunks(*self._signal_query(signal, date, hour, minute))
+        )
+
+    def get_frame_stats(
+        self,
+        interval: float | None = None,
+        arbitration_id: str | int | None = None,
+        date: str | None = None,
+        hour: int = None,
+        minute: int = None,
+    ) -> list[FrameStats] | None:
+        """
+        Per-ID statistics in buckets of interval seconds (aligned to the
+        epoch), or over the whole range if interval is None. Computed by
+        SQLite, compacted rows in Python as their chunks are read. Gaps
+        and payload changes across shard boundaries are not counted.
+        """
+        self._check_connection()
+        if self.is_legacy:
+            raise RuntimeError(
+                f"{self.db_path} uses the legacy layout, run --mode migrate"
+                " first."
+            )
+
+        interval_ns = None if interval is None else round(interval * 1e9)
+        where, params, time_range = self._where(
+            arbitration_id, date, hour, minute
+        )
+        query = STATS_QUERY.format(
+            bucket="0" if interval_ns is None else "timestamp_ns / ?",
+            where=where,
+            # The same ID on two buses is two streams
+            partition=(
+                "arbitration_id, channel"
+                if self.has_channel
+                else "arbitration_id"
+            ),
+        )
+        stats_params = (
+            params if interval_ns is None else (interval_ns, *params)
         )
+
+        rows = self._execute_query(query, stats_params, time_range)
+        if rows is None or self.explain:
+            return rows
+        rows += self._compacted_stats(
+            arbitration_id, time_range, interval_ns, where, params
+        )
+        return merge_stats(rows, interval_ns)
+
+    def get_all_messages(self) -> list | None:
+        self._check_connection()
+        return self._get_messages()
+
+    def iter_all_messages(self) -> Iterator[tuple]:
+        self._check_connection()
+        return self._iter_messages()
+
+    def get_last_n_messages(self, n: int) -> list | None:
+        self._check_connection()
+        query = f"SELECT {self._row_columns} FROM {self.tab_name}"
+        params = ()
+        if self.channel is not None:
+            self._check_channel_column()
+            query += " WHERE channel = ?"
+            params = (self.channel,)
+        query += " ORDER BY id DESC LIMIT ?"
+        if self.manifest is None or self.explain:
+            rows = self._execute_query(query, (*params, n))
+            if rows is None or self.explain:
+                return rows
+            return self._with_compacted_tail(self.conn, rows, n)
+
+        # Newest shards first, stop as soon as n rows were collected
+        rows = []
+        for path in reversed(self._shard_paths()):
+            conn = open_readonly(path)
+            try:
+                need = n - len(rows)
+                shard_rows = conn.execute(query, (*params, need)).fetchall()
+                rows.extend(self._with_compacted_tail(conn, shard_rows, need))
+            finally:
+                conn.close()
+            if len(rows) >= n:
+                break
+        return rows
+
+    def get_messages_by_arbitration_id(
+        self, arbitration_id: str | int
+    ) -> list | None:
+        self._check_connection()
+        return self._get_messages(arbitration_id)
+
+    def iter_messages_by_arbitration_id(
+        self, arbitration_id: str | int
+    ) -> Iterator[tuple]:
+        self._check_connection()
+        return self._iter_messages(arbitration_id)
+
+    def get_messages_by_datetime(
+        self, date: str, hour: int = None, minute: int = None
+    ) -> list | None:
+        self._check_connection()
+        return self._get_messages(None, date, hour, minute)
+
+    def iter_messages_by_datetime(
+        self, date: str, hour: int = None, minute: int = None
+    ) -> Iterator[tuple]:
+        self._check_connection()
+        return self._iter_messages(None, date, hour, minute)
+
+    def get_messages_by_arbitration_id_and_datetime(
+        self,
+        arbitration_id: str | int,
+        date: str,
+        hour: int = None,
+        minute: int = None,
+    ) -> list | None:
+        """Served by the (arbitration_id, timestamp_ns) index if present."""
+        self._check_connection()
+        return self._get_messages(arbitration_id, date, hour, minute)
+
+    def iter_messages_by_arbitration_id_and_datetime(
+        self,
+        arbitration_id: str | int,
+        date: str,
+        hour: int = None,
+        minute: int = None,
+    ) -> Iterator[tuple]:
+        self._check_connection()
+        return self._iter_messages(arbitration_id, date, hour, minute)
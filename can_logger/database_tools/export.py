@@ -0,0 +1,195 @@
+import contextlib
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the columnar export
+    np = None
+
+from can_logger.database_tools.database_interface import DatabaseInterface
+
+# CAN-FD payloads are at most 64 bytes, shorter ones are zero padded
+PAYLOAD_WIDTH = 64
+
+FLAG_EXTENDED_ID = 0x01
+FLAG_FD = 0x02
+FLAG_ERROR_FRAME = 0x04
+
+# Flags are packed and payloads padded by SQLite, so a chunk is turned
+# into arrays without looking at single rows in Python.
+EXPORT_COLUMNS = (
+    "timestamp_ns, arbitration_id, dlc,"
+    " is_extended_id | (is_fd << 1) | (is_error_frame << 2),"
+    f" CAST(data || zeroblob({PAYLOAD_WIDTH} - length(data)) AS BLOB)"
+)
+
+COLUMNS = (
+    "timestamp_ns",
+    "timestamp",
+    "arbitration_id",
+    "dlc",
+    "flags",
+    "data",
+)
+
+
+def export_row(row: tuple) -> tuple:
+    """
+    Converts a row in the can_messages layout, as decompressed from
+    can_chunks, to the EXPORT_COLUMNS shape.
+    """
+    flags = row[3] | (row[6] << 1) | (row[7] << 2)
+    return (*row[1:3], row[4], flags, row[5].ljust(PAYLOAD_WIDTH, b"\0"))
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError(
+            "The columnar export needs numpy, install it with"
+            " `pip install numpy`."
+        )
+
+
+def _column_dtypes() -> dict[str, "np.dtype"]:
+    return {
+        "timestamp_ns": np.dtype(np.int64),
+        "timestamp": np.dtype(np.float64),
+        "arbitration_id": np.dtype(np.uint32),
+        "dlc": np.dtype(np.uint8),
+        "flags": np.dtype(np.uint8),
+        "data": np.dtype(np.uint8),
+    }
+
+
+def rows_to_columns(rows: list[tuple]) -> dict[str, "np.ndarray"]:
+    """
+    Converts rows selected with EXPORT_COLUMNS to arrays: timestamp_ns
+    (int64), timestamp (float64 seconds), arbitration_id (uint32), dlc
+    (uint8), flags (uint8, see FLAG_*) and data (uint8, n x PAYLOAD_WIDTH).
+    """
+    _require_numpy()
+    count = len(rows)
+    if count == 0:
+        return empty_columns()
+
+    timestamp_ns, arbitration_id, dlc, flags, data = zip(*rows)
+    timestamp_ns = np.fromiter(timestamp_ns, np.int64, count)
+    return {
+        "timestamp_ns": timestamp_ns,
+        "timestamp": timestamp_ns / 1e9,
+        "arbitration_id": np.fromiter(arbitration_id, np.uint32, count),
+        "dlc": np.fromiter(dlc, np.uint8, count),
+        "flags": np.fromiter(flags, np.uint8, count),
+        "data": np.frombuffer(bytearray(b"".join(data)), np.uint8).reshape(
+            count, PAYLOAD_WIDTH
+        ),
+    }
+
+
+def empty_columns() -> dict[str, "np.ndarray"]:
+    _require_numpy()
+    columns = {
+        name: np.empty(0, dtype) for name, dtype in _column_dtypes().items()
+    }
+    columns["data"] = columns["data"].reshape(0, PAYLOAD_WIDTH)
+    return columns
+
+
+def iter_frame_columns(
+    db_interface: DatabaseInterface,
+    arbitration_id: str | int | None = None,
+    date: str | None = None,
+    hour: int = None,
+    minute: int = None,
+) -> Iterator[dict[str, "np.ndarray"]]:
+    """
+    Yields the matching frames as column arrays, one chunk of
+    db_interface.fetch_size frames at a time, compacted ones first.
+    """
+    _require_numpy()
+    live_chunks = db_interface.iter_column_chunks(
+        EXPORT_COLUMNS, arbitration_id, date, hour, minute
+    )
+    for rows in db_interface.iter_compacted_chunks(
+        arbitration_id, date, hour, minute
+    ):
+        yield rows_to_columns([export_row(row) for row in rows])
+    for rows in live_chunks:
+        yield rows_to_columns(rows)
+
+
+def load_frame_columns(
+    db_interface: DatabaseInterface,
+    arbitration_id: str | int | None = None,
+    date: str | None = None,
+    hour: int = None,
+    minute: int = None,
+) -> dict[str, "np.ndarray"]:
+    """Loads the matching frames into memory, see rows_to_columns()."""
+    chunks = list(
+        iter_frame_columns(db_interface, arbitration_id, date, hour, minute)
+    )
+    if not chunks:
+        return empty_columns()
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks])
+        for name in COLUMNS
+    }
+
+
+def export_npz(
+    db_interface: DatabaseInterface,
+    output_path: str | Path,
+    arbitration_id: str | int | None = None,
+    date: str | None = None,
+    hour: int = None,
+    minute: int = None,
+) -> int:
+    """
+    Writes the matching frames to an .npz archive readable with np.load().
+
+    Chunks are appended to temporary raw column files and only copied
+    into the archive at the end, so memory use stays bounded by the chunk
+    size however large the range is. Returns the number of frames.
+    """
+    _require_numpy()
+    output_path = Path(output_path)
+    dtypes = _column_dtypes()
+    count = 0
+
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as tmp_dir:
+        raw_paths = {name: Path(tmp_dir) / f"{name}.raw" for name in COLUMNS}
+        with contextlib.ExitStack() as stack:
+            raw_files = {
+                name: stack.enter_context(open(path, "wb"))
+                for name, path in raw_paths.items()
+            }
+            for columns in iter_frame_columns(
+                db_interface, arbitration_id, date, hour, minute
+            ):
+                for name in COLUMNS:
+                    raw_files[name].write(columns[name].tobytes())
+                count += len(columns["timestamp_ns"])
+
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_STORED) as archive:
+            for name in COLUMNS:
+                shape = (count, PAYLOAD_WIDTH) if name == "data" else (count,)
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array_header_1_0(
+                        f,
+                        {
+                            "descr": np.lib.format.dtype_to_descr(
+                                dtypes[name]
+                            ),
+                            "fortran_order": False,
+                            "shape": shape,
+                        },
+                    )
+                    with open(raw_paths[name], "rb") as raw_file:
+                        shutil.copyfileobj(raw_file, f)
+
+    return count
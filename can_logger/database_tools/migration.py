@@ -0,0 +1,120 @@
+import sqlite3
+from pathlib import Path
+
+from can_logger.change_only import CREATE_REPEATS_TABLE_QUERY
+from can_logger.database import (
+    CREATE_TABLE_QUERY,
+    SCHEMA_INFO_QUERY,
+    SCHEMA_VERSION,
+    SET_SCHEMA_VERSION_QUERY,
+    V2_SCHEMA_VERSION,
+)
+from can_logger.database_tools.compaction import (
+    CHUNKS_TABLE_QUERY,
+    CREATE_CHUNKS_TABLE_QUERIES,
+)
+
+# Unique index of the v2 can_chunks table, without the channel
+V2_CHUNKS_INDEX = "idx_can_chunks_id_block"
+
+MIGRATE_V1_ROWS_QUERY = """
+    INSERT INTO can_messages (
+        id, timestamp_ns, arbitration_id, is_extended_id, dlc, data, is_fd,
+        is_error_frame
+    )
+    SELECT
+        id,
+        CAST(round(timestamp * 1000000000) AS INTEGER),
+        hex_to_int(arbitration_id),
+        hex_to_int(arbitration_id) > 2047,
+        dlc,
+        hex_to_blob(data),
+        is_fd,
+        is_error_frame
+    FROM can_messages_v1
+"""
+
+MIGRATE_REPEATS_QUERY = """
+    INSERT INTO frame_repeats (
+        timestamp_ns, arbitration_id, is_extended_id, count,
+        last_timestamp_ns
+    )
+    SELECT timestamp_ns, arbitration_id, is_extended_id, count,
+        last_timestamp_ns
+    FROM frame_repeats_v2
+"""
+
+
+def _hex_to_int(value: str | None) -> int | None:
+    return None if value is None else int(value, 16)
+
+
+def _hex_to_blob(value: str | None) -> bytes | None:
+    return None if value is None else bytes.fromhex(value)
+
+
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    conn.create_function("hex_to_int", 1, _hex_to_int, deterministic=True)
+    conn.create_function("hex_to_blob", 1, _hex_to_blob, deterministic=True)
+    conn.execute("ALTER TABLE can_messages RENAME TO can_messages_v1")
+    conn.execute(CREATE_TABLE_QUERY)
+    conn.execute(MIGRATE_V1_ROWS_QUERY)
+    conn.execute("DROP TABLE can_messages_v1")
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    """Adds the channel columns, NULL for existing rows."""
+    conn.execute("ALTER TABLE can_messages ADD COLUMN channel TEXT")
+    if conn.execute(CHUNKS_TABLE_QUERY).fetchone()[0]:
+        conn.execute("ALTER TABLE can_chunks ADD COLUMN channel TEXT")
+        conn.execute(f"DROP INDEX IF EXISTS {V2_CHUNKS_INDEX}")
+        for query in CREATE_CHUNKS_TABLE_QUERIES:
+            conn.execute(query)
+
+
+def _migrate_repeats(conn: sqlite3.Connection) -> None:
+    """Rebuilds frame_repeats with the channel in its key, empty so far."""
+    columns = [
+        row[1] for row in conn.execute("PRAGMA table_info(frame_repeats)")
+    ]
+    if not columns or "channel" in columns:
+        return
+    conn.execute("ALTER TABLE frame_repeats RENAME TO frame_repeats_v2")
+    conn.execute(CREATE_REPEATS_TABLE_QUERY)
+    conn.execute(MIGRATE_REPEATS_QUERY)
+    conn.execute("DROP TABLE frame_repeats_v2")
+
+
+def migrate_database(db_path: str | Path, vacuum: bool = True) -> bool:
+    """
+    Converts an older can_messages table to the v3 layout in place: v1
+    tables (hex TEXT columns) are rewritten with their row ids preserved,
+    v2 tables only get the channel column. frame_repeats is rebuilt with
+    the channel in its key. Returns False if there was nothing to
+    migrate.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        version, table_exists = conn.execute(SCHEMA_INFO_QUERY).fetchone()
+        if not table_exists or version >= SCHEMA_VERSION:
+            return False
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version < V2_SCHEMA_VERSION:
+                _migrate_v1(conn)
+            else:
+                _migrate_v2(conn)
+            _migrate_repeats(conn)
+            conn.execute(SET_SCHEMA_VERSION_QUERY)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if vacuum and version < V2_SCHEMA_VERSION:
+            # Reclaim the pages freed by the much larger v1 rows
+            conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
@@ -0,0 +1,37 @@
+import sqlite3
+from pathlib import Path
+
+from can_logger.database import (
+    SCHEMA_INFO_QUERY,
+    check_schema_version,
+    create_indexes,
+)
+from can_logger.sharding import ShardManifest, is_sharded
+
+
+def database_files(db_path: str | Path) -> list[Path]:
+    """The database file itself, or every shard of a sharded database."""
+    if is_sharded(db_path):
+        return [
+            path
+            for path in ShardManifest.load(db_path).shards_overlapping()
+            if path.exists()
+        ]
+    return [Path(db_path)]
+
+
+def optimize_database(db_path: str | Path) -> list[Path]:
+    """
+    Creates the query indexes and planner statistics. Index creation
+    holds the write lock, so run it on rotated shards or while the logger
+    is stopped. Returns the files that were optimized.
+    """
+    paths = database_files(db_path)
+    for path in paths:
+        conn = sqlite3.connect(path)
+        try:
+            check_schema_version(*conn.execute(SCHEMA_INFO_QUERY).fetchone())
+        finally:
+            conn.close()
+        create_indexes(path)
+    return paths
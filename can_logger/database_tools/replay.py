@@ -0,0 +1,119 @@
+import time
+from typing import Iterable, NamedTuple
+
+import can
+
+from can_logger.database_tools.database_interface import (
+    DatabaseInterface,
+    row_to_message,
+)
+
+DEFAULT_TIME_SCALE = 1.0
+# Frames due less than this far ahead are sent right away, so bursts go
+# out back to back instead of sleeping between every frame
+MIN_SLEEP = 0.001
+SEND_TIMEOUT = 1.0
+
+
+class ReplayStats(NamedTuple):
+    frames: int
+    failed: int
+    elapsed: float
+    recorded: float
+    time_scale: float
+    max_lag: float
+
+    @property
+    def rate(self) -> float:
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def target_rate(self) -> float | None:
+        """The recorded rate scaled by time_scale, None if unbounded."""
+        if not self.time_scale or not self.recorded:
+            return None
+        return (self.frames + self.failed) * self.time_scale / self.recorded
+
+
+def iter_replay_rows(
+    db_interface: DatabaseInterface,
+    arbitration_id: str | None = None,
+    date: str | None = None,
+    hour: int | None = None,
+    minute: int | None = None,
+) -> Iterable[tuple]:
+    """Streams the rows selected by ID and/or time range."""
+    if arbitration_id is not None and date:
+        return db_interface.iter_messages_by_arbitration_id_and_datetime(
+            arbitration_id, date, hour, minute
+        )
+    if arbitration_id is not None:
+        return db_interface.iter_messages_by_arbitration_id(arbitration_id)
+    if date:
+        return db_interface.iter_messages_by_datetime(date, hour, minute)
+    return db_interface.iter_all_messages()
+
+
+def replay_messages(
+    bus: can.BusABC,
+    rows: Iterable[tuple],
+    time_scale: float = DEFAULT_TIME_SCALE,
+) -> ReplayStats:
+    """
+    Sends v3 layout rows onto bus with their recorded timing.
+
+    Every frame is scheduled at its offset from the first frame divided
+    by time_scale (2.0 replays twice as fast, 0 as fast as possible).
+    Deadlines are absolute, so sleeping or a slow send() never adds up to
+    drift, and frames closer together than MIN_SLEEP are sent in one
+    burst. max_lag is the latest a frame went out after its deadline.
+    """
+    frames = failed = 0
+    first_ns = last_ns = None
+    max_lag = 0.0
+    start = time.perf_counter()
+    for row in rows:
+        message = row_to_message(row)
+        timestamp_ns = row[1]
+        if first_ns is None:
+            first_ns = timestamp_ns
+        last_ns = timestamp_ns
+        if time_scale:
+            due = start + (timestamp_ns - first_ns) / 1e9 / time_scale
+            delay = due - time.perf_counter()
+            if delay >= MIN_SLEEP:
+                time.sleep(delay)
+        try:
+            bus.send(message, SEND_TIMEOUT)
+            frames += 1
+        except can.CanError:
+            failed += 1
+        if time_scale:
+            max_lag = max(max_lag, time.perf_counter() - due)
+
+    recorded = 0.0 if first_ns is None else (last_ns - first_ns) / 1e9
+    return ReplayStats(
+        frames,
+        failed,
+        time.perf_counter() - start,
+        recorded,
+        time_scale,
+        max_lag,
+    )
+
+
+def format_replay_stats(stats: ReplayStats) -> str:
+    target = (
+        "as fast as possible"
+        if stats.target_rate is None
+        else f"target {stats.target_rate:.0f} frames/s"
+    )
+    text = (
+        f"Replayed {stats.frames} frames in {stats.elapsed:.3f} s:"
+        f" {stats.rate:.0f} frames/s, {target}"
+    )
+    if stats.time_scale:
+        text += f", max lag {stats.max_lag * 1000:.1f} ms"
+    if stats.failed:
+        text += f", {stats.failed} failed sends"
+    return text + "."
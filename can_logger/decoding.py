@@ -0,0 +1,196 @@
+import functools
+import struct
+from pathlib import Path
+from typing import Callable
+
+import can
+import cantools
+from cantools.database.can import Database, Message
+from cantools.database.utils import create_encode_decode_formats
+
+from can_logger.receive import CAN_EFF_FLAG
+
+DecodedSignals = dict[str, int | float | str]
+FrameDecoder = Callable[[bytes], DecodedSignals]
+
+# struct codes of byte aligned integer (by signedness) and float signals
+STRUCT_INTEGER_CODES = {
+    8: ("B", "b"),
+    16: ("H", "h"),
+    32: ("I", "i"),
+    64: ("Q", "q"),
+}
+STRUCT_FLOAT_CODES = {32: "f", 64: "d"}
+
+
+def decoder_key(arbitration_id: int, is_extended_id: bool) -> int:
+    """Standard and extended IDs with the same value are distinct."""
+    return arbitration_id | CAN_EFF_FLAG if is_extended_id else arbitration_id
+
+
+def _signal_struct_code(signal) -> tuple[int, str] | None:
+    """Byte offset and struct code of a byte aligned signal, else None."""
+    if signal.byte_order == "little_endian":
+        if signal.start % 8:
+            return None
+        offset = signal.start // 8
+    else:
+        # Motorola signals start at the most significant bit
+        if signal.start % 8 != 7:
+            return None
+        offset = signal.start // 8
+
+    if signal.conversion.is_float:
+        code = STRUCT_FLOAT_CODES.get(signal.length)
+    else:
+        codes = STRUCT_INTEGER_CODES.get(signal.length)
+        code = codes and codes[signal.is_signed]
+    if code is None:
+        return None
+    return offset, code
+
+
+def _compile_struct(message: Message) -> tuple[struct.Struct, list] | None:
+    """
+    A single struct.Struct unpacking all signals of the message, if they
+    are byte aligned, share one byte order and do not overlap.
+    """
+    byte_orders = {signal.byte_order for signal in message.signals}
+    if len(byte_orders) != 1:
+        return None
+
+    fields = []
+    for signal in message.signals:
+        field = _signal_struct_code(signal)
+        if field is None:
+            return None
+        fields.append((*field, signal.name))
+    fields.sort()
+
+    fmt = "<" if byte_orders == {"little_endian"} else ">"
+    position = 0
+    for offset, code, _ in fields:
+        if offset < position:
+            return None
+        fmt += "x" * (offset - position) + code
+        position = offset + struct.calcsize(f"<{code}")
+    if position > message.length:
+        return None
+    return struct.Struct(fmt), [name for _, _, name in fields]
+
+
+def compile_decoder(
+    message: Message, decode_choices: bool = True
+) -> FrameDecoder:
+    """
+    Builds the fastest decoder for the message: a struct.Struct when all
+    signals are byte aligned, a precompiled bitstruct format otherwise,
+    and cantools itself for multiplexed messages or short payloads.
+    """
+    fallback = functools.partial(
+        message.decode_simple,
+        decode_choices=decode_choices,
+        allow_truncated=True,
+    )
+    if message.is_multiplexed():
+        return fallback
+
+    linear = []
+    converters = []
+    for signal in message.signals:
+        conversion = signal.conversion
+        if conversion.choices:
+            converters.append((signal.name, conversion.raw_to_scaled))
+        elif conversion.scale != 1 or conversion.offset != 0:
+            linear.append((signal.name, conversion.scale, conversion.offset))
+
+    length = message.length
+    compiled = _compile_struct(message)
+    if compiled is not None:
+        unpacker, names = compiled
+        unpack_from = unpacker.unpack_from
+
+        def unpack(data: bytes) -> dict:
+            return dict(zip(names, unpack_from(data)))
+
+    else:
+        formats = create_encode_decode_formats(message.signals, length)
+        unpack_big = formats.big_endian.unpack
+        unpack_little = formats.little_endian.unpack
+
+        def unpack(data: bytes) -> dict:
+            data = data[:length]
+            values = unpack_big(data)
+            values.update(unpack_little(data[::-1]))
+            return values
+
+    def decode(data: bytes) -> DecodedSignals:
+        if len(data) < length:
+            return fallback(data)
+        values = unpack(data)
+        for name, scale, offset in linear:
+            values[name] = values[name] * scale + offset
+        for name, convert in converters:
+            values[name] = convert(values[name], decode_choices)
+        return values
+
+    return decode
+
+
+class SignalDecoder:
+    """
+    Decodes frames into named signals with a DBC (or any other format
+    cantools reads) database.
+
+    Every message of the database is compiled once into a decoder and
+    cached by arbitration ID, so decoding a frame costs a dict lookup
+    plus an unpack. Frames with IDs the database does not know cost a
+    single failed lookup. Frames that fail to decode are counted in
+    errors and skipped.
+    """
+
+    def __init__(self, database: Database, decode_choices: bool = True):
+        self.database: Database = database
+        self.errors: int = 0
+        self._decoders: dict[int, tuple[str, FrameDecoder]] = {
+            decoder_key(message.frame_id, message.is_extended_frame): (
+                message.name,
+                compile_decoder(message, decode_choices),
+            )
+            for message in database.messages
+            if not message.is_container
+        }
+
+    @classmethod
+    def from_file(cls, path: str | Path, **kwargs) -> "SignalDecoder":
+        return cls(cantools.database.load_file(path), **kwargs)
+
+    def decode(
+        self, arbitration_id: int, data: bytes, is_extended_id: bool = False
+    ) -> tuple[str, DecodedSignals] | None:
+        """Returns the message name and its signals, None if unknown."""
+        entry = self._decoders.get(
+            arbitration_id | CAN_EFF_FLAG if is_extended_id else arbitration_id
+        )
+        if entry is None:
+            return None
+        name, decode = entry
+        try:
+            return name, decode(data)
+        except (cantools.database.DecodeError, ValueError, KeyError):
+            self.errors += 1
+            return None
+
+    def decode_message(
+        self, msg: can.Message
+    ) -> tuple[str, DecodedSignals] | None:
+        return self.decode(msg.arbitration_id, msg.data, msg.is_extended_id)
+
+    def decode_row(self, row: tuple) -> tuple[str, DecodedSignals] | None:
+        """Decodes a v3 layout database row."""
+        return self.decode(row[2], row[5], row[3])
+
+
+def format_signals(name: str, signals: DecodedSignals) -> str:
+    values = " ".join(f"{key}={value}" for key, value in signals.items())
+    return f"    {name}: {values}"
@@ -0,0 +1,168 @@
+import asyncio
+import contextlib
+import sys
+from collections import deque
+
+import can
+
+from can_logger.callbacks import AsyncCanBatchCallback, AsyncCanMessageCallback
+
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_MAX_BATCH = 1_000
+DEFAULT_DRAIN_TIMEOUT = 5.0
+
+
+class Subscriber:
+    """
+    A receive callback with its own bounded batch queue and long-lived
+    consumer.
+
+    Published batches are queued as they are, without copying or
+    touching every frame. The consumer takes whatever is queued (up to
+    max_batch frames) in one go and hands it to the callback, in arrival
+    order. Batch-aware callbacks get the whole list, plain callbacks are
+    awaited per frame. Callbacks must not modify the lists, they are
+    shared between subscribers.
+
+    When queue_size frames are queued, new frames are dropped and
+    counted, unless block is set, in which case publishing waits until
+    there is room again (backpressure).
+    """
+
+    def __init__(
+        self,
+        callback: AsyncCanMessageCallback | AsyncCanBatchCallback,
+        batch: bool = False,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        block: bool = False,
+    ):
+        self.callback = callback
+        self.batch: bool = batch
+        self.queue_size: int = queue_size
+        self.max_batch: int = max_batch
+        self.block: bool = block
+        # Frames queued, not counting the batch being delivered
+        self.pending: int = 0
+        self.dropped: int = 0
+        self.task: asyncio.Task | None = None
+
+        self._batches: deque[list[can.Message]] = deque()
+        self._queued: asyncio.Event = asyncio.Event()
+        self._room: asyncio.Event = asyncio.Event()
+        self._idle: asyncio.Event = asyncio.Event()
+        self._idle.set()
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._consume())
+
+    async def put(self, messages: list[can.Message]) -> None:
+        if self.block:
+            # The batch is queued whole, so the queue can exceed
+            # queue_size by less than one batch
+            while self.pending >= self.queue_size:
+                self._room.clear()
+                await self._room.wait()
+        else:
+            room = self.queue_size - self.pending
+            if room < len(messages):
+                self.dropped += len(messages) - max(room, 0)
+                messages = messages[: max(room, 0)]
+
+        if messages:
+            self._batches.append(messages)
+            self.pending += len(messages)
+            self._queued.set()
+            self._idle.clear()
+
+    def _take(self) -> list[can.Message]:
+        """Removes up to max_batch frames from the queue."""
+        batches = self._batches
+        batch = batches.popleft()
+        if len(batch) > self.max_batch:
+            batches.appendleft(batch[self.max_batch :])
+            batch = batch[: self.max_batch]
+        elif batches and len(batch) + len(batches[0]) <= self.max_batch:
+            batch = list(batch)
+            while batches and len(batch) + len(batches[0]) <= self.max_batch:
+                batch.extend(batches.popleft())
+        if not batches:
+            self._queued.clear()
+        self.pending -= len(batch)
+        self._room.set()
+        return batch
+
+    async def _consume(self) -> None:
+        while True:
+            await self._queued.wait()
+            batch = self._take()
+            try:
+                if self.batch:
+                    await self._deliver(batch)
+                else:
+                    for message in batch:
+                        await self._deliver(message)
+            finally:
+                if not self._batches:
+                    self._idle.set()
+
+    async def _deliver(self, payload) -> None:
+        try:
+            await self.callback(payload)
+        except Exception as e:
+            print(f"Error in receive callback: {e}", file=sys.stderr)
+
+    async def stop(self, drain_timeout: float | None = None) -> None:
+        """Stops the consumer, first waiting for the queue to drain."""
+        if self.task is None:
+            return
+
+        if drain_timeout:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._idle.wait(), drain_timeout)
+
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+        self.task = None
+
+
+class Dispatcher:
+    """Fans received frames out to independent subscribers."""
+
+    def __init__(self):
+        self.subscribers: list[Subscriber] = []
+
+    def subscribe(self, callback, **kwargs) -> Subscriber:
+        subscriber = Subscriber(callback, **kwargs)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, callback) -> None:
+        for subscriber in list(self.subscribers):
+            if subscriber.callback is callback:
+                self.subscribers.remove(subscriber)
+                if subscriber.task is not None:
+                    subscriber.task.cancel()
+
+    async def publish(self, messages: list[can.Message]) -> None:
+        for subscriber in self.subscribers:
+            if subscriber.task is None:
+                subscriber.start()
+            await subscriber.put(messages)
+
+    @property
+    def dropped(self) -> int:
+        return sum(subscriber.dropped for subscriber in self.subscribers)
+
+    async def close(
+        self, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT
+    ) -> None:
+        """Delivers everything still queued, then stops all consumers."""
+        await asyncio.gather(
+            *(
+                subscriber.stop(drain_timeout)
+                for subscriber in self.subscribers
+            )
+        )
@@ -0,0 +1,50 @@
+import click
+from can.typechecking import CanFilter
+
+from can_logger.receive import CAN_EFF_MASK, CAN_SFF_MASK
+
+
+def parse_can_filter(text: str) -> CanFilter:
+    """
+    Parses a candump-style ID:MASK filter into a python-can filter.
+
+    A frame passes when its ID AND MASK equals ID AND MASK. The mask
+    defaults to an exact match. IDs written with more than three hex
+    digits (e.g. 00000123:1FFFFFFF) or above 0x7FF only match extended
+    frames, the others only standard frames.
+    """
+    can_id_str, _, can_mask_str = text.strip().partition(":")
+    try:
+        can_id = int(can_id_str, 16)
+        can_mask = int(can_mask_str, 16) if can_mask_str else None
+    except ValueError:
+        raise ValueError(
+            f"Invalid CAN filter {text!r}, expected ID:MASK"
+        ) from None
+
+    extended = len(can_id_str) > 3 or can_id > CAN_SFF_MASK
+    id_mask = CAN_EFF_MASK if extended else CAN_SFF_MASK
+    if can_id > id_mask or (can_mask is not None and can_mask > id_mask):
+        raise ValueError(f"CAN filter {text!r} exceeds {id_mask:X}")
+    return {
+        "can_id": can_id,
+        "can_mask": id_mask if can_mask is None else can_mask,
+        "extended": extended,
+    }
+
+
+class CanFilterParam(click.ParamType):
+    """click type of the --filter options."""
+
+    name = "ID:MASK"
+
+    def convert(self, value, param, ctx) -> CanFilter:
+        if isinstance(value, dict):
+            return value
+        try:
+            return parse_can_filter(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+CAN_FILTER = CanFilterParam()
@@ -0,0 +1,68 @@
+import struct
+
+import can
+
+from can_logger.receive import (
+    CAN_EFF_FLAG,
+    CAN_EFF_MASK,
+    CAN_ERR_FLAG,
+    CAN_RTR_FLAG,
+    CAN_SFF_MASK,
+    CANFD_BRS,
+    CANFD_ESI,
+)
+
+# Marks CAN-FD frames in the flags byte, next to CANFD_BRS and CANFD_ESI
+BINARY_FD_FLAG = 0x80
+
+# Fixed-size frame record of the ring buffer and the segment files:
+# timestamp in ns, can_id and CAN-FD flags (see frame_flags), payload
+# length, channel number and the zero padded payload
+FRAME_RECORD = struct.Struct("<qIBBB64s")
+NO_CHANNEL = 0xFF
+
+
+def frame_flags(message: can.Message) -> tuple[int, int]:
+    """The can_id with its EFF/RTR/ERR flags and the CAN-FD flags."""
+    can_id = message.arbitration_id
+    if message.is_extended_id:
+        can_id |= CAN_EFF_FLAG
+    if message.is_remote_frame:
+        can_id |= CAN_RTR_FLAG
+    if message.is_error_frame:
+        can_id |= CAN_ERR_FLAG
+    flags = 0
+    if message.is_fd:
+        flags = BINARY_FD_FLAG
+        if message.bitrate_switch:
+            flags |= CANFD_BRS
+        if message.error_state_indicator:
+            flags |= CANFD_ESI
+    return can_id, flags
+
+
+def unpack_message(
+    timestamp_ns: int,
+    can_id: int,
+    flags: int,
+    data: bytes,
+    channel: str | None = None,
+) -> can.Message:
+    """Inverse of frame_flags()."""
+    is_extended_id = bool(can_id & CAN_EFF_FLAG)
+    is_fd = bool(flags & BINARY_FD_FLAG)
+    return can.Message(
+        timestamp=timestamp_ns / 1_000_000_000,
+        channel=channel,
+        arbitration_id=can_id
+        & (CAN_EFF_MASK if is_extended_id else CAN_SFF_MASK),
+        is_extended_id=is_extended_id,
+        is_remote_frame=bool(can_id & CAN_RTR_FLAG),
+        is_error_frame=bool(can_id & CAN_ERR_FLAG),
+        is_fd=is_fd,
+        bitrate_switch=is_fd and bool(flags & CANFD_BRS),
+        error_state_indicator=is_fd and bool(flags & CANFD_ESI),
+        dlc=len(data),
+        data=data,
+        check=False,
+    )
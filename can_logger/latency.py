@@ -0,0 +1,176 @@
+import sys
+import threading
+import time
+from typing import Iterable
+
+import can
+
+DEFAULT_LATENCY_INTERVAL = 10.0
+# Latencies above are counted in the last bucket
+MAX_LATENCY_US = 60_000_000
+
+# Log-linear buckets as in HdrHistogram: values below SUB_BUCKET_COUNT get
+# a bucket each, every following power of two is split into
+# SUB_BUCKET_COUNT / 2 buckets, so a bucket is at most 1/64 (~1.6 %) wide
+# relative to its values.
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+HALF_BUCKET_BITS = SUB_BUCKET_BITS - 1
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+# Pipeline stages, every latency is measured from the kernel receive
+# timestamp of the frame (msg.timestamp)
+STAGES = {
+    "receive": "frame handed to the receive loop",
+    "callback": "frame handed to the database writer",
+    "commit": "frame committed to the database",
+}
+
+
+def bucket_index(value: int) -> int:
+    if value < SUB_BUCKET_COUNT:
+        return max(value, 0)
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << HALF_BUCKET_BITS) + (value >> shift)
+
+
+def bucket_value(index: int) -> int:
+    """Highest value counted in the bucket."""
+    shift = max(0, (index >> HALF_BUCKET_BITS) - 1)
+    return (((index - (shift << HALF_BUCKET_BITS)) + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Latency histogram in microseconds with HdrHistogram-style buckets.
+
+    Recording a value costs a few integer operations and a list
+    increment, independent of the number of recorded values. Percentiles
+    are reported as the highest value of the bucket they fall into.
+    """
+
+    def __init__(self, max_value: int = MAX_LATENCY_US):
+        self.counts: list[int] = [0] * (bucket_index(max_value) + 1)
+
+    def record(self, values: Iterable[int]) -> None:
+        counts = self.counts
+        last = len(counts) - 1
+        for value in values:
+            if value < SUB_BUCKET_COUNT:
+                index = value if value > 0 else 0
+            else:
+                shift = value.bit_length() - SUB_BUCKET_BITS
+                index = (shift << HALF_BUCKET_BITS) + (value >> shift)
+                if index > last:
+                    index = last
+            counts[index] += 1
+
+    def snapshot(self) -> list[int]:
+        # list.copy() runs without releasing the GIL, so recording in
+        # another thread cannot change the counts during the copy
+        return self.counts.copy()
+
+
+def percentiles(
+    counts: list[int], points: Iterable[float] = PERCENTILES
+) -> tuple[int, list[int], int]:
+    """Returns the count, the values at the percentiles and the maximum."""
+    total = sum(counts)
+    if not total:
+        return 0, [0 for _ in points], 0
+
+    values = []
+    targets = iter(sorted(points))
+    target = next(targets)
+    seen = 0
+    for index, count in enumerate(counts):
+        if not count:
+            continue
+        seen += count
+        while target is not None and seen >= total * target / 100:
+            values.append(bucket_value(index))
+            target = next(targets, None)
+        highest = index
+    return total, values, bucket_value(highest)
+
+
+class LatencyRecorder:
+    """
+    Per-stage latency histograms of the logging pipeline.
+
+    With interval set, a background thread prints the percentiles of the
+    latencies recorded since the previous report, stop() prints the
+    percentiles over the whole run. Reports go to stderr.
+    """
+
+    def __init__(
+        self, interval: float | None = DEFAULT_LATENCY_INTERVAL, file=None
+    ):
+        self.interval: float | None = interval
+        self.file = file
+        self.histograms: dict[str, LatencyHistogram] = {
+            stage: LatencyHistogram() for stage in STAGES
+        }
+
+        self._previous: dict[str, list[int]] = {
+            stage: histogram.snapshot()
+            for stage, histogram in self.histograms.items()
+        }
+        self._stop_event: threading.Event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def record_messages(self, stage: str, messages: list[can.Message]) -> None:
+        now = time.time()
+        self.histograms[stage].record(
+            int((now - msg.timestamp) * 1_000_000) for msg in messages
+        )
+
+    def record_rows(self, stage: str, rows: list[tuple]) -> None:
+        """Records can_messages rows, timestamp_ns is the first column."""
+        now = time.time_ns()
+        self.histograms[stage].record((now - row[0]) // 1000 for row in rows)
+
+    def report(self, interval: bool = True) -> str:
+        """
+        Percentile table of every stage. With interval set only the
+        latencies recorded since the previous interval report are included.
+        """
+        header = f"{'latency [us]':<12}{'count':>10}"
+        header += "".join(f"{f'p{p:g}':>10}" for p in PERCENTILES)
+        lines = [header + f"{'max':>10}"]
+        for stage, histogram in self.histograms.items():
+            counts = histogram.snapshot()
+            if interval:
+                previous, self._previous[stage] = self._previous[stage], counts
+                counts = [a - b for a, b in zip(counts, previous)]
+            count, values, highest = percentiles(counts)
+            line = f"{stage:<12}{count:>10}"
+            line += "".join(f"{value:>10}" for value in values)
+            lines.append(line + f"{highest:>10}")
+        return "\n".join(lines)
+
+    def print_report(self, interval: bool = True) -> None:
+        print(self.report(interval), file=self.file or sys.stderr)
+
+    def start(self) -> None:
+        if self._thread is not None or not self.interval:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="latency", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the periodic reports and prints the run summary."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.print_report(interval=False)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.print_report()
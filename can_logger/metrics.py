@@ -0,0 +1,269 @@
+import heapq
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import can
+
+DEFAULT_BITRATE = 500_000
+DEFAULT_DATA_BITRATE = 2_000_000
+DEFAULT_METRICS_INTERVAL = 1.0
+DEFAULT_TOP_IDS = 10
+METRICS_HOST = "127.0.0.1"
+
+# Name, Prometheus type and help text of the exported metrics
+METRICS = (
+    ("can_logger_frames_total", "counter", "Received frames."),
+    ("can_logger_bytes_total", "counter", "Received payload bytes."),
+    ("can_logger_frames_per_second", "gauge", "Received frames per second."),
+    (
+        "can_logger_bytes_per_second",
+        "gauge",
+        "Received payload bytes per second.",
+    ),
+    (
+        "can_logger_bus_load_percent",
+        "gauge",
+        "Estimated bus load in percent, stuff bits not included.",
+    ),
+    (
+        "can_logger_id_frames_per_second",
+        "gauge",
+        "Frames per second of the busiest arbitration IDs.",
+    ),
+)
+
+# Frame overhead in bits without stuff bits (SOF, arbitration, control,
+# CRC, ACK, EOF and intermission). CAN-FD frames are split into the part
+# sent at the nominal bitrate and the data phase (DLC, data, CRC).
+CLASSIC_OVERHEAD_BITS = {False: 47, True: 67}
+FD_NOMINAL_BITS = {False: 30, True: 49}
+FD_DATA_OVERHEAD_BITS = 28
+
+
+class BusMetrics:
+    """
+    Receive counters of one interface.
+
+    update() costs O(1) per frame: a frame and byte count, the estimated
+    time the frame occupied the bus and a per-ID counter. Rates are
+    derived from the counters by MetricsExporter.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        bitrate: int = DEFAULT_BITRATE,
+        data_bitrate: int = DEFAULT_DATA_BITRATE,
+    ):
+        self.channel: str = channel
+        self.bitrate: int = bitrate
+        self.data_bitrate: int = data_bitrate
+        self.frames: int = 0
+        self.bytes: int = 0
+        self.bus_time: float = 0.0
+        self.id_frames: dict[int, int] = {}
+
+    def update(self, messages: list[can.Message]) -> None:
+        id_frames = self.id_frames
+        bit_time = 1 / self.bitrate
+        data_bit_time = 1 / self.data_bitrate
+        nbytes = 0
+        bus_time = 0.0
+        for msg in messages:
+            arbitration_id = msg.arbitration_id
+            id_frames[arbitration_id] = id_frames.get(arbitration_id, 0) + 1
+            length = len(msg.data)
+            nbytes += length
+            if msg.is_fd:
+                data_bits = FD_DATA_OVERHEAD_BITS + 8 * length
+                bus_time += FD_NOMINAL_BITS[msg.is_extended_id] * bit_time
+                bus_time += data_bits * (
+                    data_bit_time if msg.bitrate_switch else bit_time
+                )
+            else:
+                bits = CLASSIC_OVERHEAD_BITS[msg.is_extended_id] + 8 * length
+                bus_time += bits * bit_time
+
+        self.frames += len(messages)
+        self.bytes += nbytes
+        self.bus_time += bus_time
+
+
+class _Sample:
+    """Counter values of one BusMetrics at one point in time."""
+
+    def __init__(self, metrics: BusMetrics):
+        self.time: float = time.monotonic()
+        self.frames: int = metrics.frames
+        self.bytes: int = metrics.bytes
+        self.bus_time: float = metrics.bus_time
+        # dict.copy() runs without releasing the GIL, so a receive loop in
+        # another thread cannot change the dict during the copy
+        self.id_frames: dict[int, int] = metrics.id_frames.copy()
+
+
+def _render_metric(
+    name: str, kind: str, text: str, values: list[tuple[str, float]]
+) -> list[str]:
+    lines = [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+    lines.extend(
+        f"{name}{{{labels}}} {round(value, 3)}" for labels, value in values
+    )
+    return lines
+
+
+class MetricsExporter:
+    """
+    Publishes BusMetrics in the Prometheus text format.
+
+    Every interval seconds a background thread derives frames/s, bytes/s,
+    bus load and the top_n IDs by rate from the counters, serves the
+    result on http://127.0.0.1:<port>/metrics and writes it to file_path
+    (e.g. for the node_exporter textfile collector).
+    """
+
+    def __init__(
+        self,
+        metrics: list[BusMetrics],
+        interval: float = DEFAULT_METRICS_INTERVAL,
+        port: int | None = None,
+        file_path: str | Path | None = None,
+        top_n: int = DEFAULT_TOP_IDS,
+        host: str = METRICS_HOST,
+    ):
+        self.metrics: list[BusMetrics] = metrics
+        self.interval: float = interval
+        self.port: int | None = port
+        self.file_path: Path | None = Path(file_path) if file_path else None
+        self.top_n: int = top_n
+        self.host: str = host
+        self.text: str = ""
+
+        self._samples: dict[str, _Sample] = {
+            bus.channel: _Sample(bus) for bus in metrics
+        }
+        self._stop_event: threading.Event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._server: ThreadingHTTPServer | None = None
+
+    def sample(self) -> str:
+        """Computes the rates since the previous sample, returns the text."""
+        values: dict[str, list[tuple[str, float]]] = {
+            name: [] for name, _, _ in METRICS
+        }
+        for bus in self.metrics:
+            previous = self._samples[bus.channel]
+            current = _Sample(bus)
+            self._samples[bus.channel] = current
+            elapsed = current.time - previous.time
+            if elapsed <= 0:
+                continue
+
+            label = f'channel="{bus.channel}"'
+            values["can_logger_frames_total"].append((label, current.frames))
+            values["can_logger_bytes_total"].append((label, current.bytes))
+            values["can_logger_frames_per_second"].append(
+                (label, (current.frames - previous.frames) / elapsed)
+            )
+            values["can_logger_bytes_per_second"].append(
+                (label, (current.bytes - previous.bytes) / elapsed)
+            )
+            values["can_logger_bus_load_percent"].append(
+                (label, 100 * (current.bus_time - previous.bus_time) / elapsed)
+            )
+
+            id_deltas = (
+                (
+                    arbitration_id,
+                    count - previous.id_frames.get(arbitration_id, 0),
+                )
+                for arbitration_id, count in current.id_frames.items()
+            )
+            values["can_logger_id_frames_per_second"].extend(
+                (f'{label},id="0x{arbitration_id:X}"', delta / elapsed)
+                for arbitration_id, delta in heapq.nlargest(
+                    self.top_n, id_deltas, key=lambda item: item[1]
+                )
+                if delta
+            )
+
+        lines = []
+        for name, kind, text in METRICS:
+            lines.extend(_render_metric(name, kind, text, values[name]))
+        self.text = "\n".join(lines) + "\n"
+        return self.text
+
+    def write_file(self) -> None:
+        tmp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(self.text)
+        os.replace(tmp_path, self.file_path)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        if self.port is not None:
+            self._server = ThreadingHTTPServer(
+                (self.host, self.port), self._handler()
+            )
+            self._server.daemon_threads = True
+            # Port 0 picks a free port
+            self.port = self._server.server_address[1]
+            threading.Thread(
+                target=self._server.serve_forever,
+                name="metrics-http",
+                daemon=True,
+            ).start()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+            if self.file_path is not None:
+                try:
+                    self.write_file()
+                except OSError as e:
+                    print(f"Metrics file error: {e}")
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.text.encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
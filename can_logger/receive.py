@@ -0,0 +1,130 @@
+import select
+import socket
+import struct
+import time
+
+import can
+
+try:
+    from can.interfaces.socketcan import SocketcanBus
+except ImportError:  # python-can without socketcan support on this platform
+    SocketcanBus = None
+
+# Definitions from linux/can.h
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x000007FF
+CANFD_BRS = 0x01
+CANFD_ESI = 0x02
+CANFD_MTU = 72
+
+SO_TIMESTAMPNS = 35
+
+DEFAULT_MAX_FRAMES = 1000
+
+# struct can_frame / canfd_frame header: can_id, len, flags, 2 reserved
+CAN_FRAME_HEADER = struct.Struct("=IBB2x")
+TIMESPEC = struct.Struct("@ll")
+ANCILLARY_BUFFER_SIZE = socket.CMSG_SPACE(TIMESPEC.size)
+
+
+def is_socketcan_bus(bus: can.BusABC) -> bool:
+    """True if frames can be read straight from the bus socket."""
+    return SocketcanBus is not None and isinstance(bus, SocketcanBus)
+
+
+def parse_frame(
+    frame: bytes, ancillary: list, msg_flags: int, channel: str | None = None
+) -> can.Message:
+    """Builds a can.Message from a raw (FD) frame and its kernel timestamp."""
+    can_id, length, flags = CAN_FRAME_HEADER.unpack_from(frame)
+
+    timestamp = None
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+            seconds, nanoseconds = TIMESPEC.unpack_from(data)
+            timestamp = seconds + nanoseconds * 1e-9
+    if timestamp is None:
+        timestamp = time.time()
+
+    is_extended_id = bool(can_id & CAN_EFF_FLAG)
+    is_fd = len(frame) == CANFD_MTU
+    return can.Message(
+        timestamp=timestamp,
+        channel=channel,
+        arbitration_id=can_id
+        & (CAN_EFF_MASK if is_extended_id else CAN_SFF_MASK),
+        is_extended_id=is_extended_id,
+        is_remote_frame=bool(can_id & CAN_RTR_FLAG),
+        is_error_frame=bool(can_id & CAN_ERR_FLAG),
+        is_fd=is_fd,
+        is_rx=not msg_flags & socket.MSG_DONTROUTE,
+        bitrate_switch=is_fd and bool(flags & CANFD_BRS),
+        error_state_indicator=is_fd and bool(flags & CANFD_ESI),
+        dlc=length,
+        data=frame[8 : 8 + length],
+        check=False,
+    )
+
+
+def read_frame(
+    sock: socket.socket, channel: str | None = None
+) -> can.Message | None:
+    """Reads one frame without blocking, None if the socket is empty."""
+    try:
+        frame, ancillary, msg_flags, _ = sock.recvmsg(
+            CANFD_MTU, ANCILLARY_BUFFER_SIZE, socket.MSG_DONTWAIT
+        )
+    except BlockingIOError:
+        return None
+    return parse_frame(frame, ancillary, msg_flags, channel)
+
+
+def read_frames(
+    sock: socket.socket,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+    channel: str | None = None,
+) -> list[can.Message]:
+    """Reads every frame already queued on the socket, up to max_frames."""
+    messages = []
+    recvmsg = sock.recvmsg
+    while len(messages) < max_frames:
+        try:
+            frame, ancillary, msg_flags, _ = recvmsg(
+                CANFD_MTU, ANCILLARY_BUFFER_SIZE, socket.MSG_DONTWAIT
+            )
+        except BlockingIOError:
+            break
+        messages.append(parse_frame(frame, ancillary, msg_flags, channel))
+    return messages
+
+
+def recv_bulk(
+    bus: can.BusABC,
+    timeout: float | None = None,
+    max_frames: int = DEFAULT_MAX_FRAMES,
+) -> list[can.Message]:
+    """
+    Waits up to timeout for the first frame, then drains every frame that
+    is already queued without waiting again. Returns at most max_frames
+    frames, an empty list on timeout.
+    """
+    if is_socketcan_bus(bus):
+        sock = bus.socket
+        if not select.select([sock], [], [], timeout)[0]:
+            return []
+        return read_frames(sock, max_frames, bus.channel)
+
+    message = bus.recv(timeout)
+    if message is None:
+        return []
+
+    messages = [message]
+    while len(messages) < max_frames:
+        message = bus.recv(0)
+        if message is None:
+            break
+        messages.append(message)
+    return messages
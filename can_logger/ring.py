@@ -0,0 +1,193 @@
+import multiprocessing
+import signal
+import struct
+import sys
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+import can
+
+from can_logger.database import SQLiteBatchWriter
+from can_logger.frames import (
+    FRAME_RECORD,
+    NO_CHANNEL,
+    frame_flags,
+    unpack_message,
+)
+from can_logger.receive import DEFAULT_MAX_FRAMES
+
+DEFAULT_RING_SIZE = 65_536
+DEFAULT_POLL_INTERVAL = 0.01
+
+# Ring header: total frames written, total frames read and frames dropped
+# because the ring was full. The indexes only grow, a frame's slot is its
+# index modulo the capacity.
+RING_HEADER = struct.Struct("<QQQ")
+RING_INDEX = struct.Struct("<Q")
+WRITE_OFFSET = 0
+READ_OFFSET = 8
+DROPPED_OFFSET = 16
+
+
+class FrameRing:
+    """
+    Bounded frame queue in shared memory, between processes.
+
+    put() copies frames into fixed-size slots, get() takes them out in
+    arrival order. The ring never blocks the producer: frames that do not
+    fit are dropped and counted in dropped. Channels are stored as their
+    position in channels, so both sides must use the same list.
+
+    The lock is only taken to publish indexes and to serialize producers,
+    the consumer reads its slots without it. A FrameRing passed to a
+    multiprocessing.Process attaches to the same memory.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_RING_SIZE,
+        channels: list[str] | tuple[str, ...] = (),
+        name: str | None = None,
+        lock=None,
+    ):
+        if len(channels) >= NO_CHANNEL:
+            raise ValueError(
+                f"At most {NO_CHANNEL - 1} channels are supported."
+            )
+        self.capacity: int = capacity
+        self.channels: tuple[str, ...] = tuple(channels)
+        self.owner: bool = name is None
+        self.shm: SharedMemory = SharedMemory(
+            name, create=self.owner, size=self._size(capacity)
+        )
+        if self.owner:
+            RING_HEADER.pack_into(self.shm.buf, 0, 0, 0, 0)
+        self.lock = (
+            multiprocessing.get_context("spawn").Lock()
+            if lock is None
+            else lock
+        )
+
+        self._channel_numbers: dict[str, int] = {
+            channel: i for i, channel in enumerate(self.channels)
+        }
+
+    @staticmethod
+    def _size(capacity: int) -> int:
+        return RING_HEADER.size + capacity * FRAME_RECORD.size
+
+    def __reduce__(self):
+        return (
+            FrameRing,
+            (self.capacity, self.channels, self.shm.name, self.lock),
+        )
+
+    @property
+    def dropped(self) -> int:
+        return RING_INDEX.unpack_from(self.shm.buf, DROPPED_OFFSET)[0]
+
+    @property
+    def pending(self) -> int:
+        """Frames written but not read yet."""
+        write, read, _ = RING_HEADER.unpack_from(self.shm.buf)
+        return write - read
+
+    def put(self, messages: list[can.Message]) -> int:
+        """Copies messages into the ring, returns how many fitted."""
+        buf = self.shm.buf
+        pack_into = FRAME_RECORD.pack_into
+        channel_numbers = self._channel_numbers
+        with self.lock:
+            write, read, dropped = RING_HEADER.unpack_from(buf)
+            room = self.capacity - (write - read)
+            if room < len(messages):
+                RING_INDEX.pack_into(
+                    buf, DROPPED_OFFSET, dropped + len(messages) - room
+                )
+                messages = messages[:room]
+            for message in messages:
+                can_id, flags = frame_flags(message)
+                data = bytes(message.data)
+                pack_into(
+                    buf,
+                    RING_HEADER.size
+                    + write % self.capacity * FRAME_RECORD.size,
+                    round(message.timestamp * 1_000_000_000),
+                    can_id,
+                    flags,
+                    len(data),
+                    channel_numbers.get(message.channel, NO_CHANNEL),
+                    data,
+                )
+                write += 1
+            RING_INDEX.pack_into(buf, WRITE_OFFSET, write)
+        return len(messages)
+
+    def get(self, max_frames: int = DEFAULT_MAX_FRAMES) -> list[can.Message]:
+        """Takes up to max_frames frames out of the ring."""
+        buf = self.shm.buf
+        unpack_from = FRAME_RECORD.unpack_from
+        channels = self.channels
+        with self.lock:
+            write, read, _ = RING_HEADER.unpack_from(buf)
+        messages = []
+        for index in range(read, min(write, read + max_frames)):
+            timestamp_ns, can_id, flags, length, channel, data = unpack_from(
+                buf,
+                RING_HEADER.size + index % self.capacity * FRAME_RECORD.size,
+            )
+            messages.append(
+                unpack_message(
+                    timestamp_ns,
+                    can_id,
+                    flags,
+                    data[:length],
+                    None if channel == NO_CHANNEL else channels[channel],
+                )
+            )
+        if messages:
+            with self.lock:
+                RING_INDEX.pack_into(buf, READ_OFFSET, read + len(messages))
+        return messages
+
+    def close(self) -> None:
+        """Detaches from the ring, the creating side also frees it."""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def write_ring_to_database(
+    ring: FrameRing,
+    stop,
+    db_path: str | Path,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    **database_options,
+) -> None:
+    """
+    Writer process of the multi-process capture: drains ring in batches
+    into an SQLiteBatchWriter until stop (a multiprocessing.Event) is set
+    and the ring is empty. database_options are passed on to the writer.
+    """
+    # Ctrl+C reaches the whole process group, the receiver stops us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    writer = SQLiteBatchWriter(db_path, **database_options)
+    try:
+        writer.connect()
+        stopping = False
+        while True:
+            messages = ring.get(writer.batch_size)
+            if messages:
+                writer.add_messages(messages)
+                continue
+            if stopping:
+                break
+            # Everything put before stop was set is read by the next get()
+            stopping = stop.wait(poll_interval)
+            writer.maybe_flush()
+    except Exception as e:
+        print(f"Error in the database writer: {e}", file=sys.stderr)
+        raise
+    finally:
+        writer.close()
+        ring.close()
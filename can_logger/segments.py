@@ -0,0 +1,262 @@
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterator
+
+import can
+
+from can_logger.frames import (
+    FRAME_RECORD,
+    NO_CHANNEL,
+    frame_flags,
+    unpack_message,
+)
+
+DEFAULT_SEGMENTS_PATH = "can_segments"
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+# Records per sparse index entry
+INDEX_INTERVAL = 1024
+
+# Segment file: SEGMENT_MAGIC followed by FRAME_RECORDs in arrival order.
+# Its .idx file has one INDEX_ENTRY per complete block of INDEX_INTERVAL
+# records: the highest timestamp up to the end of the block and the
+# lowest timestamp within the block. Channel numbers are line numbers of
+# the CHANNELS_FILE shared by all segments of the directory.
+SEGMENT_MAGIC = b"CANSEG\x00\x01"
+INDEX_ENTRY = struct.Struct("<qq")
+CHANNELS_FILE = "channels"
+SEGMENT_PATTERN = "segment-*.seg"
+
+
+def segment_path(directory: Path, number: int) -> Path:
+    return directory / f"segment-{number:06d}.seg"
+
+
+def index_path(segment: Path) -> Path:
+    return segment.with_suffix(".idx")
+
+
+def list_segments(directory: str | Path) -> list[Path]:
+    return sorted(Path(directory).glob(SEGMENT_PATTERN))
+
+
+def read_channels(directory: str | Path) -> list[str]:
+    path = Path(directory) / CHANNELS_FILE
+    if not path.exists():
+        return []
+    return path.read_text().splitlines()
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+class SegmentWriter:
+    """
+    Appends frames as fixed-size records to segment files in directory.
+
+    Every open() starts a new segment, existing ones are never written
+    again. A segment is closed once it holds segment_size bytes of
+    records. Blocks of records are indexed as they fill up, so the index
+    of a segment lags its data by less than INDEX_INTERVAL records. A
+    record cut short by a crash is ignored by the reader.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = DEFAULT_SEGMENTS_PATH,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+    ):
+        self.directory: Path = Path(directory)
+        # Whole index blocks per segment, so blocks never span segments
+        self.segment_records: int = (
+            max(segment_size // FRAME_RECORD.size // INDEX_INTERVAL, 1)
+            * INDEX_INTERVAL
+        )
+        self.number: int = -1
+        self.fd: int | None = None
+        self.index_fd: int | None = None
+        self.records: int = 0
+
+        self._channels: dict[str, int] = {}
+        self._max_ns: int | None = None
+        self._block_min_ns: int | None = None
+
+    def open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._channels = {
+            channel: i
+            for i, channel in enumerate(read_channels(self.directory))
+        }
+        segments = list_segments(self.directory)
+        self.number = int(segments[-1].stem.split("-")[1]) if segments else -1
+        self._start_segment()
+
+    def _start_segment(self) -> None:
+        self._close_segment()
+        self.number += 1
+        path = segment_path(self.directory, self.number)
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL
+        self.fd = os.open(path, flags, 0o644)
+        self.index_fd = os.open(index_path(path), flags, 0o644)
+        _write_all(self.fd, SEGMENT_MAGIC)
+        self.records = 0
+        self._max_ns = self._block_min_ns = None
+
+    def _close_segment(self) -> None:
+        for fd in (self.fd, self.index_fd):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self.index_fd = None
+
+    def _channel_number(self, channel: str | None) -> int:
+        if channel is None:
+            return NO_CHANNEL
+        number = self._channels.get(channel)
+        if number is None:
+            number = len(self._channels)
+            if number >= NO_CHANNEL:
+                raise RuntimeError("Too many channels for one segment store.")
+            # Written before any record refers to it
+            with open(self.directory / CHANNELS_FILE, "a") as file:
+                file.write(f"{channel}\n")
+            self._channels[channel] = number
+        return number
+
+    def write(self, messages: list[can.Message]) -> None:
+        while messages:
+            room = self.segment_records - self.records
+            if not room:
+                self._start_segment()
+                continue
+            self._write_records(messages[:room])
+            messages = messages[room:]
+
+    def _write_records(self, messages: list[can.Message]) -> None:
+        buf = bytearray(len(messages) * FRAME_RECORD.size)
+        index = bytearray()
+        pack_into = FRAME_RECORD.pack_into
+        offset = 0
+        max_ns, block_min_ns = self._max_ns, self._block_min_ns
+        records = self.records
+        for message in messages:
+            timestamp_ns = round(message.timestamp * 1_000_000_000)
+            can_id, flags = frame_flags(message)
+            data = bytes(message.data)
+            pack_into(
+                buf,
+                offset,
+                timestamp_ns,
+                can_id,
+                flags,
+                len(data),
+                self._channel_number(message.channel),
+                data,
+            )
+            offset += FRAME_RECORD.size
+            if max_ns is None or timestamp_ns > max_ns:
+                max_ns = timestamp_ns
+            if block_min_ns is None or timestamp_ns < block_min_ns:
+                block_min_ns = timestamp_ns
+            records += 1
+            if records % INDEX_INTERVAL == 0:
+                index += INDEX_ENTRY.pack(max_ns, block_min_ns)
+                block_min_ns = None
+        # Records first, an index entry never points past the data
+        _write_all(self.fd, buf)
+        if index:
+            _write_all(self.index_fd, index)
+        self.records = records
+        self._max_ns, self._block_min_ns = max_ns, block_min_ns
+
+    def close(self) -> None:
+        self._close_segment()
+
+
+class SegmentReader:
+    """
+    Reads the segments of a directory written by SegmentWriter.
+
+    Segments are memory-mapped. A time range is located by binary search
+    over the running maximum timestamps of the sparse index, and reading
+    stops at the first block whose frames are all later than the range.
+    Frames must therefore arrive in about time order, as they do from the
+    capture engine. Blocks not indexed yet are scanned. Segments and
+    channels written after the reader was created are not seen.
+    """
+
+    def __init__(self, directory: str | Path = DEFAULT_SEGMENTS_PATH):
+        self.directory: Path = Path(directory)
+        self.channels: list[str] = read_channels(directory)
+        self.segments: list[Path] = list_segments(directory)
+
+    def iter_messages(
+        self, start_ns: int | None = None, end_ns: int | None = None
+    ) -> Iterator[can.Message]:
+        """Yields the frames with start_ns <= timestamp <= end_ns."""
+        for path in self.segments:
+            yield from self._iter_segment(path, start_ns, end_ns)
+
+    def _read_index(self, path: Path) -> list[tuple[int, int]]:
+        path = index_path(path)
+        data = path.read_bytes() if path.exists() else b""
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+    def _iter_segment(
+        self, path: Path, start_ns: int | None, end_ns: int | None
+    ) -> Iterator[can.Message]:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < len(SEGMENT_MAGIC):
+                # Crashed before the magic was written
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[: len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    raise RuntimeError(f"{path} is not a segment file.")
+                yield from self._iter_records(
+                    mm, self._read_index(path), start_ns, end_ns
+                )
+
+    def _iter_records(
+        self,
+        mm: mmap.mmap,
+        index: list[tuple[int, int]],
+        start_ns: int | None,
+        end_ns: int | None,
+    ) -> Iterator[can.Message]:
+        count = (len(mm) - len(SEGMENT_MAGIC)) // FRAME_RECORD.size
+        block = 0
+        if start_ns is not None:
+            # Blocks up to a running maximum below start_ns end too early
+            block = bisect_left(index, start_ns, key=lambda entry: entry[0])
+        channels = self.channels
+        unpack_from = FRAME_RECORD.unpack_from
+        for first in range(block * INDEX_INTERVAL, count, INDEX_INTERVAL):
+            block = first // INDEX_INTERVAL
+            if (
+                end_ns is not None
+                and block < len(index)
+                and index[block][1] > end_ns
+            ):
+                return
+            for record in range(first, min(first + INDEX_INTERVAL, count)):
+                timestamp_ns, can_id, flags, length, channel, data = (
+                    unpack_from(
+                        mm, len(SEGMENT_MAGIC) + record * FRAME_RECORD.size
+                    )
+                )
+                if (start_ns is not None and timestamp_ns < start_ns) or (
+                    end_ns is not None and timestamp_ns > end_ns
+                ):
+                    continue
+                yield unpack_message(
+                    timestamp_ns,
+                    can_id,
+                    flags,
+                    data[:length],
+                    None if channel == NO_CHANNEL else channels[channel],
+                )
@@ -0,0 +1,153 @@
+import json
+import os
+from datetime import datetime, timezone
+from itertools import groupby
+from pathlib import Path
+
+NS_PER_SECOND = 1_000_000_000
+
+# Shard length in nanoseconds. Boundaries are aligned to UTC.
+SHARD_PERIODS: dict[str, int] = {
+    "hourly": 3600 * NS_PER_SECOND,
+    "daily": 86400 * NS_PER_SECOND,
+}
+
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(db_path: str | Path) -> Path:
+    """can_messages.db -> can_messages.manifest.json"""
+    db_path = Path(db_path)
+    if db_path.name.endswith(MANIFEST_SUFFIX):
+        return db_path
+    return db_path.with_name(db_path.stem + MANIFEST_SUFFIX)
+
+
+def is_sharded(db_path: str | Path) -> bool:
+    """True if db_path names a sharded database rather than a file."""
+    db_path = Path(db_path)
+    if db_path.name.endswith(MANIFEST_SUFFIX):
+        return True
+    return not db_path.exists() and manifest_path_for(db_path).exists()
+
+
+def shard_start(timestamp_ns: int, period_ns: int) -> int:
+    return timestamp_ns - timestamp_ns % period_ns
+
+
+def group_rows_by_shard(
+    rows: list[tuple], period_ns: int
+) -> list[tuple[int, list[tuple]]]:
+    """
+    Splits rows (timestamp_ns first) into runs belonging to one shard.
+    Rows arrive in time order, so this is usually a single group.
+    """
+    return [
+        (start, list(group))
+        for start, group in groupby(
+            rows, key=lambda row: shard_start(row[0], period_ns)
+        )
+    ]
+
+
+class ShardManifest:
+    """
+    Index of the shard files of a time-partitioned database.
+
+    The manifest is a small JSON file next to the shards that maps the
+    start of every period to its database file, so readers can open only
+    the shards overlapping a requested time range.
+    """
+
+    def __init__(self, path: str | Path, period: str = "hourly"):
+        if period not in SHARD_PERIODS:
+            raise ValueError(f"Unknown shard period: {period}")
+
+        self.path: Path = manifest_path_for(path)
+        self.period: str = period
+        self.period_ns: int = SHARD_PERIODS[period]
+        self.shards: dict[int, str] = {}
+        self._mtime: float | None = None
+
+    @property
+    def base_name(self) -> str:
+        return self.path.name[: -len(MANIFEST_SUFFIX)]
+
+    @classmethod
+    def load(cls, path: str | Path) -> "ShardManifest":
+        path = manifest_path_for(path)
+        with open(path) as f:
+            content = json.load(f)
+
+        manifest = cls(path, content["period"])
+        manifest.shards = {
+            shard["start_ns"]: shard["file"] for shard in content["shards"]
+        }
+        manifest._mtime = os.path.getmtime(path)
+        return manifest
+
+    @classmethod
+    def open(cls, path: str | Path, period: str) -> "ShardManifest":
+        """Loads an existing manifest or starts a new one."""
+        if manifest_path_for(path).exists():
+            manifest = cls.load(path)
+            if manifest.period != period:
+                raise ValueError(
+                    f"{manifest.path} uses {manifest.period} shards,"
+                    f" not {period}."
+                )
+            return manifest
+        return cls(path, period)
+
+    def reload(self) -> None:
+        """Picks up shards added by a running logger."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.shards = ShardManifest.load(self.path).shards
+            self._mtime = mtime
+
+    def save(self) -> None:
+        content = {
+            "version": MANIFEST_VERSION,
+            "period": self.period,
+            "shards": [
+                {
+                    "file": name,
+                    "start_ns": start,
+                    "end_ns": start + self.period_ns,
+                }
+                for start, name in sorted(self.shards.items())
+            ],
+        }
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(content, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def shard_path(self, start_ns: int) -> Path:
+        """Returns the file of the shard starting at start_ns, registering
+        (and saving) it if it is new."""
+        if start_ns not in self.shards:
+            start = datetime.fromtimestamp(
+                start_ns / NS_PER_SECOND, tz=timezone.utc
+            )
+            fmt = "%Y%m%dT%H" if self.period == "hourly" else "%Y%m%d"
+            self.shards[start_ns] = f"{self.base_name}-{start:{fmt}}.db"
+            self.save()
+        return self.path.with_name(self.shards[start_ns])
+
+    def shards_overlapping(
+        self, start_ns: int | None = None, end_ns: int | None = None
+    ) -> list[Path]:
+        """Shard files overlapping [start_ns, end_ns], oldest first."""
+        return [
+            self.path.with_name(name)
+            for start, name in sorted(self.shards.items())
+            if (end_ns is None or start <= end_ns)
+            and (start_ns is None or start + self.period_ns > start_ns)
+        ]
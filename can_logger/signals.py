@@ -0,0 +1,149 @@
+import sqlite3
+
+from can_logger.decoding import SignalDecoder
+
+# signals holds one row per decoded signal value. Signal names are stored
+# once per database file in signal_names. signal_state keeps the high-water
+# mark: the id of the last can_messages row whose signals are stored.
+CREATE_SIGNAL_TABLE_QUERIES = (
+    """
+    CREATE TABLE IF NOT EXISTS signal_names (
+        id INTEGER PRIMARY KEY,
+        message TEXT NOT NULL,
+        signal TEXT NOT NULL,
+        UNIQUE (message, signal)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS signals (
+        timestamp_ns INTEGER NOT NULL,
+        signal_id INTEGER NOT NULL,
+        value REAL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_signals_id_ts
+    ON signals (signal_id, timestamp_ns)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS signal_state (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        last_message_id INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO signal_state VALUES (0, 0)",
+)
+
+INSERT_SIGNAL_NAME_QUERY = """
+            INSERT OR IGNORE INTO signal_names (message, signal) VALUES (?, ?)
+            """
+
+SELECT_SIGNAL_NAMES_QUERY = "SELECT id, message, signal FROM signal_names"
+
+INSERT_SIGNAL_QUERY = """
+            INSERT INTO signals (timestamp_ns, signal_id, value)
+            VALUES (?, ?, ?)
+            """
+
+# Returns (high-water mark, newest can_messages id)
+SIGNAL_PROGRESS_QUERY = """
+            SELECT
+                (SELECT last_message_id FROM signal_state),
+                coalesce((SELECT max(id) FROM can_messages), 0)
+            """
+
+# Run right after inserting a batch of ? frames. Moves the mark over the
+# batch only if everything before it was already decoded, the writer then
+# decodes the batch in the same transaction. Otherwise the batch is left
+# to the backfill, so no frame is ever decoded twice.
+ADVANCE_MARK_QUERY = """
+            UPDATE signal_state
+            SET last_message_id = (SELECT max(id) FROM can_messages)
+            WHERE last_message_id = (SELECT max(id) FROM can_messages) - ?
+            """
+
+SELECT_BACKFILL_QUERY = """
+            SELECT id, timestamp_ns, arbitration_id, is_extended_id, dlc,
+                data, is_fd, is_error_frame, channel
+            FROM can_messages WHERE id > ? ORDER BY id LIMIT ?
+            """
+
+SET_MARK_QUERY = "UPDATE signal_state SET last_message_id = ?"
+
+SignalIds = dict[str, dict[str, int]]
+
+
+def signal_decoder(dbc_path) -> SignalDecoder:
+    """Decoder for the signals table, choices are stored as numbers."""
+    return SignalDecoder.from_file(dbc_path, decode_choices=False)
+
+
+def signal_names(decoder: SignalDecoder) -> list[tuple[str, str]]:
+    """(message, signal) pairs of every signal the decoder knows."""
+    return [
+        (message.name, signal.name)
+        for message in decoder.database.messages
+        for signal in message.signals
+    ]
+
+
+def signal_ids_from_rows(rows: list[tuple]) -> SignalIds:
+    signal_ids: SignalIds = {}
+    for signal_id, message, signal in rows:
+        signal_ids.setdefault(message, {})[signal] = signal_id
+    return signal_ids
+
+
+def signal_rows(
+    decoder: SignalDecoder, signal_ids: SignalIds, rows: list[tuple]
+) -> list[tuple]:
+    """
+    Decodes can_messages rows (as inserted, without id) into rows of the
+    signals table. Error frames and unknown IDs are skipped.
+    """
+    decode = decoder.decode
+    result = []
+    for (
+        timestamp_ns,
+        arbitration_id,
+        is_extended,
+        _,
+        data,
+        _,
+        error,
+        _,
+    ) in rows:
+        if error:
+            continue
+        decoded = decode(arbitration_id, data, is_extended)
+        if decoded is None:
+            continue
+        name, signals = decoded
+        ids = signal_ids[name]
+        result.extend(
+            (timestamp_ns, ids[signal], value)
+            for signal, value in signals.items()
+        )
+    return result
+
+
+def setup_signal_tables(
+    conn: sqlite3.Connection, decoder: SignalDecoder
+) -> SignalIds:
+    """Creates the signal tables and returns the ids of known signals."""
+    for query in CREATE_SIGNAL_TABLE_QUERIES:
+        conn.execute(query)
+    conn.executemany(INSERT_SIGNAL_NAME_QUERY, signal_names(decoder))
+    conn.commit()
+    return signal_ids_from_rows(
+        conn.execute(SELECT_SIGNAL_NAMES_QUERY).fetchall()
+    )
+
+
+def warn_if_behind(path, last_message_id: int, newest_id: int) -> None:
+    if last_message_id < newest_id:
+        print(
+            f"{path}: {newest_id - last_message_id} frames are not decoded"
+            " yet, new frames are decoded once the backlog is processed with"
+            " 'python -m can_logger.database_tools --mode backfill'."
+        )
@@ -0,0 +1,319 @@
+import asyncio
+import contextlib
+import os
+import shutil
+import struct
+import sys
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import can
+
+from can_logger.callbacks import format_message
+from can_logger.database import CANMessageDatabase
+from can_logger.decoding import SignalDecoder, format_signals
+from can_logger.dispatch import DEFAULT_QUEUE_SIZE
+from can_logger.frames import frame_flags, unpack_message
+from can_logger.segments import DEFAULT_SEGMENTS_PATH, SegmentWriter
+from can_logger.top import CLEAR_SCREEN, DEFAULT_REFRESH_INTERVAL, TopTable
+
+SINK_TYPES = ("console", "top", "sqlite", "binary", "segments", "null")
+DEFAULT_BINARY_PATH = "can_messages.bin"
+
+# Binary capture file: BINARY_MAGIC followed by one record per frame,
+# BINARY_FRAME_HEADER (timestamp in ns, can_id with the linux/can.h
+# EFF/RTR/ERR flags, CAN-FD flags, payload length) and the payload
+BINARY_MAGIC = b"CANLOG\x00\x01"
+BINARY_FRAME_HEADER = struct.Struct("<qIBB")
+
+
+class Sink(ABC):
+    """
+    Destination of captured frames, see CaptureEngine.
+
+    write() gets ordered batches of frames from the sink's own queue.
+    Sinks with block set make the receive loop wait when their queue is
+    full, the others drop (and count) frames instead, so they never slow
+    down the receive loop or other sinks. Subclasses must implement
+    write().
+    """
+
+    name: str = "sink"
+    block: bool = False
+    queue_size: int = DEFAULT_QUEUE_SIZE
+
+    async def open(self) -> None:
+        pass
+
+    @abstractmethod
+    async def write(self, messages: list[can.Message]) -> None: ...
+
+    async def close(self) -> None:
+        pass
+
+
+class ConsoleSink(Sink):
+    """Prints frames (and their decoded signals) candump-style."""
+
+    name = "console"
+
+    def __init__(
+        self,
+        decoder: SignalDecoder | None = None,
+        file=None,
+        formatter: Callable[[can.Message], str] = format_message,
+    ):
+        self.decoder: SignalDecoder | None = decoder
+        self.file = file
+        self.formatter: Callable[[can.Message], str] = formatter
+
+    def _format(self, messages: list[can.Message]) -> str:
+        formatter = self.formatter
+        lines = []
+        for message in messages:
+            lines.append(formatter(message))
+            if self.decoder is not None:
+                decoded = self.decoder.decode_message(message)
+                if decoded is not None:
+                    lines.append(format_signals(*decoded))
+        lines.append("")
+        return "\n".join(lines)
+
+    def _write(self, messages: list[can.Message]) -> None:
+        file = self.file or sys.stdout
+        file.write(self._format(messages))
+        file.flush()
+
+    async def write(self, messages: list[can.Message]) -> None:
+        # A slow terminal or pipe blocks a worker thread, not the loop
+        await asyncio.to_thread(self._write, messages)
+
+
+class TopSink(Sink):
+    """
+    Live table with one row per arbitration ID, redrawn in place.
+
+    Frames only update the TopTable, the terminal is written every
+    refresh_interval seconds, so console output costs the same at any
+    frame rate. Output that is not a terminal gets one table per refresh.
+    """
+
+    name = "top"
+
+    def __init__(
+        self,
+        title: str = "",
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        file=None,
+    ):
+        self.table: TopTable = TopTable(title)
+        self.refresh_interval: float = refresh_interval
+        self.file = file
+        self.task: asyncio.Task | None = None
+
+    def _draw(self) -> None:
+        file = self.file or sys.stdout
+        if file.isatty():
+            width, height = shutil.get_terminal_size()
+            # The last line stays empty for the cursor
+            text = CLEAR_SCREEN + self.table.render(width, height - 1)
+        else:
+            text = self.table.render() + "\n\n"
+        file.write(text)
+        file.flush()
+
+    async def _refresh(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await asyncio.to_thread(self._draw)
+
+    async def open(self) -> None:
+        self.task = asyncio.create_task(self._refresh())
+
+    async def write(self, messages: list[can.Message]) -> None:
+        self.table.update(messages)
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+            # Leave the final state on screen
+            self._draw()
+
+
+class SQLiteSink(Sink):
+    """Group-commits frames with CANMessageDatabase, never drops."""
+
+    name = "sqlite"
+    block = True
+
+    def __init__(self, db_path: str | Path, **kwargs):
+        """kwargs are passed on to CANMessageDatabase."""
+        self.database: CANMessageDatabase = CANMessageDatabase(
+            db_path, **kwargs
+        )
+
+    async def open(self) -> None:
+        await self.database.connect()
+        if not self.database.db_connected:
+            raise RuntimeError(f"Cannot open database {self.database.db_path}")
+
+    async def write(self, messages: list[can.Message]) -> None:
+        await self.database.add_messages(messages)
+
+    async def close(self) -> None:
+        await self.database.disconnect()
+
+
+def pack_frame(message: can.Message) -> bytes:
+    can_id, flags = frame_flags(message)
+    data = bytes(message.data)
+    return (
+        BINARY_FRAME_HEADER.pack(
+            round(message.timestamp * 1_000_000_000), can_id, flags, len(data)
+        )
+        + data
+    )
+
+
+def unpack_frames(data: bytes, offset: int = 0) -> Iterator[can.Message]:
+    """Parses the frame records in data, starting at offset."""
+    unpack_from = BINARY_FRAME_HEADER.unpack_from
+    header_size = BINARY_FRAME_HEADER.size
+    end = len(data)
+    while offset + header_size <= end:
+        timestamp_ns, can_id, flags, length = unpack_from(data, offset)
+        offset += header_size
+        if offset + length > end:
+            # Record cut short by a crash while writing
+            return
+        yield unpack_message(
+            timestamp_ns, can_id, flags, data[offset : offset + length]
+        )
+        offset += length
+
+
+def read_binary_file(path: str | Path) -> Iterator[can.Message]:
+    """Yields the frames of a file written by BinarySink."""
+    data = Path(path).read_bytes()
+    if not data.startswith(BINARY_MAGIC):
+        raise RuntimeError(f"{path} is not a binary capture file.")
+    return unpack_frames(data, len(BINARY_MAGIC))
+
+
+class BinarySink(Sink):
+    """
+    Appends frames to a compact binary file, see BINARY_FRAME_HEADER.
+
+    Every batch is packed into one buffer and written with a single
+    unbuffered write by a worker thread, so there is no per-frame SQL
+    work and disk stalls do not block the loop. Files are read back with
+    read_binary_file().
+    """
+
+    name = "binary"
+    block = True
+
+    def __init__(self, path: str | Path = DEFAULT_BINARY_PATH):
+        self.path: Path = Path(path)
+        self.fd: int | None = None
+
+    async def open(self) -> None:
+        self.fd = os.open(
+            self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        if os.fstat(self.fd).st_size == 0:
+            self._write_all(BINARY_MAGIC)
+
+    def _write_all(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view) :]
+
+    async def write(self, messages: list[can.Message]) -> None:
+        await asyncio.to_thread(
+            self._write_all, b"".join(map(pack_frame, messages))
+        )
+
+    async def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SegmentSink(Sink):
+    """
+    Appends fixed-size frame records to segment files with a sparse time
+    index, see SegmentWriter.
+
+    Like the binary sink it costs one write per batch, and the segments
+    can be read back by time range with SegmentReader or converted into
+    a database with 'database_tools --mode convert-segments' later.
+    """
+
+    name = "segments"
+    block = True
+
+    def __init__(self, path: str | Path = DEFAULT_SEGMENTS_PATH):
+        self.writer: SegmentWriter = SegmentWriter(path)
+
+    async def open(self) -> None:
+        self.writer.open()
+
+    async def write(self, messages: list[can.Message]) -> None:
+        await asyncio.to_thread(self.writer.write, messages)
+
+    async def close(self) -> None:
+        self.writer.close()
+
+
+class NullSink(Sink):
+    """Counts and discards frames, e.g. to benchmark the receive path."""
+
+    name = "null"
+
+    def __init__(self):
+        self.frames: int = 0
+
+    async def write(self, messages: list[can.Message]) -> None:
+        self.frames += len(messages)
+
+
+def create_sinks(
+    names: Iterable[str],
+    db_path: str | Path | None = None,
+    binary_path: str | Path = DEFAULT_BINARY_PATH,
+    decoder: SignalDecoder | None = None,
+    formatter: Callable[[can.Message], str] = format_message,
+    title: str = "",
+    refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+    segments_path: str | Path = DEFAULT_SEGMENTS_PATH,
+    **database_options,
+) -> list[Sink]:
+    """
+    Builds sinks by SINK_TYPES name, database_options are passed on to
+    CANMessageDatabase. title and refresh_interval configure the top
+    sink.
+    """
+    sinks = []
+    for name in dict.fromkeys(names):
+        if name == "console":
+            sinks.append(ConsoleSink(decoder, formatter=formatter))
+        elif name == "top":
+            sinks.append(TopSink(title, refresh_interval))
+        elif name == "sqlite":
+            if db_path is None:
+                raise RuntimeError("The sqlite sink needs a database path.")
+            sinks.append(SQLiteSink(db_path, **database_options))
+        elif name == "binary":
+            sinks.append(BinarySink(binary_path))
+        elif name == "segments":
+            sinks.append(SegmentSink(segments_path))
+        elif name == "null":
+            sinks.append(NullSink())
+        else:
+            raise ValueError(f"Unknown sink: {name}")
+    return sinks
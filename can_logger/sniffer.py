@@ -1,10 +1,47 @@
+import asyncio
+import multiprocessing
 import signal
-import sqlite3
 import sys
+import threading
 
 import can
 import click
 
+from can_logger.can_interface import CANInterface
+from can_logger.capture import CaptureEngine
+from can_logger.change_only import DEFAULT_KEYFRAME_INTERVAL
+from can_logger.database import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_PRAGMA_PROFILE,
+    PRAGMA_PROFILES,
+)
+from can_logger.dispatch import Dispatcher
+from can_logger.filters import CAN_FILTER
+from can_logger.latency import DEFAULT_LATENCY_INTERVAL, LatencyRecorder
+from can_logger.metrics import (
+    DEFAULT_BITRATE,
+    DEFAULT_DATA_BITRATE,
+    DEFAULT_METRICS_INTERVAL,
+    BusMetrics,
+    MetricsExporter,
+)
+from can_logger.receive import DEFAULT_MAX_FRAMES, recv_bulk
+from can_logger.ring import (
+    DEFAULT_RING_SIZE,
+    FrameRing,
+    write_ring_to_database,
+)
+from can_logger.segments import DEFAULT_SEGMENTS_PATH
+from can_logger.sharding import SHARD_PERIODS
+from can_logger.sinks import DEFAULT_BINARY_PATH, SINK_TYPES, create_sinks
+from can_logger.top import DEFAULT_REFRESH_INTERVAL
+
+# Seconds a receiver waits for frames before checking for shutdown
+RECEIVE_TIMEOUT = 0.1
+WRITER_POLL_INTERVAL = 0.1
+
 
 class CanSniffer:
     """
@@ -12,48 +49,146 @@ class CanSniffer:
     """
 
     def __init__(
-        self, interface, bustype="socketcan", bitrate=None, db_path=None
+        self,
+        interface,
+        bustype="socketcan",
+        bitrate=None,
+        db_path=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        pragma_profile=DEFAULT_PRAGMA_PROFILE,
+        checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+        recv_batch_size=DEFAULT_MAX_FRAMES,
+        shard_period=None,
+        dbc_path=None,
+        metrics_port=None,
+        metrics_file=None,
+        metrics_interval=DEFAULT_METRICS_INTERVAL,
+        data_bitrate=DEFAULT_DATA_BITRATE,
+        latency=False,
+        latency_interval=DEFAULT_LATENCY_INTERVAL,
+        sinks=("sqlite",),
+        binary_path=DEFAULT_BINARY_PATH,
+        refresh_interval=DEFAULT_REFRESH_INTERVAL,
+        can_filters=None,
+        change_only=False,
+        keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+        ring_size=DEFAULT_RING_SIZE,
+        segments_path=DEFAULT_SEGMENTS_PATH,
     ):
         """
         Initializes the CanSniffer.
 
         Args:
-            interface (str): The CAN interface name (e.g., 'vcan0', 'can0').
+            interface (str | list): The CAN interface name (e.g., 'vcan0',
+                                    'can0'), or several names to capture
+                                    all of them in this process.
             bustype (str): The python-can bus type (default: 'socketcan').
             bitrate (int, optional): The bitrate for physical interfaces.
                                      Defaults to None.
+            db_path (str, optional): SQLite database file for sniff_db().
+            batch_size (int): Frames buffered before a commit.
+            flush_interval (float): Maximum seconds between commits.
+            pragma_profile (str): Key of database.PRAGMA_PROFILES.
+            checkpoint_interval (float): Seconds between background WAL
+                                         checkpoints, 0 disables them.
+            recv_batch_size (int): Maximum frames drained per wakeup.
+            shard_period (str, optional): "hourly" or "daily" to write
+                                          time-partitioned shard files.
+            dbc_path (str, optional): DBC file, frames are also decoded
+                                      into the signals table.
+            metrics_port (int, optional): Serve Prometheus metrics on
+                                          this local port.
+            metrics_file (str, optional): Periodically write the
+                                          metrics to this file.
+            metrics_interval (float): Seconds between metrics updates.
+            data_bitrate (int): CAN-FD data bitrate for the bus load
+                                estimate.
+            latency (bool): Record and report per-stage latencies.
+            latency_interval (float): Seconds between latency reports.
+            sinks (tuple): SINK_TYPES names used by capture().
+            binary_path (str): File written by the binary sink.
+            refresh_interval (float): Seconds between redraws of the top
+                                      sink.
+            can_filters (list, optional): python-can filters, see
+                                          filters.parse_can_filter.
+            change_only (bool): Only store payload changes and keyframes.
+            keyframe_interval (float): Seconds between keyframes of an ID
+                                       with change_only.
+            ring_size (int): Frames buffered between the receiver and
+                             the writer by capture_processes().
+            segments_path (str): Directory written by the segments sink.
         """
-        self.interface = interface
+        self.interfaces = (
+            [interface] if isinstance(interface, str) else list(interface)
+        )
+        self.interface = ", ".join(self.interfaces)
         self.bustype = bustype
         self.bitrate = bitrate
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pragma_profile = pragma_profile
+        self.checkpoint_interval = checkpoint_interval
+        self.recv_batch_size = recv_batch_size
+        self.shard_period = shard_period
+        self.dbc_path = dbc_path
+        self.metrics = {}
+        self.exporter = None
+        if metrics_port is not None or metrics_file:
+            self.metrics = {
+                name: BusMetrics(
+                    name, bitrate or DEFAULT_BITRATE, data_bitrate
+                )
+                for name in self.interfaces
+            }
+            self.exporter = MetricsExporter(
+                list(self.metrics.values()),
+                metrics_interval,
+                metrics_port,
+                metrics_file,
+            )
+        self.latency = LatencyRecorder(latency_interval) if latency else None
+        self.sinks = sinks
+        self.binary_path = binary_path
+        self.refresh_interval = refresh_interval
+        self.can_filters = can_filters
+        self.change_only = change_only
+        self.keyframe_interval = keyframe_interval
+        self.ring_size = ring_size
+        self.segments_path = segments_path
+        # One bus per interface, self.bus is the first of them
+        self.buses = []
         self.bus = None
+        self.engine = None
+        self.writer = None
         self._running = False
 
-    def _format_message(self, msg: can.Message) -> str:
-        """Formats a CAN message similar to candump output."""
-        arbitration_id_str = f"{msg.arbitration_id:03X}"
-        data_str = " ".join(f"{b:02X}" for b in msg.data)
-        # Example: vcan0  123   [8]  DE AD BE EF 00 11 22 33
-        return f"  {self.interface:<5}  {arbitration_id_str:<3}   [{msg.dlc}]  {data_str}"
-
     def connect(self):
-        """Establishes connection to the CAN bus."""
+        """Establishes connection to the CAN bus(es)."""
+        interface = self.interfaces[0]
         try:
-            kwargs = {
-                "channel": self.interface,
-                "bustype": self.bustype,
-                "fd": True,
-            }
-            if self.bitrate:
-                kwargs["bitrate"] = self.bitrate
+            for interface in self.interfaces:
+                kwargs = {
+                    "channel": interface,
+                    "bustype": self.bustype,
+                    "fd": True,
+                }
+                if self.bitrate:
+                    kwargs["bitrate"] = self.bitrate
+                if self.can_filters:
+                    # Installed in the kernel on socketcan
+                    kwargs["can_filters"] = self.can_filters
 
-            self.bus = can.interface.Bus(**kwargs)
-            print(f"Successfully listening on {self.bus.channel_info}")
+                bus = can.interface.Bus(**kwargs)
+                self.buses.append(bus)
+                print(f"Successfully listening on {bus.channel_info}")
+            self.bus = self.buses[0]
             self._running = True
         except OSError as e:
+            self._shutdown_buses()
             print(
-                f"Error: Cannot find or open CAN interface '{self.interface}'.",
+                f"Error: Cannot find or open CAN interface '{interface}'.",
                 file=sys.stderr,
             )
             print(f"System error: {e}", file=sys.stderr)
@@ -65,32 +200,72 @@ class CanSniffer:
             self._running = False
             raise  # Re-raise the exception to be caught by the caller
         except can.CanError as e:
+            self._shutdown_buses()
             print(f"Error initializing CAN bus: {e}", file=sys.stderr)
             self._running = False
             raise  # Re-raise
 
-    def sniff(self):
-        """Starts sniffing messages and printing them."""
+    def _shutdown_buses(self):
+        for bus in self.buses:
+            bus.shutdown()
+        self.buses = []
+        self.bus = None
+
+    def capture(self, sinks=None):
+        """
+        Runs the capture engine on the connected buses until shutdown().
+
+        Args:
+            sinks: SINK_TYPES names, defaults to the sinks passed to
+                   __init__.
+        """
         if not self.bus or not self._running:
             print("Error: Bus is not connected.", file=sys.stderr)
             return
 
+        dispatcher = Dispatcher()
+        can_interfaces = [
+            CANInterface(
+                name,
+                bustype=self.bustype,
+                max_frames=self.recv_batch_size,
+                metrics=self.metrics.get(name),
+                latency=self.latency,
+                queue_frames=False,
+                # The engine receives from (and finally shuts down) our bus
+                bus=bus,
+                dispatcher=dispatcher,
+            )
+            for name, bus in zip(self.interfaces, self.buses)
+        ]
+        self.engine = CaptureEngine(
+            can_interfaces,
+            create_sinks(
+                sinks or self.sinks,
+                self.db_path,
+                self.binary_path,
+                title=self.interface,
+                refresh_interval=self.refresh_interval,
+                segments_path=self.segments_path,
+                batch_size=self.batch_size,
+                flush_interval=self.flush_interval,
+                pragma_profile=self.pragma_profile,
+                checkpoint_interval=self.checkpoint_interval,
+                shard_period=self.shard_period,
+                change_only=self.change_only,
+                keyframe_interval=self.keyframe_interval,
+                dbc_path=self.dbc_path,
+                latency=self.latency,
+            ),
+        )
+
         print("Sniffing started. Press Ctrl+C to stop.")
+        if self.exporter is not None:
+            self.exporter.start()
+        if self.latency is not None:
+            self.latency.start()
         try:
-            while self._running:
-                msg = self.bus.recv(timeout=1)
-                if msg.is_fd:
-                    print("FD ", end="")
-                elif not msg.is_fd:
-                    print("ST ", end="")
-                if msg is not None and self._running:
-                    if msg.is_error_frame:
-                        print(
-                            f"ERROR FRAME: {msg.timestamp} {msg.data}",
-                            file=sys.stderr,
-                        )
-                    else:
-                        print(self._format_message(msg))
+            asyncio.run(self.engine.run())
         except Exception as e:
             if self._running:
                 print(
@@ -98,75 +273,115 @@ class CanSniffer:
                     file=sys.stderr,
                 )
         finally:
-            pass
+            # Usually done by the engine already, unless it failed to start
+            self._shutdown_buses()
+            if self.exporter is not None:
+                self.exporter.stop()
+            if self.latency is not None:
+                self.latency.stop()
 
-    def sniff_db(self):
-        """Starts sniffing messages and saving them to an SQLite database."""
+    def _receive(self, bus, ring, metrics=None):
+        """Receiver loop of one bus for capture_processes()."""
+        while self._running:
+            messages = recv_bulk(bus, RECEIVE_TIMEOUT, self.recv_batch_size)
+            if messages:
+                if self.latency is not None:
+                    self.latency.record_messages("receive", messages)
+                if metrics is not None:
+                    metrics.update(messages)
+                ring.put(messages)
+
+    def capture_processes(self):
+        """
+        Captures into the database with a separate writer process until
+        shutdown().
 
+        This process only receives: every bus gets a thread that copies
+        frames into a shared-memory FrameRing. The writer process drains
+        the ring in batches into an SQLiteBatchWriter, so slow disk
+        writes never delay receiving. Frames that arrive while the ring
+        is full are dropped and counted.
+        """
         if not self.bus or not self._running:
             print("Error: Bus is not connected.", file=sys.stderr)
             return
 
-        print("Sniffing started. Press Ctrl+C to stop.")
-
-        # Connect to SQLite database
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Create table if it doesn't exist
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS can_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp REAL,
-                arbitration_id TEXT,
-                dlc INTEGER,
-                data TEXT,
-                is_fd INTEGER,
-                is_error_frame INTEGER
-            )
-        """
+        context = multiprocessing.get_context("spawn")
+        ring = FrameRing(self.ring_size, self.interfaces, lock=context.Lock())
+        stop = context.Event()
+        self.writer = context.Process(
+            target=write_ring_to_database,
+            args=(ring, stop, self.db_path),
+            kwargs={
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                "pragma_profile": self.pragma_profile,
+                "checkpoint_interval": self.checkpoint_interval,
+                "shard_period": self.shard_period,
+                "dbc_path": self.dbc_path,
+                "change_only": self.change_only,
+                "keyframe_interval": self.keyframe_interval,
+            },
+            name="can_logger-writer",
         )
-        conn.commit()
+        self.writer.start()
+        receivers = [
+            threading.Thread(
+                target=self._receive,
+                args=(bus, ring, self.metrics.get(name)),
+            )
+            for name, bus in zip(self.interfaces, self.buses)
+        ]
 
+        print("Sniffing started. Press Ctrl+C to stop.")
+        if self.exporter is not None:
+            self.exporter.start()
+        if self.latency is not None:
+            self.latency.start()
         try:
-            while self._running:
-                msg = self.bus.recv(timeout=1)
-                if msg is not None and self._running:
-                    # Save message to database
-                    cursor.execute(
-                        """
-                        INSERT INTO can_messages (timestamp, arbitration_id, dlc, data, is_fd, is_error_frame)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                        (
-                            msg.timestamp,
-                            f"{msg.arbitration_id:03X}",
-                            msg.dlc,
-                            " ".join(f"{b:02X}" for b in msg.data),
-                            int(msg.is_fd),
-                            int(msg.is_error_frame),
-                        ),
-                    )
-                    conn.commit()
-
-        except Exception as e:
+            for receiver in receivers:
+                receiver.start()
+            while self._running and self.writer.is_alive():
+                self.writer.join(WRITER_POLL_INTERVAL)
             if self._running:
-                print(
-                    f"\nAn error occurred during sniffing: {e}",
-                    file=sys.stderr,
-                )
+                print("Error: The database writer exited.", file=sys.stderr)
         finally:
-            # Close the database connection
-            conn.close()
+            self._running = False
+            for receiver in receivers:
+                if receiver.is_alive():
+                    receiver.join()
+            stop.set()
+            self.writer.join()
+            self._shutdown_buses()
+            if ring.dropped:
+                print(f"ring: {ring.dropped} frames dropped", file=sys.stderr)
+            ring.close()
+            if self.exporter is not None:
+                self.exporter.stop()
+            if self.latency is not None:
+                self.latency.stop()
+
+    def sniff(self):
+        """Starts sniffing messages and printing them."""
+        self.capture(["console"])
+
+    def sniff_db(self):
+        """Starts sniffing messages and saving them to an SQLite database."""
+        self.capture(["sqlite"])
 
     def shutdown(self):
         """Shuts down the CAN bus connection."""
         print("\nStopping sniffer...")
         self._running = False  # Signal the loop to stop
-        if self.bus:
+        if self.engine is not None:
+            # Flushes the sinks and shuts the bus down on its way out
+            self.engine.stop()
+        elif self.writer is not None:
+            # capture_processes() stops its receivers and the writer
+            pass
+        elif self.buses:
             try:
-                self.bus.shutdown()
+                self._shutdown_buses()
                 print("CAN bus shut down.")
             except Exception as e:
                 print(f"Error shutting down bus: {e}", file=sys.stderr)
@@ -191,9 +406,11 @@ def signal_handler(sig, frame):
 @click.option(
     "-i",
     "--interface",
+    "interfaces",
     required=True,
     type=str,
-    help="CAN interface name (e.g., vcan0, can0).",
+    multiple=True,
+    help="CAN interface name (e.g., vcan0, can0), repeatable.",
 )
 @click.option(
     "-b",
@@ -216,21 +433,253 @@ def signal_handler(sig, frame):
     default=None,
     help="Path to SQLite database file for saving messages.",
 )
-def main(interface, bustype, bitrate, db_path):
+@click.option(
+    "--filter",
+    "can_filters",
+    type=CAN_FILTER,
+    multiple=True,
+    help="Only receive frames matching ID:MASK (hex, candump syntax),"
+    " repeatable. IDs with more than 3 digits are extended. Applied in"
+    " the kernel on socketcan.",
+)
+@click.option(
+    "--sink",
+    "sinks",
+    type=click.Choice(SINK_TYPES, case_sensitive=False),
+    multiple=True,
+    help="Where captured frames go, repeatable. Defaults to sqlite with"
+    " --db-path, console otherwise.",
+)
+@click.option(
+    "--binary-path",
+    type=str,
+    default=DEFAULT_BINARY_PATH,
+    show_default=True,
+    help="File written by the binary sink.",
+)
+@click.option(
+    "--segments-path",
+    type=str,
+    default=DEFAULT_SEGMENTS_PATH,
+    show_default=True,
+    help="Directory of the segment files written by the segments sink.",
+)
+@click.option(
+    "--refresh-interval",
+    type=float,
+    default=DEFAULT_REFRESH_INTERVAL,
+    show_default=True,
+    help="Seconds between redraws of the top sink's live table.",
+)
+@click.option(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    help="Number of frames committed to the database in one transaction.",
+)
+@click.option(
+    "--flush-interval",
+    type=float,
+    default=DEFAULT_FLUSH_INTERVAL,
+    show_default=True,
+    help="Maximum time in seconds between database commits.",
+)
+@click.option(
+    "--pragma-profile",
+    type=click.Choice(list(PRAGMA_PROFILES), case_sensitive=False),
+    default=DEFAULT_PRAGMA_PROFILE,
+    show_default=True,
+    help="SQLite tuning profile (synchronous, cache, mmap, autocheckpoint).",
+)
+@click.option(
+    "--checkpoint-interval",
+    type=float,
+    default=DEFAULT_CHECKPOINT_INTERVAL,
+    show_default=True,
+    help="Seconds between background WAL checkpoints (0 disables them and"
+    " leaves checkpoints to SQLite).",
+)
+@click.option(
+    "--recv-batch-size",
+    type=int,
+    default=DEFAULT_MAX_FRAMES,
+    show_default=True,
+    help="Maximum number of queued frames drained per receive wakeup.",
+)
+@click.option(
+    "--shard",
+    "shard_period",
+    type=click.Choice(list(SHARD_PERIODS), case_sensitive=False),
+    default=None,
+    help="Write hourly or daily shard files plus a manifest next to"
+    " --db-path instead of a single database.",
+)
+@click.option(
+    "--change-only",
+    is_flag=True,
+    default=False,
+    help="Only store frames whose payload differs from the last stored"
+    " one of their ID. Dropped repeats are counted so database_tools"
+    " --expand can restore them.",
+)
+@click.option(
+    "--keyframe-interval",
+    type=float,
+    default=DEFAULT_KEYFRAME_INTERVAL,
+    show_default=True,
+    help="With --change-only, store every ID at least this often (s).",
+)
+@click.option(
+    "--multiprocess",
+    is_flag=True,
+    default=False,
+    help="Receive in this process and write the database in a separate"
+    " one, through a shared-memory ring buffer. Requires --db-path.",
+)
+@click.option(
+    "--ring-size",
+    type=int,
+    default=DEFAULT_RING_SIZE,
+    show_default=True,
+    help="Frames the --multiprocess ring buffer holds before dropping.",
+)
+@click.option(
+    "--dbc",
+    "dbc_path",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="DBC file for --signals.",
+)
+@click.option(
+    "--signals",
+    "store_signals",
+    is_flag=True,
+    default=False,
+    help="Also store the signals decoded with --dbc in the signals table.",
+)
+@click.option(
+    "--data-bitrate",
+    type=int,
+    default=DEFAULT_DATA_BITRATE,
+    show_default=True,
+    help="CAN-FD data phase bitrate, used to estimate the bus load.",
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics.",
+)
+@click.option(
+    "--metrics-file",
+    type=str,
+    default=None,
+    help="Periodically write the Prometheus metrics to this file.",
+)
+@click.option(
+    "--metrics-interval",
+    type=float,
+    default=DEFAULT_METRICS_INTERVAL,
+    show_default=True,
+    help="Seconds between metrics updates.",
+)
+@click.option(
+    "--latency",
+    is_flag=True,
+    default=False,
+    help="Record per-stage latency histograms from the kernel timestamp to"
+    " the commit and report their percentiles to stderr.",
+)
+@click.option(
+    "--latency-interval",
+    type=float,
+    default=DEFAULT_LATENCY_INTERVAL,
+    show_default=True,
+    help="Seconds between latency reports (0 only reports on exit).",
+)
+def main(
+    interfaces,
+    bustype,
+    bitrate,
+    db_path,
+    can_filters,
+    sinks,
+    binary_path,
+    segments_path,
+    refresh_interval,
+    batch_size,
+    flush_interval,
+    pragma_profile,
+    checkpoint_interval,
+    recv_batch_size,
+    shard_period,
+    change_only,
+    keyframe_interval,
+    multiprocess,
+    ring_size,
+    dbc_path,
+    store_signals,
+    data_bitrate,
+    metrics_port,
+    metrics_file,
+    metrics_interval,
+    latency,
+    latency_interval,
+):
     """
     Simple CAN bus sniffer using python-can and click.
-    Listens on the specified INTERFACE and prints received messages.
+    Listens on the specified interfaces and prints received messages.
     """
+    if store_signals and not dbc_path:
+        raise click.UsageError("--signals requires --dbc.")
+    if not sinks:
+        sinks = ("sqlite",) if db_path else ("console",)
+    if "sqlite" in sinks and not db_path:
+        raise click.UsageError("The sqlite sink requires --db-path.")
+    if multiprocess and set(sinks) != {"sqlite"}:
+        raise click.UsageError(
+            "--multiprocess requires --db-path and only writes to sqlite."
+        )
+
     global sniffer_instance
-    sniffer_instance = CanSniffer(interface, bustype, bitrate, db_path)
+    sniffer_instance = CanSniffer(
+        list(dict.fromkeys(interfaces)),
+        bustype,
+        bitrate,
+        db_path,
+        batch_size,
+        flush_interval,
+        pragma_profile,
+        checkpoint_interval,
+        recv_batch_size,
+        shard_period,
+        dbc_path if store_signals else None,
+        metrics_port,
+        metrics_file,
+        metrics_interval,
+        data_bitrate,
+        latency,
+        latency_interval,
+        sinks,
+        binary_path,
+        refresh_interval,
+        list(can_filters),
+        change_only,
+        keyframe_interval,
+        ring_size,
+        segments_path,
+    )
 
     # Register the signal handler for Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
 
     try:
         sniffer_instance.connect()
-        if sniffer_instance._running:
-            sniffer_instance.sniff_db()  # This will run until stopped or error
+        if sniffer_instance._running and multiprocess:
+            sniffer_instance.capture_processes()
+        elif sniffer_instance._running:
+            sniffer_instance.capture()  # This will run until stopped or error
     except (OSError, can.CanError):
         # Connection errors already printed by connect()
         sys.exit(1)
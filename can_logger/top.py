@@ -0,0 +1,96 @@
+import time
+
+import can
+
+DEFAULT_REFRESH_INTERVAL = 0.5
+
+# Moves the cursor home and clears the screen, so every redraw replaces
+# the previous one
+CLEAR_SCREEN = "\x1b[H\x1b[J"
+
+HEADER = (
+    f"{'ID':>8}  {'DLC':>4}  {'COUNT':>9}  {'RATE/s':>9}  {'AGE s':>7}  DATA"
+)
+
+
+class TopTable:
+    """
+    Live per arbitration ID view of the bus, like cantop.
+
+    update() costs O(1) per frame: it keeps the last frame and a count
+    per ID. Rates and ages are derived when render() is called, so the
+    cost of the view depends on the refresh rate and the number of IDs,
+    not on the frame rate.
+    """
+
+    def __init__(self, title: str = ""):
+        self.title: str = title
+        self.frames: int = 0
+        # Arbitration ID -> [last frame, frame count, count at last render]
+        self.rows: dict[int, list] = {}
+
+        self._rendered_at: float = time.time()
+        self._rendered_frames: int = 0
+
+    def update(self, messages: list[can.Message]) -> None:
+        rows = self.rows
+        for msg in messages:
+            row = rows.get(msg.arbitration_id)
+            if row is None:
+                rows[msg.arbitration_id] = [msg, 1, 0]
+            else:
+                row[0] = msg
+                row[1] += 1
+        self.frames += len(messages)
+
+    def render(
+        self,
+        width: int | None = None,
+        height: int | None = None,
+        now: float | None = None,
+    ) -> str:
+        """
+        Returns the table, rates are averaged since the previous call.
+
+        Rows are sorted by ID, cut to width columns and, together with
+        the two header lines, to height lines.
+        """
+        now = time.time() if now is None else now
+        elapsed = max(now - self._rendered_at, 1e-9)
+        self._rendered_at = now
+
+        total_rate = (self.frames - self._rendered_frames) / elapsed
+        self._rendered_frames = self.frames
+        lines = [
+            f"{self.title}  {self.frames} frames  {total_rate:.1f} frames/s"
+            f"  {len(self.rows)} IDs".strip(),
+            HEADER,
+        ]
+
+        visible = len(self.rows)
+        if height is not None and 2 + visible > height:
+            # Leave room for the "more IDs" line
+            visible = max(height - 3, 0)
+        for i, arbitration_id in enumerate(sorted(self.rows)):
+            row = self.rows[arbitration_id]
+            msg, count, previous = row
+            row[2] = count
+            if i >= visible:
+                continue
+            id_str = (
+                f"{arbitration_id:08X}"
+                if msg.is_extended_id
+                else f"{arbitration_id:03X}"
+            )
+            data_str = " ".join(f"{b:02X}" for b in msg.data)
+            lines.append(
+                f"{id_str:>8}  {'[' + str(msg.dlc) + ']':>4}  {count:>9}"
+                f"  {(count - previous) / elapsed:>9.1f}"
+                f"  {now - msg.timestamp:>7.2f}  {data_str}"
+            )
+        if visible < len(self.rows):
+            lines.append(f"... {len(self.rows) - visible} more IDs")
+
+        if width is not None:
+            lines = [line[:width] for line in lines]
+        return "\n".join(lines)
@@ -2,6 +2,8 @@ import pytest
 import pytest_asyncio
 import can
 import asyncio
+import socket
+import struct
 from can_logger.can_interface import CANInterface
 
 
@@ -95,7 +97,7 @@ async def test_connect_and_receive_message(mocker):
     mock_msg = mocker.Mock(spec=can.Message)
     mock_can_bus = mocker.patch("can_logger.can_interface.can.Bus")
     mock_bus = mock_can_bus.return_value
-    mock_bus.recv = mocker.MagicMock(side_effect=[mock_msg])
+    mock_bus.recv = mocker.MagicMock(side_effect=[mock_msg, None])
 
     iface = CANInterface("vcan0", fd_enabled=False)
     await iface.connect()
@@ -107,3 +109,46 @@ async def test_connect_and_receive_message(mocker):
     assert iface.bus is mock_bus
 
     await iface.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_batch_callback_receives_frames(mocker):
+    mock_msgs = [mocker.Mock(spec=can.Message) for _ in range(3)]
+    mock_can_bus = mocker.patch("can_logger.can_interface.can.Bus")
+    mock_can_bus.return_value.recv = mocker.MagicMock(
+        side_effect=mock_msgs + [None] * 1000
+    )
+    batches = []
+
+    async def on_batch(batch):
+        batches.append(batch)
+
+    iface = CANInterface("vcan0", fd_enabled=False)
+    iface.add_receive_callback(on_batch, batch=True)
+    await iface.connect()
+
+    for _ in mock_msgs:
+        await iface.receive_frame(timeout=0.1)
+    await iface.disconnect()
+
+    assert [msg for batch in batches for msg in batch] == mock_msgs
+
+
+@pytest.mark.asyncio
+async def test_reader_mode_receives_from_socket(mocker):
+    rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    mock_can_bus = mocker.patch("can_logger.can_interface.can.Bus")
+    mock_can_bus.return_value.socket = rx
+
+    iface = CANInterface("vcan0", fd_enabled=False, receive_mode="reader")
+    await iface.connect()
+    tx.send(struct.pack("=IBB2x", 0x123, 2, 0) + b"\xAA\xBB".ljust(8, b"\0"))
+
+    result = await iface.receive_frame(timeout=1.0)
+    await iface.disconnect()
+    rx.close()
+    tx.close()
+
+    assert result.arbitration_id == 0x123
+    assert result.data == bytearray(b"\xAA\xBB")
+    mock_can_bus.return_value.recv.assert_not_called()
@@ -0,0 +1,245 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import can
+import pytest
+
+from can_logger.can_interface import CANInterface
+from can_logger.capture import CaptureEngine
+from can_logger.database_tools.database_interface import DatabaseInterface
+from can_logger.dispatch import Dispatcher
+from can_logger.sinks import (
+    BINARY_MAGIC,
+    BinarySink,
+    NullSink,
+    Sink,
+    SQLiteSink,
+    create_sinks,
+    pack_frame,
+    read_binary_file,
+)
+from can_logger.sniffer import CanSniffer
+
+
+def frames(count):
+    return [
+        can.Message(
+            arbitration_id=0x100 + i % 8,
+            is_extended_id=False,
+            data=bytes([i % 256] * (i % 9)),
+        )
+        for i in range(count)
+    ]
+
+
+def stored_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT arbitration_id, data FROM can_messages ORDER BY id"
+        ).fetchall()
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+class SlowSink(Sink):
+    name = "slow"
+    queue_size = 10
+
+    async def write(self, messages):
+        await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_engine_fans_frames_out_to_sinks(tmp_path):
+    channel = "test-capture-fan-out"
+    null_sink = NullSink()
+    sinks = [
+        SQLiteSink(tmp_path / "test.db", checkpoint_interval=0),
+        BinarySink(tmp_path / "test.bin"),
+        null_sink,
+    ]
+    iface = CANInterface(channel, bustype="virtual", queue_frames=False)
+    engine = CaptureEngine([iface], sinks)
+    task = asyncio.create_task(engine.run())
+    await wait_until(lambda: iface.running)
+
+    sent = frames(100)
+    sender = can.Bus(channel=channel, interface="virtual")
+    for msg in sent:
+        sender.send(msg)
+    await wait_until(lambda: null_sink.frames == len(sent))
+    engine.stop()
+    await task
+    sender.shutdown()
+
+    expected = [(msg.arbitration_id, bytes(msg.data)) for msg in sent]
+    assert stored_rows(tmp_path / "test.db") == expected
+    assert [
+        (msg.arbitration_id, bytes(msg.data))
+        for msg in read_binary_file(tmp_path / "test.bin")
+    ] == expected
+    assert iface.bus is None
+
+
+@pytest.mark.asyncio
+async def test_engine_captures_several_interfaces_into_one_database(tmp_path):
+    channels = ["test-capture-multi-0", "test-capture-multi-1"]
+    dispatcher = Dispatcher()
+    ifaces = [
+        CANInterface(
+            channel,
+            bustype="virtual",
+            queue_frames=False,
+            dispatcher=dispatcher,
+        )
+        for channel in channels
+    ]
+    null_sink = NullSink()
+    db_path = tmp_path / "test.db"
+    engine = CaptureEngine(
+        ifaces, [SQLiteSink(db_path, checkpoint_interval=0), null_sink]
+    )
+    task = asyncio.create_task(engine.run())
+    await wait_until(lambda: all(iface.running for iface in ifaces))
+
+    senders = [
+        can.Bus(channel=channel, interface="virtual") for channel in channels
+    ]
+    for i, msg in enumerate(frames(100)):
+        senders[i % 2].send(msg)
+    await wait_until(lambda: null_sink.frames == 100)
+    engine.stop()
+    await task
+    for sender in senders:
+        sender.shutdown()
+
+    assert len(engine.subscribers) == 2
+    db = DatabaseInterface(db_path, channel=channels[1])
+    db.connect()
+    rows = db.get_all_messages()
+    db.disconnect()
+    assert len(rows) == 50
+    assert {row[8] for row in rows} == {channels[1]}
+    assert all(iface.bus is None for iface in ifaces)
+
+
+def test_engine_rejects_interfaces_without_shared_dispatcher():
+    with pytest.raises(ValueError, match="dispatcher"):
+        CaptureEngine([CANInterface("vcan0"), CANInterface("vcan1")], [])
+
+
+@pytest.mark.asyncio
+async def test_slow_sink_drops_without_holding_up_database(tmp_path, capsys):
+    channel = "test-capture-slow"
+    iface = CANInterface(channel, bustype="virtual", queue_frames=False)
+    sqlite_sink = SQLiteSink(tmp_path / "test.db", checkpoint_interval=0)
+    engine = CaptureEngine([iface], [SlowSink(), sqlite_sink])
+    task = asyncio.create_task(engine.run())
+    await wait_until(lambda: iface.running)
+
+    sender = can.Bus(channel=channel, interface="virtual")
+    for msg in frames(500):
+        sender.send(msg)
+    await wait_until(lambda: engine.subscribers["sqlite"].pending == 0)
+    await asyncio.sleep(0.1)
+    engine.stop()
+    await task
+    sender.shutdown()
+
+    assert len(stored_rows(tmp_path / "test.db")) == 500
+    assert engine.subscribers["slow"].dropped > 0
+    assert "slow:" in capsys.readouterr().err
+
+
+@pytest.mark.asyncio
+async def test_engine_closes_sinks_if_interface_fails(mocker, tmp_path):
+    mocker.patch(
+        "can_logger.can_interface.can.Bus", side_effect=OSError("no bus")
+    )
+    sink = BinarySink(tmp_path / "test.bin")
+    engine = CaptureEngine([CANInterface("vcan0")], [sink])
+
+    with pytest.raises(RuntimeError, match="vcan0"):
+        await engine.run()
+    assert sink.fd is None
+
+
+def test_binary_round_trip_keeps_flags(tmp_path):
+    sent = [
+        can.Message(
+            timestamp=1.5, arbitration_id=0x1ABCDEF, is_extended_id=True
+        ),
+        can.Message(
+            arbitration_id=0x7FF,
+            is_extended_id=False,
+            is_fd=True,
+            bitrate_switch=True,
+            error_state_indicator=True,
+            data=bytes(range(64)),
+        ),
+        can.Message(
+            arbitration_id=0x12, is_extended_id=False, is_remote_frame=True
+        ),
+        can.Message(is_error_frame=True, data=bytes(8)),
+    ]
+    path = tmp_path / "test.bin"
+    packed = b"".join(map(pack_frame, sent))
+    # The last record is cut short, as after a crash while writing
+    path.write_bytes(BINARY_MAGIC + packed + pack_frame(sent[1])[:20])
+
+    received = list(read_binary_file(path))
+
+    assert len(received) == len(sent)
+    for msg, expected in zip(received, sent):
+        assert msg.equals(expected, timestamp_delta=1e-9)
+
+
+def test_sniffer_captures_to_sinks(tmp_path):
+    channel = "test-capture-sniffer"
+    sniffer = CanSniffer(
+        channel,
+        bustype="virtual",
+        db_path=tmp_path / "test.db",
+        checkpoint_interval=0,
+        sinks=("sqlite", "binary"),
+        binary_path=tmp_path / "test.bin",
+    )
+    sniffer.connect()
+    thread = threading.Thread(target=sniffer.capture)
+    thread.start()
+    while (
+        sniffer.engine is None or not sniffer.engine.can_interfaces[0].running
+    ):
+        time.sleep(0.01)
+
+    sender = can.Bus(channel=channel, interface="virtual")
+    for msg in frames(50):
+        sender.send(msg)
+    sender.shutdown()
+    time.sleep(0.2)
+    sniffer.shutdown()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert len(stored_rows(tmp_path / "test.db")) == 50
+    assert len(list(read_binary_file(tmp_path / "test.bin"))) == 50
+
+
+def test_sqlite_sink_requires_db_path():
+    with pytest.raises(RuntimeError, match="database path"):
+        create_sinks(["console", "sqlite"])
+
+
+def test_sink_without_write_cannot_be_created():
+    class IncompleteSink(Sink):
+        name = "incomplete"
+
+    with pytest.raises(TypeError, match="write"):
+        IncompleteSink()
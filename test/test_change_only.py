@@ -0,0 +1,243 @@
+import sqlite3
+from datetime import datetime
+
+import can
+import pytest
+
+from can_logger.change_only import (
+    CREATE_REPEATS_TABLE_QUERY,
+    INSERT_REPEATS_QUERY,
+    ChangeFilter,
+)
+from can_logger.database import CANMessageDatabase, SQLiteBatchWriter
+from can_logger.database_tools.database_interface import (
+    DatabaseInterface,
+    expand_rows,
+)
+
+START = datetime(2025, 1, 1, 10).timestamp()
+
+
+def row(timestamp_ns, arbitration_id, data, channel="vcan0"):
+    return (timestamp_ns, arbitration_id, 0, len(data), data, 0, 0, channel)
+
+
+def periodic_frames(seconds=3):
+    """0x100 every 10 ms changing every 0.5 s, constant 0x200 every 20 ms."""
+    frames = []
+    for i in range(seconds * 100):
+        frames.append(
+            can.Message(
+                timestamp=START + i / 100,
+                arbitration_id=0x100,
+                is_extended_id=False,
+                data=[i // 50, 0xAA],
+            )
+        )
+        if i % 2:
+            frames.append(
+                can.Message(
+                    timestamp=START + i / 100 + 0.003,
+                    arbitration_id=0x200,
+                    is_extended_id=False,
+                    data=[0x55] * 8,
+                )
+            )
+    return frames
+
+
+def logical_rows(frames):
+    return [
+        (
+            round(msg.timestamp * 1_000_000_000),
+            msg.arbitration_id,
+            int(msg.is_extended_id),
+            msg.dlc,
+            bytes(msg.data),
+            0,
+            0,
+            msg.channel,
+        )
+        for msg in frames
+    ]
+
+
+def assert_same_frames(rows, expected):
+    """Repeats are interpolated, float timestamps are off by up to 1 us."""
+    assert [row[2:] for row in rows] == [row[1:] for row in expected]
+    assert all(
+        abs(row[1] - frame[0]) < 1000 for row, frame in zip(rows, expected)
+    )
+
+
+def test_change_filter_stores_changes_and_keyframes():
+    change_filter = ChangeFilter(keyframe_interval=1.0)
+    rows = [
+        row(0, 0x100, b"\x01"),
+        row(100_000_000, 0x100, b"\x01"),
+        row(200_000_000, 0x100, b"\x01"),
+        row(300_000_000, 0x100, b"\x02"),
+        row(400_000_000, 0x100, b"\x02"),
+        row(1_300_000_000, 0x100, b"\x02"),
+        row(1_400_000_000, 0x100, b"\x02"),
+    ]
+
+    stored, repeats = change_filter.filter(rows)
+
+    assert stored == [rows[0], rows[3], rows[5]]
+    assert repeats == [
+        (0, 0x100, 0, "vcan0", 2, 200_000_000),
+        (300_000_000, 0x100, 0, "vcan0", 1, 400_000_000),
+    ]
+    assert change_filter.finish() == [
+        (1_300_000_000, 0x100, 0, "vcan0", 1, 1_400_000_000)
+    ]
+    assert change_filter.finish() == []
+
+
+def test_change_filter_tracks_channels_separately():
+    change_filter = ChangeFilter(keyframe_interval=1.0)
+    rows = [
+        row(0, 0x100, b"\x01", "can0"),
+        row(10, 0x100, b"\x01", "can1"),
+        row(20, 0x100, b"\x01", "can0"),
+        row(30, 0x100, b"\x02", "can1"),
+    ]
+
+    stored, repeats = change_filter.filter(rows)
+
+    assert stored == [rows[0], rows[1], rows[3]]
+    assert change_filter.finish() == [(0, 0x100, 0, "can0", 1, 20)]
+
+
+def test_batch_writer_expands_channels_separately(tmp_path):
+    db_file = tmp_path / "channels.db"
+    # 0x100 every 10 ms on both buses, for 40 ms on can0 and 100 ms on can1
+    frames = [
+        can.Message(
+            timestamp=START + i / 100,
+            arbitration_id=0x100,
+            is_extended_id=False,
+            data=[channel],
+            channel=f"can{channel}",
+        )
+        for i in range(10)
+        for channel in (0, 1)
+        if channel or i < 4
+    ]
+    writer = SQLiteBatchWriter(
+        db_file, checkpoint_interval=None, change_only=True
+    )
+    writer.connect()
+    writer.add_messages(frames)
+    writer.close()
+
+    db = DatabaseInterface(db_file, expand=True)
+    db.connect()
+    expanded = db.get_all_messages()
+    can1 = DatabaseInterface(db_file, expand=True, channel="can1")
+    can1.connect()
+    can1_rows = can1.get_all_messages()
+    db.disconnect()
+    can1.disconnect()
+
+    # Both runs start at the same timestamp, neither replaces the other
+    assert_same_frames(expanded, logical_rows(frames))
+    assert_same_frames(
+        can1_rows, [row for row in logical_rows(frames) if row[7] == "can1"]
+    )
+
+
+def test_repeats_without_channel_are_replaced():
+    change_filter = ChangeFilter(keyframe_interval=1.0)
+    change_filter.filter([row(i, 0x100, b"\x01", None) for i in range(3)])
+    repeats = change_filter.finish()
+    conn = sqlite3.connect(":memory:")
+    conn.execute(CREATE_REPEATS_TABLE_QUERY)
+
+    conn.executemany(INSERT_REPEATS_QUERY, repeats)
+    conn.executemany(INSERT_REPEATS_QUERY, repeats)
+
+    assert repeats == [(0, 0x100, 0, "", 2, 2)]
+    assert conn.execute("SELECT * FROM frame_repeats").fetchall() == [
+        (0, 0x100, 0, "", 2, 2)
+    ]
+
+
+def test_expand_rows_merges_repeats_in_time_order():
+    rows = [
+        (1, 0, 0x100, 0, 1, b"\x01", 0, 0, 3, 300),
+        (2, 50, 0x200, 0, 1, b"\x02", 0, 0, 1, 150),
+        (3, 400, 0x100, 0, 1, b"\x03", 0, 0, None, None),
+    ]
+
+    expanded = [(row[0], row[1]) for row in expand_rows(rows)]
+    clipped = [(row[0], row[1]) for row in expand_rows(rows, end_ns=200)]
+
+    assert expanded == [
+        (1, 0),
+        (2, 50),
+        (1, 100),
+        (2, 150),
+        (1, 200),
+        (1, 300),
+        (3, 400),
+    ]
+    assert clipped == [(1, 0), (2, 50), (1, 100), (2, 150), (1, 200), (3, 400)]
+
+
+def test_batch_writer_round_trip(tmp_path):
+    db_file = tmp_path / "changes.db"
+    frames = periodic_frames()
+    writer = SQLiteBatchWriter(
+        db_file, batch_size=64, checkpoint_interval=None, change_only=True
+    )
+    writer.connect()
+    for i in range(0, len(frames), 50):
+        writer.add_messages(frames[i : i + 50])
+    writer.close()
+
+    db = DatabaseInterface(db_file, expand=True)
+    db.connect()
+    stored = DatabaseInterface(db_file)
+    stored.connect()
+    expanded = db.get_all_messages()
+    streamed = list(db.iter_all_messages())
+    by_id = db.get_messages_by_arbitration_id(0x200)
+    suppressed = db.get_suppressed_counts()
+    rows = stored.get_all_messages()
+    db.disconnect()
+    stored.disconnect()
+
+    # 6 payloads of 0x100 and one of 0x200, plus a keyframe per second
+    assert len(rows) == 6 + 1 + 2
+    assert_same_frames(expanded, sorted(logical_rows(frames)))
+    assert streamed == expanded
+    assert_same_frames(
+        by_id, [row for row in logical_rows(frames) if row[1] == 0x200]
+    )
+    assert suppressed == [(0x100, 0, 294), (0x200, 0, 147)]
+
+
+@pytest.mark.asyncio
+async def test_async_writer_round_trip_by_date(tmp_path):
+    db_file = tmp_path / "changes.db"
+    frames = periodic_frames(seconds=90)
+    database = CANMessageDatabase(
+        db_file, checkpoint_interval=None, change_only=True
+    )
+    await database.connect()
+    await database.add_messages(frames)
+    await database.disconnect()
+
+    db = DatabaseInterface(db_file, expand=True)
+    db.connect()
+    minute = db.get_messages_by_datetime("2025-01-01", 10, 0)
+    db.disconnect()
+
+    expected = [
+        row
+        for row in sorted(logical_rows(frames))
+        if row[0] < round((START + 60) * 1_000_000_000)
+    ]
+    assert_same_frames(minute, expected)
@@ -0,0 +1,265 @@
+import sqlite3
+from datetime import datetime
+
+import can
+import pytest
+
+from can_logger.database import SQLiteBatchWriter
+from can_logger.database_tools.compaction import (
+    compact_database,
+    decode_chunk,
+    encode_chunk,
+)
+from can_logger.database_tools.database_interface import DatabaseInterface
+from can_logger.database_tools.export import (
+    iter_frame_columns,
+    load_frame_columns,
+)
+
+START = datetime(2025, 1, 1, 10).timestamp()
+
+
+@pytest.fixture
+def logged_db(tmp_path):
+    """Two hours of 4 IDs at 1 Hz plus a 10 Hz ID with slowly changing data."""
+    db_file = tmp_path / "logged.db"
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    messages = []
+    for i in range(7200):
+        messages.append(
+            can.Message(
+                timestamp=START + i, arbitration_id=i % 4, data=[i % 256]
+            )
+        )
+        messages.extend(
+            can.Message(
+                timestamp=START + i + j / 10,
+                arbitration_id=0x1ABCDEF,
+                is_extended_id=True,
+                is_fd=True,
+                data=bytes([i // 60 % 256]) * 12,
+            )
+            for j in range(1, 10)
+        )
+    writer.add_messages(messages)
+    writer.close()
+    return db_file
+
+
+def read_all(db_file, method="get_all_messages", *args, expand=False):
+    db = DatabaseInterface(db_file, expand=expand)
+    db.connect()
+    rows = getattr(db, method)(*args)
+    if not isinstance(rows, list):
+        rows = list(rows)
+    db.disconnect()
+    return rows
+
+
+def test_chunk_round_trip():
+    rows = [
+        (7, 1_000, 0x1ABCDEF, 1, 15, bytes(range(64)), 1, 0, "can1"),
+        (9, 900, 0x1ABCDEF, 1, 0, b"", 0, 1, "can1"),
+        (12, 2_000, 0x1ABCDEF, 1, 8, b"\xff" * 8, 0, 0, "can1"),
+    ]
+
+    assert decode_chunk(encode_chunk(rows), 0x1ABCDEF, 1, "can1") == rows
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_compacted_rows_read_back_unchanged(logged_db, codec):
+    before = read_all(logged_db)
+    by_id = read_all(logged_db, "get_messages_by_arbitration_id", "1ABCDEF")
+    hour = read_all(logged_db, "get_messages_by_datetime", "2025-01-01", 10)
+    minute = read_all(
+        logged_db,
+        "iter_messages_by_arbitration_id_and_datetime",
+        2,
+        "2025-01-01",
+        11,
+        30,
+    )
+    size_before = logged_db.stat().st_size
+
+    # The first 90 minutes, the last block is split
+    cutoff = round((START + 5400) * 1_000_000_000)
+    rows, chunks = compact_database(logged_db, cutoff, block=600, codec=codec)
+
+    assert rows == sum(row[1] < cutoff for row in before)
+    assert chunks == 9 * 5
+    assert logged_db.stat().st_size < size_before / 2
+    assert read_all(logged_db) == before
+    assert read_all(logged_db, "iter_all_messages") == before
+    assert (
+        read_all(logged_db, "get_messages_by_arbitration_id", "1ABCDEF")
+        == by_id
+    )
+    assert (
+        read_all(logged_db, "iter_messages_by_datetime", "2025-01-01", 10)
+        == hour
+    )
+    assert (
+        read_all(
+            logged_db,
+            "get_messages_by_arbitration_id_and_datetime",
+            2,
+            "2025-01-01",
+            11,
+            30,
+        )
+        == minute
+    )
+
+
+def test_compacted_rows_in_stats_export_and_last(logged_db):
+    def read(db_file):
+        db = DatabaseInterface(db_file)
+        db.connect()
+        result = (
+            db.get_frame_stats(),
+            db.get_frame_stats(600, arbitration_id="1ABCDEF"),
+            load_frame_columns(db, date="2025-01-01", hour=10),
+            db.get_last_n_messages(5),
+            db.get_last_n_messages(20_000),
+        )
+        db.disconnect()
+        return result
+
+    stats, buckets, columns, last, many = read(logged_db)
+
+    # 18000 frames stay in can_messages
+    compact_database(logged_db, round((START + 5400) * 1e9), block=600)
+    after = read(logged_db)
+
+    assert after[0] == stats
+    assert after[1] == buckets
+    assert set(after[2]) == set(columns)
+    for name, values in columns.items():
+        assert (after[2][name] == values).all()
+    assert after[3] == last
+    assert after[4] == many
+    assert len(many) == 20_000
+
+
+def test_compacted_stats_and_export_stream_per_channel(tmp_path):
+    db_file = tmp_path / "channels.db"
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=START + i / (2 + i % 2),
+                arbitration_id=0x100,
+                data=[i // 7 % 256],
+                channel=f"can{i % 2}",
+            )
+            for i in range(1000)
+        ]
+    )
+    writer.close()
+
+    def read():
+        db = DatabaseInterface(db_file, fetch_size=64)
+        db.connect()
+        stats = db.get_frame_stats(), db.get_frame_stats(30)
+        chunks = list(iter_frame_columns(db))
+        # Compacted rows are not copied anywhere to be read
+        assert not db.conn.execute(
+            "SELECT * FROM temp.sqlite_master"
+        ).fetchall()
+        db.disconnect()
+        return stats, chunks
+
+    stats, _ = read()
+    compact_database(db_file, round((START + 100) * 1e9), block=60)
+    after, chunks = read()
+
+    # Only the summation order of the gaps differs
+    for computed, expected in zip(after, stats):
+        assert [tuple(row) for row in computed] == [
+            pytest.approx(tuple(row)) for row in expected
+        ]
+    assert all(len(chunk["timestamp_ns"]) <= 64 for chunk in chunks)
+    assert sum(len(chunk["timestamp_ns"]) for chunk in chunks) == 1000
+
+
+def test_compacting_again_merges_into_existing_chunks(logged_db):
+    before = read_all(logged_db)
+
+    compact_database(logged_db, round((START + 100) * 1e9), block=3600)
+    compact_database(logged_db, round((START + 200) * 1e9), block=3600)
+
+    with sqlite3.connect(logged_db) as conn:
+        chunks = conn.execute("SELECT count(*) FROM can_chunks").fetchone()
+    assert chunks == (5,)
+    assert read_all(logged_db) == before
+
+
+def test_compaction_keeps_channels(tmp_path):
+    db_file = tmp_path / "channels.db"
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=START + i,
+                arbitration_id=0x100,
+                data=[i % 256],
+                channel=f"can{i % 2}",
+            )
+            for i in range(100)
+        ]
+    )
+    writer.close()
+    before = read_all(db_file)
+
+    rows, chunks = compact_database(db_file, round((START + 60) * 1e9))
+
+    db = DatabaseInterface(db_file, channel="can1")
+    db.connect()
+    can1 = db.get_all_messages()
+    db.disconnect()
+    assert (rows, chunks) == (60, 2)
+    assert read_all(db_file) == before
+    assert can1 == [row for row in before if row[8] == "can1"]
+
+
+def test_compacted_change_only_rows_expand(tmp_path):
+    db_file = tmp_path / "changes.db"
+    writer = SQLiteBatchWriter(
+        db_file, checkpoint_interval=None, change_only=True
+    )
+    writer.connect()
+    # 0x100 every 100 ms on two buses, changing every 2.5 s on can1 only
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=START + i / 10,
+                arbitration_id=0x100,
+                data=[i // 25 if channel else 0],
+                channel=f"can{channel}",
+            )
+            for i in range(600)
+            for channel in (0, 1)
+        ]
+    )
+    writer.close()
+    expanded = read_all(db_file, expand=True)
+    by_id = read_all(
+        db_file, "iter_messages_by_arbitration_id", "100", expand=True
+    )
+
+    compact_database(db_file, round((START + 30) * 1e9), block=10)
+    partly = read_all(db_file, expand=True)
+    compact_database(db_file, round((START + 60) * 1e9), block=10)
+
+    assert len(expanded) == 1200
+    assert partly == expanded
+    assert read_all(db_file, expand=True) == expanded
+    assert (
+        read_all(
+            db_file, "iter_messages_by_arbitration_id", "100", expand=True
+        )
+        == by_id
+    )
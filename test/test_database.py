@@ -1,8 +1,13 @@
 import pytest
 import pytest_asyncio
 import can
+import sqlite3
 from pathlib import Path
-from can_logger.database import CANMessageDatabase
+from can_logger.database import (
+    CANMessageDatabase,
+    SQLiteBatchWriter,
+    WalCheckpointer,
+)
 
 
 @pytest.fixture
@@ -10,10 +15,12 @@ def msg(mocker):
     msg = mocker.MagicMock(spec=can.Message)
     msg.timestamp = 123.456
     msg.arbitration_id = 0x1AB
+    msg.is_extended_id = False
     msg.dlc = 3
     msg.data = bytearray([0x01, 0x02, 0x03])
     msg.is_fd = True
     msg.is_error_frame = False
+    msg.channel = "vcan0"
     return msg
 
 
@@ -24,6 +31,7 @@ async def db(mocker):
         "can_logger.database.aiosqlite.connect", new_callable=mocker.AsyncMock
     )
     mock_cursor = mock_conn.return_value.cursor.return_value
+    mock_cursor.fetchone.return_value = (0, 0)
 
     db = CANMessageDatabase("test.db")
     await db.connect()
@@ -46,44 +54,78 @@ def test_database_init(db):
 
 @pytest.mark.asyncio
 async def test_connect_creates_table_and_sets_connected(db):
-    db._test_cursor.execute.assert_called_once()
-    db._test_cursor.execute.assert_called_with(
+    db._test_cursor.execute.assert_any_call(
         """
                 CREATE TABLE IF NOT EXISTS can_messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp REAL,
-                    arbitration_id TEXT,
+                    timestamp_ns INTEGER,
+                    arbitration_id INTEGER,
+                    is_extended_id INTEGER,
                     dlc INTEGER,
-                    data TEXT,
+                    data BLOB,
                     is_fd INTEGER,
-                    is_error_frame INTEGER
+                    is_error_frame INTEGER,
+                    channel TEXT
                 )
                 """
     )
+    db._test_cursor.execute.assert_called_with("PRAGMA user_version = 3")
     assert db.db_connected is True
 
 
+@pytest.mark.asyncio
+async def test_connect_refuses_legacy_layout(mocker):
+    mock_conn = mocker.patch(
+        "can_logger.database.aiosqlite.connect", new_callable=mocker.AsyncMock
+    )
+    mock_conn.return_value.cursor.return_value.fetchone.return_value = (0, 1)
+
+    db = CANMessageDatabase("legacy.db")
+    await db.connect()
+
+    assert db.db_connected is False
+
+
 @pytest.mark.asyncio
 async def test_add_message_inserts_correct_data(db, msg):
     await db.add_message(msg)
+    await db.flush()
 
-    db._test_cursor.execute.assert_any_call(
+    db._test_cursor.executemany.assert_any_call(
         """
-            INSERT INTO can_messages (timestamp, arbitration_id, dlc, data, is_fd, is_error_frame)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO can_messages (timestamp_ns, arbitration_id, is_extended_id, dlc, data, is_fd, is_error_frame, channel)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-        (
-            msg.timestamp,
-            f"{msg.arbitration_id:03X}",
-            msg.dlc,
-            "01 02 03",
-            1,
-            0,
-        ),
+        [(123456000000, 0x1AB, 0, 3, b"\x01\x02\x03", 1, 0, "vcan0")],
     )
     db._test_conn.commit.assert_called()
 
 
+@pytest.mark.asyncio
+async def test_add_message_buffers_until_batch_size(db, msg):
+    db.flush_interval = 3600
+    db.batch_size = 3
+
+    await db.add_message(msg)
+    await db.add_message(msg)
+    db._test_cursor.executemany.assert_not_called()
+
+    await db.add_message(msg)
+    db._test_cursor.executemany.assert_called_once()
+    assert len(db._test_cursor.executemany.call_args.args[1]) == 3
+
+
+@pytest.mark.asyncio
+async def test_disconnect_flushes_pending_messages(db, msg):
+    db.flush_interval = 3600
+    await db.add_messages([msg, msg])
+
+    await db.disconnect()
+
+    db._test_cursor.executemany.assert_called_once()
+    assert len(db._test_cursor.executemany.call_args.args[1]) == 2
+
+
 @pytest.mark.asyncio
 async def test_add_message_raises_if_not_connected(db, msg):
     db.db_connected = False
@@ -99,3 +141,100 @@ async def test_disconnect_closes_cursor_and_connection(db):
     db._test_cursor.close.assert_called_once()
     db._test_conn.close.assert_called_once()
     assert db.db_connected is False
+
+
+def test_batch_writer_commits_on_close(tmp_path, msg):
+    db_file = tmp_path / "batch.db"
+    writer = SQLiteBatchWriter(db_file, batch_size=100, flush_interval=3600)
+    writer.connect()
+
+    writer.add_messages([msg] * 5)
+    assert writer._pending
+
+    writer.close()
+    writer.close()
+
+    conn = sqlite3.connect(db_file)
+    count = conn.execute("SELECT COUNT(*) FROM can_messages").fetchone()[0]
+    conn.close()
+    assert count == 5
+
+
+@pytest.mark.parametrize(
+    "checkpoint_interval, autocheckpoint", [(5.0, 0), (None, 1000)]
+)
+def test_batch_writer_applies_wal_profile(
+    tmp_path, checkpoint_interval, autocheckpoint
+):
+    db_file = tmp_path / "wal.db"
+    writer = SQLiteBatchWriter(
+        db_file, pragma_profile="fast", checkpoint_interval=checkpoint_interval
+    )
+    writer.connect()
+
+    assert writer.conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    # The WAL is never left without any checkpoints
+    assert writer.conn.execute("PRAGMA wal_autocheckpoint").fetchone() == (
+        autocheckpoint,
+    )
+    writer.close()
+
+
+def test_checkpointer_truncates_oversized_wal(tmp_path, msg):
+    db_file = tmp_path / "wal.db"
+    writer = SQLiteBatchWriter(
+        db_file, pragma_profile="fast", checkpoint_interval=None
+    )
+    writer.connect()
+    writer.add_messages([msg] * 1000)
+    writer.flush()
+
+    checkpointer = WalCheckpointer(db_file, max_wal_size=0)
+    conn = sqlite3.connect(db_file)
+    busy, _, _ = checkpointer.checkpoint(conn)
+    wal_size = checkpointer.wal_path.stat().st_size
+    conn.close()
+    writer.close()
+
+    assert busy == 0
+    assert wal_size == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_pending_messages(db, msg):
+    db.flush_interval = 3600
+    await db.add_messages([msg, msg])
+    db._test_cursor.executemany.side_effect = [sqlite3.OperationalError, None]
+
+    with pytest.raises(sqlite3.OperationalError):
+        await db.flush()
+    db._test_conn.rollback.assert_called_once()
+    assert len(db._pending) == 2
+
+    await db.add_message(msg)
+    await db.flush()
+    assert len(db._test_cursor.executemany.call_args.args[1]) == 3
+    assert not db._pending
+
+
+def test_batch_writer_retries_failed_flush(tmp_path, msg):
+    db_file = tmp_path / "retry.db"
+    writer = SQLiteBatchWriter(
+        db_file, batch_size=100, flush_interval=3600, checkpoint_interval=None
+    )
+    writer.connect()
+    writer.conn.execute(
+        "CREATE TRIGGER fail BEFORE INSERT ON can_messages"
+        " BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+    writer.add_messages([msg] * 5)
+
+    with pytest.raises(sqlite3.IntegrityError, match="disk full"):
+        writer.flush()
+    writer.conn.execute("DROP TRIGGER fail")
+    writer.close()
+
+    conn = sqlite3.connect(db_file)
+    count = conn.execute("SELECT COUNT(*) FROM can_messages").fetchone()[0]
+    conn.close()
+    assert count == 5
@@ -1,7 +1,26 @@
-import pytest
-from pathlib import Path
+import sqlite3
 from datetime import datetime
-from can_logger.database_tools.database_interface import DatabaseInterface
+from pathlib import Path
+
+import can
+import numpy as np
+import pytest
+
+from can_logger.database import SQLiteBatchWriter
+from can_logger.database_tools.__main__ import print_messages
+from can_logger.database_tools.database_interface import (
+    LEGACY_SCHEMA_VERSION,
+    DatabaseInterface,
+    merge_stats,
+)
+from can_logger.database_tools.export import (
+    FLAG_EXTENDED_ID,
+    FLAG_FD,
+    export_npz,
+    load_frame_columns,
+)
+from can_logger.database_tools.migration import migrate_database
+from can_logger.database_tools.optimize import optimize_database
 
 
 @pytest.fixture
@@ -11,6 +30,7 @@ def db(mocker):
         autospec=True,
     )
     mock_cursor = mock_conn.return_value.cursor.return_value
+    mock_conn.return_value.execute.return_value.fetchone.return_value = (3, 1)
 
     db = DatabaseInterface("test.db")
     db.connect()
@@ -67,11 +87,21 @@ def test_get_messages_by_arbitration_id_executes_query(db):
     db.get_messages_by_arbitration_id("1AB")
 
     db._test_cursor.execute.assert_called_once_with(
-        "SELECT * FROM can_messages WHERE arbitration_id = ?", ("1AB",)
+        "SELECT * FROM can_messages WHERE arbitration_id = ?", (0x1AB,)
     )
     db._test_cursor.fetchall.assert_called_once()
 
 
+def test_get_messages_by_arbitration_id_legacy_layout(db):
+    db.schema_version = LEGACY_SCHEMA_VERSION
+
+    db.get_messages_by_arbitration_id("1AB")
+
+    db._test_cursor.execute.assert_called_once_with(
+        "SELECT * FROM can_messages WHERE arbitration_id = ?", ("1AB",)
+    )
+
+
 @pytest.mark.parametrize(
     "args, start_str, end_str",
     [
@@ -100,8 +130,377 @@ def test_get_messages_by_datetime_builds_correct_range(
 
     db.get_messages_by_datetime(*args)
 
+    db._test_cursor.execute.assert_called_once_with(
+        "SELECT * FROM can_messages WHERE timestamp_ns >= ? AND timestamp_ns"
+        " <= ?",
+        (round(start_ts * 1e9), round(end_ts * 1e9)),
+    )
+    db._test_cursor.fetchall.assert_called_once()
+
+
+def test_get_messages_by_datetime_legacy_layout(db):
+    db.schema_version = LEGACY_SCHEMA_VERSION
+    start_ts = datetime(2025, 1, 1).timestamp()
+    end_ts = datetime(2025, 1, 1, 23, 59, 59, 999999).timestamp()
+
+    db.get_messages_by_datetime("2025-01-01")
+
     db._test_cursor.execute.assert_called_once_with(
         "SELECT * FROM can_messages WHERE timestamp >= ? AND timestamp <= ?",
         (start_ts, end_ts),
     )
-    db._test_cursor.fetchall.assert_called_once()
+
+
+def test_migrate_converts_legacy_rows(tmp_path):
+    db_file = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        """
+        CREATE TABLE can_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp REAL,
+            arbitration_id TEXT,
+            dlc INTEGER,
+            data TEXT,
+            is_fd INTEGER,
+            is_error_frame INTEGER
+        )
+        """
+    )
+    conn.executemany(
+        "INSERT INTO can_messages (timestamp, arbitration_id, dlc, data,"
+        " is_fd, is_error_frame) VALUES (?, ?, ?, ?, ?, ?)",
+        [(1.5, "1AB", 3, "01 02 03", 0, 0), (2.0, "1234567", 0, "", 1, 0)],
+    )
+    conn.commit()
+    conn.close()
+
+    legacy = DatabaseInterface(db_file)
+    legacy.connect()
+    legacy_rows = legacy.get_all_messages()
+    legacy.disconnect()
+
+    assert migrate_database(db_file) is True
+    assert migrate_database(db_file) is False
+
+    db = DatabaseInterface(db_file)
+    db.connect()
+    rows = db.get_all_messages()
+    db.disconnect()
+
+    assert rows == legacy_rows
+    assert rows == [
+        (1, 1_500_000_000, 0x1AB, 0, 3, b"\x01\x02\x03", 0, 0, None),
+        (2, 2_000_000_000, 0x1234567, 1, 0, b"", 1, 0, None),
+    ]
+
+
+def test_migrate_adds_channel_to_v2_tables(tmp_path):
+    db_file = tmp_path / "v2.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        """
+        CREATE TABLE can_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp_ns INTEGER,
+            arbitration_id INTEGER,
+            is_extended_id INTEGER,
+            dlc INTEGER,
+            data BLOB,
+            is_fd INTEGER,
+            is_error_frame INTEGER
+        )
+        """
+    )
+    conn.execute(
+        "INSERT INTO can_messages (timestamp_ns, arbitration_id,"
+        " is_extended_id, dlc, data, is_fd, is_error_frame)"
+        " VALUES (1500000000, 427, 0, 1, x'01', 0, 0)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE frame_repeats (
+            timestamp_ns INTEGER,
+            arbitration_id INTEGER,
+            is_extended_id INTEGER,
+            count INTEGER,
+            last_timestamp_ns INTEGER,
+            PRIMARY KEY (arbitration_id, is_extended_id, timestamp_ns)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "INSERT INTO frame_repeats VALUES (1500000000, 427, 0, 1, 1600000000)"
+    )
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    v2 = DatabaseInterface(db_file)
+    v2.connect()
+    v2_rows = v2.get_all_messages()
+    v2.disconnect()
+    v2 = DatabaseInterface(db_file, expand=True)
+    v2.connect()
+    v2_expanded = v2.get_all_messages()
+    v2.disconnect()
+    with pytest.raises(RuntimeError, match="migrate"):
+        SQLiteBatchWriter(db_file, checkpoint_interval=None).connect()
+
+    assert migrate_database(db_file) is True
+
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=2.0,
+                arbitration_id=0x1AB,
+                is_extended_id=False,
+                channel="can1",
+            )
+        ]
+    )
+    writer.close()
+    db = DatabaseInterface(db_file)
+    db.connect()
+    rows = db.get_all_messages()
+    db.disconnect()
+    db = DatabaseInterface(db_file, expand=True)
+    db.connect()
+    expanded = db.get_all_messages()
+    db.disconnect()
+
+    assert v2_rows == [(1, 1_500_000_000, 0x1AB, 0, 1, b"\x01", 0, 0, None)]
+    assert v2_expanded == [
+        *v2_rows,
+        (1, 1_600_000_000, 0x1AB, 0, 1, b"\x01", 0, 0, None),
+    ]
+    assert expanded == [*v2_expanded, rows[-1]]
+    assert rows == [
+        *v2_rows,
+        (2, 2_000_000_000, 0x1AB, 0, 0, b"", 0, 0, "can1"),
+    ]
+
+
+@pytest.fixture
+def logged_db(tmp_path):
+    db_file = tmp_path / "logged.db"
+    start = datetime(2025, 1, 1, 10).timestamp()
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=start + i, arbitration_id=i % 4, data=[i % 256]
+            )
+            for i in range(7200)
+        ]
+    )
+    writer.close()
+    return db_file
+
+
+def test_combined_id_and_datetime_query(logged_db):
+    db = DatabaseInterface(logged_db)
+    db.connect()
+    rows = db.get_messages_by_arbitration_id_and_datetime(1, "2025-01-01", 11)
+    db.disconnect()
+
+    assert len(rows) == 900
+    assert {row[2] for row in rows} == {1}
+
+
+def test_explain_uses_index_after_optimize(logged_db):
+    db = DatabaseInterface(logged_db, explain=True)
+    db.connect()
+    db.get_messages_by_arbitration_id_and_datetime(1, "2025-01-01", 11)
+    before = db.query_plans[-1]
+    db.disconnect()
+
+    assert optimize_database(logged_db) == [logged_db]
+
+    db = DatabaseInterface(logged_db, explain=True)
+    db.connect()
+    rows = db.get_messages_by_arbitration_id_and_datetime(1, "2025-01-01", 11)
+    after = db.query_plans[-1]
+    db.disconnect()
+
+    assert rows == []
+    assert before.estimated_rows is None
+    assert "idx_can_messages_id_ts" in after.plan[0]
+    # analysis_limit keeps ANALYZE cheap, so this is only a rough figure
+    assert 0 < after.estimated_rows <= 1800
+
+
+def test_channel_filter(tmp_path):
+    db_file = tmp_path / "channels.db"
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=i,
+                arbitration_id=0x100,
+                data=[i],
+                channel=f"can{i % 3}",
+            )
+            for i in range(30)
+        ]
+    )
+    writer.close()
+
+    db = DatabaseInterface(db_file, channel="can1")
+    db.connect()
+    rows = db.get_messages_by_arbitration_id(0x100)
+    last = db.get_last_n_messages(2)
+    (stats,) = db.get_frame_stats()
+    db.disconnect()
+
+    assert [row[5][0] for row in rows] == list(range(1, 30, 3))
+    assert {row[8] for row in rows} == {"can1"}
+    assert [row[5][0] for row in last] == [28, 25]
+    assert (stats.count, stats.min_gap_us) == (10, 3_000_000.0)
+
+
+def test_iter_messages_streams_in_chunks(logged_db):
+    db = DatabaseInterface(logged_db, fetch_size=100)
+    db.connect()
+    rows = db.iter_all_messages()
+    first = next(rows)
+    rest = list(rows)
+    by_id = list(db.iter_messages_by_arbitration_id("1"))
+    db.disconnect()
+
+    assert first[0] == 1
+    assert len(rest) == 7199
+    assert by_id == [row for row in [first, *rest] if row[2] == 1]
+
+
+def test_print_messages_accepts_iterators(capsys):
+    rows = (
+        (i, 1_700_000_000_000_000_000, 0x123, 0, 1, b"\x01", 0, 0, "can0")
+        for i in range(2500)
+    )
+    print_messages(rows)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2500
+    assert lines[-1].split()[0] == "2499"
+
+
+def test_load_frame_columns(tmp_path):
+    db_file = tmp_path / "columns.db"
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=1.5,
+                arbitration_id=0x123,
+                is_extended_id=False,
+                data=[1, 2],
+            ),
+            can.Message(
+                timestamp=2.0,
+                arbitration_id=0x1ABCDEF0,
+                is_extended_id=True,
+                is_fd=True,
+                data=bytes(range(64)),
+            ),
+        ]
+    )
+    writer.close()
+
+    db = DatabaseInterface(db_file, fetch_size=1)
+    db.connect()
+    columns = load_frame_columns(db)
+    only_fd = load_frame_columns(db, arbitration_id=0x1ABCDEF0)
+    db.disconnect()
+
+    assert columns["timestamp_ns"].tolist() == [1_500_000_000, 2_000_000_000]
+    assert columns["timestamp"].tolist() == [1.5, 2.0]
+    assert columns["arbitration_id"].tolist() == [0x123, 0x1ABCDEF0]
+    assert columns["dlc"].tolist() == [2, 64]
+    assert columns["flags"].tolist() == [0, FLAG_EXTENDED_ID | FLAG_FD]
+    assert columns["data"].shape == (2, 64)
+    assert columns["data"][0, :3].tolist() == [1, 2, 0]
+    assert columns["data"][1].tobytes() == bytes(range(64))
+    assert only_fd["dlc"].tolist() == [64]
+
+
+def test_export_npz_round_trip(logged_db, tmp_path):
+    output = tmp_path / "export.npz"
+    db = DatabaseInterface(logged_db, fetch_size=1000)
+    db.connect()
+    count = export_npz(db, output, arbitration_id="2", date="2025-01-01")
+    db.disconnect()
+
+    exported = np.load(output)
+    assert count == 1800
+    assert exported["timestamp_ns"].shape == (1800,)
+    assert set(exported["arbitration_id"].tolist()) == {2}
+    assert exported["data"].shape == (1800, 64)
+    assert exported["data"][:, 0].tolist() == [
+        i % 256 for i in range(2, 7200, 4)
+    ]
+    assert not list(tmp_path.glob("tmp*"))
+
+
+def test_frame_stats(tmp_path):
+    db_file = tmp_path / "stats.db"
+    start = datetime(2025, 1, 1, 10).timestamp()
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    # 0x100 every 10 ms with a payload change every 10 frames,
+    # 0x200 alternating 20 / 40 ms gaps
+    messages = [
+        can.Message(
+            timestamp=start + i * 0.01, arbitration_id=0x100, data=[i // 10]
+        )
+        for i in range(200)
+    ]
+    t = start
+    for i in range(61):
+        messages.append(can.Message(timestamp=t, arbitration_id=0x200))
+        t += 0.02 if i % 2 else 0.04
+    writer.add_messages(sorted(messages, key=lambda msg: msg.timestamp))
+    writer.close()
+
+    db = DatabaseInterface(db_file)
+    db.connect()
+    total = db.get_frame_stats()
+    buckets = db.get_frame_stats(1.0, arbitration_id=0x100)
+    db.disconnect()
+
+    fast, slow = total
+    assert (fast.arbitration_id, fast.count) == (0x100, 200)
+    assert fast.rate == pytest.approx(100)
+    assert fast.mean_gap_us == pytest.approx(10_000, abs=1)
+    assert fast.jitter_us == pytest.approx(0, abs=1)
+    assert fast.payload_changes == 19
+    assert slow.mean_gap_us == pytest.approx(30_000, abs=1)
+    assert slow.jitter_us == pytest.approx(10_000, abs=1)
+    assert (slow.min_gap_us, slow.max_gap_us) == pytest.approx(
+        (20_000, 40_000), abs=1
+    )
+    assert [row.count for row in buckets] == [100, 100]
+    assert buckets[1].bucket_start_ns - buckets[0].bucket_start_ns == 10**9
+
+
+def test_merge_stats_combines_shards():
+    interval_ns = 10**9
+    # count, gaps, sum, sum of squares, min, max, changes, first, last
+    rows = [
+        (5, 0x10, 2, 1, 10.0, 100.0, 10.0, 10.0, 1, 10, 20),
+        (5, 0x10, 3, 3, 60.0, 1400.0, 10.0, 30.0, 2, 30, 90),
+        (5, 0x20, 1, 0, 0.0, 0.0, None, None, 0, 50, 50),
+    ]
+    first, second = merge_stats(rows, interval_ns)
+
+    assert first.count == 5
+    assert first.mean_gap_us == pytest.approx(17.5)
+    assert (first.min_gap_us, first.max_gap_us) == (10.0, 30.0)
+    assert first.payload_changes == 3
+    assert first.bucket_start_ns == 5 * interval_ns
+    assert second.mean_gap_us is None
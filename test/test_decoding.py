@@ -0,0 +1,89 @@
+import os
+
+import can
+import cantools
+import pytest
+
+from can_logger.database_tools.__main__ import print_messages
+from can_logger.decoding import SignalDecoder, compile_decoder
+
+DBC = """VERSION ""
+
+BU_: ECU
+
+BO_ 256 Engine: 8 ECU
+ SG_ Rpm : 0|16@1+ (0.25,0) [0|16383.75] "rpm" Vector__XXX
+ SG_ Temp : 16|8@1- (1,-40) [-40|215] "degC" Vector__XXX
+ SG_ Gear : 24|8@1+ (1,0) [0|7] "" Vector__XXX
+ SG_ Torque : 39|16@0- (0.1,0) [-3276.8|3276.7] "Nm" Vector__XXX
+
+BO_ 2147484161 Battery: 8 ECU
+ SG_ Voltage : 3|13@1+ (0.01,0) [0|81.91] "V" Vector__XXX
+ SG_ Current : 16|12@1- (0.1,0) [-204.8|204.7] "A" Vector__XXX
+ SG_ State : 55|4@0+ (1,0) [0|15] "" Vector__XXX
+
+VAL_ 256 Gear 0 "Park" 1 "Drive" ;
+"""
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "test.dbc"
+    path.write_text(DBC)
+    return cantools.database.load_file(path)
+
+
+@pytest.fixture
+def decoder(database):
+    return SignalDecoder(database)
+
+
+def test_decoders_match_cantools(database):
+    for message in database.messages:
+        decode = compile_decoder(message)
+        for _ in range(100):
+            data = bytearray(os.urandom(message.length))
+            expected = message.decode_simple(bytes(data))
+            decoded = decode(data)
+            assert decoded.keys() == expected.keys()
+            for name, value in expected.items():
+                assert str(decoded[name]) == str(value), (message.name, name)
+
+
+def test_decode_by_id(decoder):
+    name, signals = decoder.decode(0x100, bytes([0x10, 0x00, 50, 1, 0, 0]))
+    assert name == "Engine"
+    assert signals["Rpm"] == 4.0
+    assert signals["Temp"] == 10
+    assert str(signals["Gear"]) == "Drive"
+
+
+def test_unknown_and_extended_ids(decoder):
+    assert decoder.decode(0x123, bytes(8)) is None
+    # 0x201 is only known as an extended ID
+    assert decoder.decode(0x201, bytes(8)) is None
+    name, _ = decoder.decode_message(
+        can.Message(arbitration_id=0x201, is_extended_id=True, data=bytes(8))
+    )
+    assert name == "Battery"
+    assert decoder.errors == 0
+
+
+def test_short_payload_decodes_available_signals(decoder):
+    name, signals = decoder.decode(0x100, bytes([0x10, 0x00]))
+    assert name == "Engine"
+    assert signals == {"Rpm": 4.0}
+
+
+def test_print_messages_with_decoder(decoder, capsys):
+    rows = [
+        (1, 1_700_000_000_000_000_000, 0x100, 0, 8, bytes(8), 0, 0, None),
+        (2, 1_700_000_000_000_000_000, 0x7FF, 0, 1, b"\x01", 0, 0, None),
+    ]
+    print_messages(rows, decoder)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert lines[1].strip().startswith("Engine: ")
+    assert "Rpm=0.0" in lines[1]
+    assert "Gear=Park" in lines[1]
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from can_logger.dispatch import Dispatcher
+
+
+@pytest.mark.asyncio
+async def test_batch_subscriber_receives_frames_in_order():
+    received = []
+
+    async def on_batch(batch):
+        received.append(list(batch))
+
+    dispatcher = Dispatcher()
+    dispatcher.subscribe(on_batch, batch=True)
+
+    await dispatcher.publish([1, 2, 3])
+    await dispatcher.publish([4, 5])
+    await dispatcher.close()
+
+    assert [frame for batch in received for frame in batch] == [1, 2, 3, 4, 5]
+    assert len(received) <= 2
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_drops_without_blocking_fast_one():
+    fast_received = []
+    slow_started = asyncio.Event()
+    release_slow = asyncio.Event()
+
+    async def fast(message):
+        fast_received.append(message)
+
+    async def slow(message):
+        slow_started.set()
+        await release_slow.wait()
+
+    dispatcher = Dispatcher()
+    dispatcher.subscribe(fast)
+    slow_subscriber = dispatcher.subscribe(slow, queue_size=2, max_batch=1)
+
+    await dispatcher.publish([0])
+    await slow_started.wait()
+    await dispatcher.publish(list(range(1, 10)))
+    await asyncio.sleep(0)
+
+    assert slow_subscriber.dropped == 7
+    assert dispatcher.dropped == 7
+
+    release_slow.set()
+    await dispatcher.close()
+    assert fast_received == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_callback_errors_do_not_stop_consumer(capsys):
+    received = []
+
+    async def flaky(message):
+        if message == 1:
+            raise ValueError("boom")
+        received.append(message)
+
+    dispatcher = Dispatcher()
+    dispatcher.subscribe(flaky)
+
+    await dispatcher.publish([1])
+    await dispatcher.publish([2])
+    await dispatcher.close()
+
+    assert received == [2]
+    assert "boom" in capsys.readouterr().err
@@ -0,0 +1,90 @@
+import asyncio
+
+import can
+import click
+import pytest
+
+from can_logger.can_interface import CANInterface
+from can_logger.filters import CAN_FILTER, parse_can_filter
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("123", {"can_id": 0x123, "can_mask": 0x7FF, "extended": False}),
+        ("100:700", {"can_id": 0x100, "can_mask": 0x700, "extended": False}),
+        (
+            "00000123:1FFFFFFF",
+            {"can_id": 0x123, "can_mask": 0x1FFFFFFF, "extended": True},
+        ),
+        (
+            "18FEF100:1FFFF00",
+            {"can_id": 0x18FEF100, "can_mask": 0x1FFFF00, "extended": True},
+        ),
+    ],
+)
+def test_parse_can_filter(text, expected):
+    assert parse_can_filter(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "xyz", "123:zz", "123:FFF", "3FFFFFFF"])
+def test_parse_can_filter_rejects_invalid(text):
+    with pytest.raises(ValueError):
+        parse_can_filter(text)
+
+
+def test_can_filter_param_reports_usage_error():
+    with pytest.raises(click.BadParameter, match="ID:MASK"):
+        CAN_FILTER.convert("1x3", None, None)
+
+
+@pytest.mark.asyncio
+async def test_connect_passes_filters_to_bus(mocker):
+    mock_can_bus = mocker.patch("can_logger.can_interface.can.Bus")
+    can_filters = [parse_can_filter("123")]
+    iface = CANInterface("vcan0", can_filters=can_filters)
+    await iface.connect()
+    await iface.disconnect()
+
+    assert mock_can_bus.call_args.kwargs["can_filters"] == can_filters
+
+
+@pytest.mark.asyncio
+async def test_only_matching_frames_are_received():
+    channel = "test-filters"
+    received = []
+
+    async def on_batch(messages):
+        received.extend(messages)
+
+    iface = CANInterface(
+        channel,
+        bustype="virtual",
+        can_filters=[parse_can_filter("100:7F0"), parse_can_filter("1ABCDEF")],
+        queue_frames=False,
+    )
+    iface.add_receive_callback(on_batch, batch=True)
+    await iface.connect()
+
+    sender = can.Bus(channel=channel, interface="virtual")
+    for arbitration_id, is_extended_id in [
+        (0x100, False),
+        (0x10F, False),
+        (0x110, False),
+        (0x1ABCDEF, True),
+        (0x0ABCDEF, True),
+    ]:
+        sender.send(
+            can.Message(
+                arbitration_id=arbitration_id, is_extended_id=is_extended_id
+            )
+        )
+    sender.shutdown()
+    await asyncio.sleep(0.3)
+    await iface.disconnect()
+
+    assert [(msg.arbitration_id, msg.is_extended_id) for msg in received] == [
+        (0x100, False),
+        (0x10F, False),
+        (0x1ABCDEF, True),
+    ]
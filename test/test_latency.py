@@ -0,0 +1,78 @@
+import io
+import time
+
+import can
+import pytest
+
+from can_logger.database import SQLiteBatchWriter
+from can_logger.latency import (
+    LatencyHistogram,
+    LatencyRecorder,
+    bucket_index,
+    bucket_value,
+    percentiles,
+)
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 129, 1000, 65_432, 10**7])
+def test_bucket_bounds_value_within_precision(value):
+    index = bucket_index(value)
+    assert bucket_value(index) >= value
+    assert bucket_value(index) - value <= value / 64
+    if index:
+        assert bucket_value(index - 1) < value
+
+
+def test_percentiles_of_uniform_values():
+    histogram = LatencyHistogram()
+    histogram.record(range(1, 10_001))
+
+    count, (p50, p90, p99, p999), highest = percentiles(histogram.counts)
+
+    assert count == 10_000
+    assert p50 == pytest.approx(5_000, rel=1 / 64)
+    assert p90 == pytest.approx(9_000, rel=1 / 64)
+    assert p99 == pytest.approx(9_900, rel=1 / 64)
+    assert p999 == pytest.approx(9_990, rel=1 / 64)
+    assert highest == pytest.approx(10_000, rel=1 / 64)
+
+
+def test_out_of_range_values_are_clamped():
+    histogram = LatencyHistogram(max_value=1_000)
+    histogram.record([-5, 10**9])
+    assert histogram.counts[0] == 1
+    assert histogram.counts[-1] == 1
+
+
+def test_recorder_reports_interval_and_totals():
+    output = io.StringIO()
+    recorder = LatencyRecorder(interval=None, file=output)
+    now = time.time()
+    recorder.record_messages(
+        "receive", [can.Message(timestamp=now - 0.002) for _ in range(10)]
+    )
+
+    first = recorder.report()
+    second = recorder.report()
+    assert first.splitlines()[1].split()[:2] == ["receive", "10"]
+    assert second.splitlines()[1].split()[:2] == ["receive", "0"]
+
+    recorder.stop()
+    total = output.getvalue().splitlines()[1].split()
+    assert total[:2] == ["receive", "10"]
+    # 2 ms plus the time the test took to get here
+    assert 2_000 <= int(total[2]) < 1_000_000
+
+
+def test_writer_records_callback_and_commit(tmp_path):
+    recorder = LatencyRecorder(interval=None)
+    writer = SQLiteBatchWriter(
+        tmp_path / "test.db", batch_size=100, latency=recorder
+    )
+    writer.connect()
+    writer.add_messages([can.Message(timestamp=time.time()) for _ in range(5)])
+    writer.close()
+
+    assert sum(recorder.histograms["callback"].counts) == 5
+    assert sum(recorder.histograms["commit"].counts) == 5
+    assert sum(recorder.histograms["receive"].counts) == 0
@@ -0,0 +1,115 @@
+import time
+import urllib.request
+
+import can
+import pytest
+
+from can_logger.metrics import BusMetrics, MetricsExporter
+
+
+def frames(arbitration_id, count, **kwargs):
+    return [
+        can.Message(arbitration_id=arbitration_id, data=bytes(8), **kwargs)
+        for _ in range(count)
+    ]
+
+
+def parse(text):
+    values = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+def test_bus_metrics_counts_and_bus_time():
+    metrics = BusMetrics("vcan0", bitrate=500_000)
+    metrics.update(frames(0x100, 3, is_extended_id=False))
+    metrics.update(frames(0x200, 1, is_extended_id=True))
+
+    assert metrics.frames == 4
+    assert metrics.bytes == 32
+    assert metrics.id_frames == {0x100: 3, 0x200: 1}
+    # 3 x (47 + 64) + (67 + 64) bits at 500 kbit/s
+    assert metrics.bus_time == pytest.approx((3 * 111 + 131) / 500_000)
+
+
+def test_fd_frames_use_data_bitrate():
+    metrics = BusMetrics("vcan0", bitrate=500_000, data_bitrate=2_000_000)
+    metrics.update(
+        [
+            can.Message(
+                arbitration_id=1,
+                is_extended_id=False,
+                is_fd=True,
+                bitrate_switch=True,
+                data=bytes(64),
+            )
+        ]
+    )
+    assert metrics.bus_time == pytest.approx(30 / 500_000 + 540 / 2_000_000)
+
+
+def test_exporter_rates_and_top_ids(mocker):
+    clock = mocker.patch("can_logger.metrics.time.monotonic")
+    clock.return_value = 100.0
+    metrics = BusMetrics("vcan0", bitrate=500_000)
+    exporter = MetricsExporter([metrics], top_n=2)
+
+    metrics.update(
+        frames(0x100, 30, is_extended_id=False)
+        + frames(0x200, 20, is_extended_id=False)
+        + frames(0x300, 10, is_extended_id=False)
+    )
+    clock.return_value = 102.0
+    values = parse(exporter.sample())
+
+    assert values['can_logger_frames_total{channel="vcan0"}'] == 60
+    assert values['can_logger_frames_per_second{channel="vcan0"}'] == 30
+    assert values['can_logger_bytes_per_second{channel="vcan0"}'] == 240
+    assert values[
+        'can_logger_bus_load_percent{channel="vcan0"}'
+    ] == pytest.approx(100 * 60 * 111 / 500_000 / 2, abs=1e-3)
+    ids = {
+        name: value
+        for name, value in values.items()
+        if name.startswith("can_logger_id_frames_per_second")
+    }
+    assert ids == {
+        'can_logger_id_frames_per_second{channel="vcan0",id="0x100"}': 15,
+        'can_logger_id_frames_per_second{channel="vcan0",id="0x200"}': 10,
+    }
+
+    # Rates cover only the frames since the previous sample
+    clock.return_value = 103.0
+    values = parse(exporter.sample())
+    assert values['can_logger_frames_per_second{channel="vcan0"}'] == 0
+    assert values['can_logger_frames_total{channel="vcan0"}'] == 60
+
+
+def test_exporter_serves_http_and_writes_file(tmp_path):
+    metrics = BusMetrics("vcan0")
+    metrics_file = tmp_path / "can_logger.prom"
+    exporter = MetricsExporter(
+        [metrics], interval=0.05, port=0, file_path=metrics_file
+    )
+    exporter.start()
+    try:
+        metrics.update(frames(0x123, 5))
+        deadline = time.monotonic() + 5
+        while (
+            'frames_total{channel="vcan0"} 5' not in exporter.text
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        with urllib.request.urlopen(
+            f"http://127.0.0.1:{exporter.port}/metrics"
+        ) as response:
+            body = response.read().decode()
+    finally:
+        exporter.stop()
+
+    assert 'can_logger_frames_total{channel="vcan0"} 5' in body
+    assert "# TYPE can_logger_bus_load_percent gauge" in body
+    assert "can_logger_frames_total" in metrics_file.read_text()
@@ -0,0 +1,82 @@
+import socket
+import struct
+
+import pytest
+
+import can
+
+from can_logger.receive import CAN_EFF_FLAG, read_frame, read_frames, recv_bulk
+
+
+def build_frame(can_id, data, fd=False, flags=0):
+    frame = struct.pack("=IBB2x", can_id, len(data), flags) + bytes(data)
+    return frame.ljust(72 if fd else 16, b"\x00")
+
+
+@pytest.fixture
+def sockets():
+    rx, tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    yield rx, tx
+    rx.close()
+    tx.close()
+
+
+def test_read_frame_returns_none_when_empty(sockets):
+    rx, _ = sockets
+    assert read_frame(rx) is None
+
+
+def test_read_frame_parses_classic_frame(sockets):
+    rx, tx = sockets
+    tx.send(build_frame(0x1AB, [1, 2, 3]))
+
+    msg = read_frame(rx, "vcan0")
+
+    assert msg.arbitration_id == 0x1AB
+    assert msg.is_extended_id is False
+    assert msg.is_fd is False
+    assert msg.dlc == 3
+    assert msg.data == bytearray([1, 2, 3])
+    assert msg.channel == "vcan0"
+    assert msg.timestamp > 0
+
+
+def test_read_frame_parses_extended_fd_frame(sockets):
+    rx, tx = sockets
+    tx.send(build_frame(CAN_EFF_FLAG | 0x1234567, range(12), fd=True, flags=1))
+
+    msg = read_frame(rx)
+
+    assert msg.arbitration_id == 0x1234567
+    assert msg.is_extended_id is True
+    assert msg.is_fd is True
+    assert msg.bitrate_switch is True
+    assert msg.data == bytearray(range(12))
+
+
+def test_read_frames_drains_up_to_max(sockets):
+    rx, tx = sockets
+    for i in range(5):
+        tx.send(build_frame(i, [i]))
+
+    first = read_frames(rx, max_frames=3)
+    rest = read_frames(rx, max_frames=3)
+
+    assert [msg.arbitration_id for msg in first] == [0, 1, 2]
+    assert [msg.arbitration_id for msg in rest] == [3, 4]
+    assert read_frames(rx) == []
+
+
+def test_recv_bulk_drains_virtual_bus():
+    rx = can.Bus(channel="bulk", interface="virtual")
+    tx = can.Bus(channel="bulk", interface="virtual")
+    for i in range(4):
+        tx.send(can.Message(arbitration_id=i, data=[i]))
+
+    messages = recv_bulk(rx, timeout=0.1, max_frames=10)
+    empty = recv_bulk(rx, timeout=0.01)
+    rx.shutdown()
+    tx.shutdown()
+
+    assert [msg.arbitration_id for msg in messages] == [0, 1, 2, 3]
+    assert empty == []
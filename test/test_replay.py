@@ -0,0 +1,85 @@
+import can
+import pytest
+
+from can_logger.database import SQLiteBatchWriter
+from can_logger.database_tools.database_interface import DatabaseInterface
+from can_logger.database_tools.replay import (
+    ReplayStats,
+    format_replay_stats,
+    iter_replay_rows,
+    replay_messages,
+)
+
+START = 1_700_000_000.0
+
+
+@pytest.fixture
+def db_interface(tmp_path):
+    """100 frames of two IDs, 2 ms apart."""
+    db_file = tmp_path / "test.db"
+    writer = SQLiteBatchWriter(db_file, checkpoint_interval=None)
+    writer.connect()
+    writer.add_messages(
+        [
+            can.Message(
+                timestamp=START + i * 0.002,
+                arbitration_id=0x100 + i % 2,
+                is_extended_id=False,
+                data=[i],
+            )
+            for i in range(100)
+        ]
+    )
+    writer.close()
+    db = DatabaseInterface(db_file)
+    db.connect()
+    yield db
+    db.disconnect()
+
+
+def replay(db_interface, time_scale, arbitration_id=None):
+    channel = f"test-replay-{time_scale}-{arbitration_id}"
+    with (
+        can.Bus(channel=channel, interface="virtual") as sender,
+        can.Bus(channel=channel, interface="virtual") as receiver,
+    ):
+        stats = replay_messages(
+            sender,
+            iter_replay_rows(db_interface, arbitration_id),
+            time_scale,
+        )
+        received = []
+        while (msg := receiver.recv(0)) is not None:
+            received.append(msg)
+    return stats, received
+
+
+def test_replay_keeps_timing(db_interface):
+    stats, received = replay(db_interface, 1.0)
+
+    assert [msg.data[0] for msg in received] == list(range(100))
+    assert stats.frames == 100
+    assert stats.recorded == pytest.approx(0.198)
+    assert stats.target_rate == pytest.approx(100 / 0.198)
+    # Never early, a deadline missed by the scheduler is not made up for
+    assert stats.elapsed >= 0.198
+    gaps = [b.timestamp - a.timestamp for a, b in zip(received, received[1:])]
+    assert sum(gaps) == pytest.approx(0.198, abs=0.05)
+
+
+def test_replay_scaled_and_filtered(db_interface):
+    stats, received = replay(db_interface, 0, "101")
+
+    assert [msg.arbitration_id for msg in received] == [0x101] * 50
+    assert stats.target_rate is None
+    assert stats.elapsed < 0.198
+    assert "as fast as possible" in format_replay_stats(stats)
+
+
+def test_format_replay_stats():
+    stats = ReplayStats(1000, 2, 2.0, 1.0, 0.5, 0.0015)
+
+    assert format_replay_stats(stats) == (
+        "Replayed 1000 frames in 2.000 s: 500 frames/s, target 501 frames/s,"
+        " max lag 1.5 ms, 2 failed sends."
+    )
@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+import time
+
+import can
+import pytest
+
+from can_logger.ring import FrameRing
+from can_logger.sniffer import CanSniffer
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(8, ["can0", "can1"])
+    yield ring
+    ring.close()
+
+
+def test_ring_round_trip_keeps_flags_and_channels(ring):
+    sent = [
+        can.Message(
+            timestamp=1.5,
+            arbitration_id=0x1ABCDEF,
+            is_extended_id=True,
+            channel="can1",
+        ),
+        can.Message(
+            arbitration_id=0x7FF,
+            is_extended_id=False,
+            is_fd=True,
+            bitrate_switch=True,
+            data=bytes(range(64)),
+            channel="can0",
+        ),
+        can.Message(
+            arbitration_id=0x12, is_extended_id=False, is_remote_frame=True
+        ),
+    ]
+
+    assert ring.put(sent) == 3
+    received = ring.get()
+
+    assert ring.pending == 0
+    assert [msg.channel for msg in received] == ["can1", "can0", None]
+    for msg, expected in zip(received, sent):
+        assert msg.equals(expected, timestamp_delta=1e-9)
+
+
+def test_ring_counts_overflow_and_wraps_around(ring):
+    frames = [can.Message(arbitration_id=i, data=[i]) for i in range(20)]
+
+    assert ring.put(frames[:5]) == 5
+    assert [msg.arbitration_id for msg in ring.get(3)] == [0, 1, 2]
+    assert ring.put(frames[5:]) == 6
+
+    assert ring.dropped == 9
+    assert [msg.arbitration_id for msg in ring.get()] == list(range(3, 11))
+
+
+def test_sniffer_captures_through_writer_process(tmp_path):
+    channel = "test-ring-sniffer"
+    db_path = tmp_path / "test.db"
+    sniffer = CanSniffer(
+        channel, bustype="virtual", db_path=db_path, checkpoint_interval=0
+    )
+    sniffer.connect()
+    thread = threading.Thread(target=sniffer.capture_processes)
+    thread.start()
+    while sniffer.writer is None or not sniffer.writer.is_alive():
+        time.sleep(0.01)
+
+    sender = can.Bus(channel=channel, interface="virtual")
+    for i in range(200):
+        sender.send(can.Message(arbitration_id=0x100 + i % 4, data=[i % 256]))
+    sender.shutdown()
+    time.sleep(0.3)
+    sniffer.shutdown()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT arbitration_id, data, channel FROM can_messages"
+        ).fetchall()
+    assert len(rows) == 200
+    assert rows[5] == (0x101, b"\x05", channel)
@@ -0,0 +1,145 @@
+import can
+import pytest
+
+from can_logger.database_tools.conversion import convert_segments
+from can_logger.database_tools.database_interface import DatabaseInterface
+from can_logger.frames import FRAME_RECORD
+from can_logger.segments import (
+    INDEX_INTERVAL,
+    SegmentReader,
+    SegmentWriter,
+    index_path,
+    list_segments,
+)
+from can_logger.sinks import create_sinks
+
+START_NS = 1_700_000_000_000_000_000
+
+
+def frames(count, start=0):
+    """One frame per ms, alternating between two channels."""
+    return [
+        can.Message(
+            timestamp=(START_NS + i * 1_000_000) / 1e9,
+            arbitration_id=0x100 + i % 8,
+            is_extended_id=False,
+            data=i.to_bytes(4, "little"),
+            channel=f"can{i % 2}",
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def numbers(messages):
+    return [int.from_bytes(msg.data, "little") for msg in messages]
+
+
+@pytest.fixture
+def segments_dir(tmp_path):
+    """10000 frames in segments of 4096 records, written in two runs."""
+    path = tmp_path / "segments"
+    for start in (0, 6000):
+        writer = SegmentWriter(path, segment_size=4096 * FRAME_RECORD.size)
+        writer.open()
+        sent = frames(6000 if start == 0 else 4000, start)
+        for i in range(0, len(sent), 700):
+            writer.write(sent[i : i + 700])
+        writer.close()
+    return path
+
+
+def test_segments_round_trip(segments_dir):
+    segments = list_segments(segments_dir)
+    reader = SegmentReader(segments_dir)
+    received = list(reader.iter_messages())
+
+    assert len(segments) == 3
+    assert len(index_path(segments[0]).read_bytes()) == 4 * 16
+    assert numbers(received) == list(range(10000))
+    assert reader.channels == ["can0", "can1"]
+    for msg, expected in zip(received[:50], frames(50)):
+        assert msg.equals(expected, timestamp_delta=1e-6)
+        assert msg.channel == expected.channel
+
+
+def test_segments_time_range(segments_dir):
+    start_ns = START_NS + 2_499_500_000
+    end_ns = START_NS + 7_300_500_000
+
+    received = list(
+        SegmentReader(segments_dir).iter_messages(start_ns, end_ns)
+    )
+
+    assert numbers(received) == list(range(2500, 7301))
+
+
+def test_binary_flags_and_torn_records(tmp_path):
+    sent = [
+        can.Message(
+            timestamp=1.5, arbitration_id=0x1ABCDEF, is_extended_id=True
+        ),
+        can.Message(
+            arbitration_id=0x7FF,
+            is_extended_id=False,
+            is_fd=True,
+            error_state_indicator=True,
+            data=bytes(range(64)),
+        ),
+        can.Message(is_error_frame=True, data=bytes(8)),
+    ]
+    writer = SegmentWriter(tmp_path)
+    writer.open()
+    writer.write(sent)
+    writer.close()
+    segment = list_segments(tmp_path)[0]
+    # A record cut short by a crash while writing
+    with open(segment, "ab") as file:
+        file.write(bytes(FRAME_RECORD.size // 2))
+
+    received = list(SegmentReader(tmp_path).iter_messages())
+
+    assert len(received) == len(sent)
+    for msg, expected in zip(received, sent):
+        assert msg.equals(expected, timestamp_delta=1e-9)
+        assert msg.channel is None
+
+
+def test_convert_segments(segments_dir, tmp_path):
+    db_path = tmp_path / "converted.db"
+
+    count = convert_segments(
+        segments_dir,
+        db_path,
+        START_NS + 999_500_000,
+        START_NS + 2_000_500_000,
+        batch_size=300,
+    )
+
+    db = DatabaseInterface(db_path, channel="can1")
+    db.connect()
+    rows = db.get_all_messages()
+    db.disconnect()
+    assert count == 1001
+    assert len(rows) == 500
+    assert abs(rows[0][1] - (START_NS + 1_001_000_000)) < 1000
+    assert rows[0][2:] == (
+        0x101,
+        0,
+        4,
+        (1001).to_bytes(4, "little"),
+        0,
+        0,
+        "can1",
+    )
+
+
+@pytest.mark.asyncio
+async def test_segments_sink(tmp_path):
+    (sink,) = create_sinks(["segments"], segments_path=tmp_path / "seg")
+    await sink.open()
+    await sink.write(frames(INDEX_INTERVAL + 10))
+    await sink.close()
+
+    assert len(list(SegmentReader(tmp_path / "seg").iter_messages())) == (
+        INDEX_INTERVAL + 10
+    )
@@ -0,0 +1,102 @@
+import json
+from datetime import datetime
+
+import can
+
+from can_logger.database import SQLiteBatchWriter
+from can_logger.database_tools.database_interface import DatabaseInterface
+from can_logger.sharding import ShardManifest, group_rows_by_shard
+
+HOUR = 3600
+
+
+def make_messages(start, hours):
+    return [
+        can.Message(
+            timestamp=start + hour * HOUR + i, arbitration_id=hour, data=[i]
+        )
+        for hour in range(hours)
+        for i in range(3)
+    ]
+
+
+def test_group_rows_by_shard_splits_on_period_boundary():
+    period = HOUR * 1_000_000_000
+    rows = [(period - 1,), (period,), (period + 1,)]
+
+    assert group_rows_by_shard(rows, period) == [
+        (0, [(period - 1,)]),
+        (period, [(period,), (period + 1,)]),
+    ]
+
+
+def test_manifest_overlap_selection(tmp_path):
+    manifest = ShardManifest(tmp_path / "log.db", "hourly")
+    period = manifest.period_ns
+    for start in (0, period, 2 * period):
+        manifest.shard_path(start)
+
+    selected = manifest.shards_overlapping(period + 1, period + 2)
+    reloaded = ShardManifest.load(tmp_path / "log.manifest.json")
+
+    assert [path.name for path in selected] == ["log-19700101T01.db"]
+    assert reloaded.shards == manifest.shards
+    assert len(json.loads(manifest.path.read_text())["shards"]) == 3
+
+
+def test_sharded_writer_and_routed_queries(tmp_path):
+    db_path = tmp_path / "can_messages.db"
+    start = datetime(2025, 1, 1, 10).timestamp()
+    writer = SQLiteBatchWriter(
+        db_path, checkpoint_interval=None, shard_period="hourly"
+    )
+    writer.connect()
+    writer.add_messages(make_messages(start, 3))
+    writer.close()
+
+    assert not db_path.exists()
+    assert len(list(tmp_path.glob("can_messages-*.db"))) == 3
+
+    db = DatabaseInterface(db_path)
+    db.connect()
+    all_rows = db.get_all_messages()
+    hour_rows = db.get_messages_by_datetime("2025-01-01", 11)
+    last_rows = db.get_last_n_messages(4)
+    id_rows = db.get_messages_by_arbitration_id(2)
+    streamed_rows = list(db.iter_all_messages())
+    db.disconnect()
+
+    assert len(all_rows) == 9
+    assert {row[2] for row in hour_rows} == {1}
+    assert [row[2] for row in last_rows] == [2, 2, 2, 1]
+    assert len(id_rows) == 3
+    assert streamed_rows == all_rows
+
+
+def test_sharded_log_without_repeats_reads_expanded(tmp_path):
+    db_path = tmp_path / "can_messages.db"
+    start = datetime(2025, 1, 1, 10).timestamp()
+    writer = SQLiteBatchWriter(
+        db_path, checkpoint_interval=None, shard_period="hourly"
+    )
+    writer.connect()
+    writer.add_messages(make_messages(start, 3))
+    writer.close()
+
+    stored = DatabaseInterface(db_path)
+    stored.connect()
+    rows = stored.get_all_messages()
+    stored.disconnect()
+    db = DatabaseInterface(db_path, expand=True)
+    db.connect()
+    expanded = db.get_all_messages()
+    hour_rows = db.get_messages_by_datetime("2025-01-01", 11)
+    streamed = list(db.iter_all_messages())
+    suppressed = db.get_suppressed_counts()
+    db.disconnect()
+
+    assert len(rows) == 9
+    assert expanded == rows
+    assert hour_rows == [row for row in rows if row[2] == 1]
+    assert streamed == rows
+    assert suppressed == []
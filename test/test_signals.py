@@ -0,0 +1,123 @@
+import sqlite3
+from datetime import datetime
+
+import can
+import pytest
+
+from can_logger.database import CANMessageDatabase, SQLiteBatchWriter
+from can_logger.database_tools.backfill import backfill_signals
+from can_logger.database_tools.database_interface import DatabaseInterface
+
+DBC = """VERSION ""
+
+BU_: ECU
+
+BO_ 256 Engine: 8 ECU
+ SG_ Rpm : 0|16@1+ (0.25,0) [0|16383.75] "rpm" Vector__XXX
+ SG_ Gear : 16|8@1+ (1,0) [0|7] "" Vector__XXX
+
+VAL_ 256 Gear 0 "Park" 1 "Drive" ;
+"""
+
+START = datetime(2025, 1, 1, 10).timestamp()
+
+
+@pytest.fixture
+def dbc_path(tmp_path):
+    path = tmp_path / "engine.dbc"
+    path.write_text(DBC)
+    return path
+
+
+def make_messages(first, count):
+    return [
+        can.Message(
+            timestamp=START + i,
+            arbitration_id=0x100 if i % 2 else 0x200,
+            is_extended_id=False,
+            data=(4 * i).to_bytes(2, "little") + bytes([i % 2, 0]),
+        )
+        for i in range(first, first + count)
+    ]
+
+
+def signal_progress(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute(
+            "SELECT (SELECT last_message_id FROM signal_state),"
+            " (SELECT count(*) FROM signals),"
+            " (SELECT max(id) FROM can_messages)"
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def write(db_file, messages, dbc_path=None):
+    writer = SQLiteBatchWriter(
+        db_file, checkpoint_interval=None, dbc_path=dbc_path
+    )
+    writer.connect()
+    writer.add_messages(messages)
+    writer.close()
+
+
+def test_writer_materializes_signals(tmp_path, dbc_path):
+    db_file = tmp_path / "live.db"
+    write(db_file, make_messages(0, 10), dbc_path)
+
+    # 5 Engine frames with 2 signals each, 0x200 is unknown
+    assert signal_progress(db_file) == (10, 10, 10)
+
+    db = DatabaseInterface(db_file)
+    db.connect()
+    rpm = db.get_signal_values("Engine.Rpm")
+    gear = list(db.iter_signal_values("Gear", "2025-01-01", 10, 0))
+    db.disconnect()
+
+    assert [value for _, value in rpm] == [1.0, 3.0, 5.0, 7.0, 9.0]
+    assert rpm[0][0] == round((START + 1) * 1e9)
+    assert [value for _, value in gear] == [1.0] * 5
+
+
+@pytest.mark.asyncio
+async def test_async_writer_materializes_signals(tmp_path, dbc_path):
+    db_file = tmp_path / "async.db"
+    db = CANMessageDatabase(
+        db_file, checkpoint_interval=None, dbc_path=dbc_path
+    )
+    await db.connect()
+    await db.add_messages(make_messages(0, 10))
+    await db.disconnect()
+
+    assert signal_progress(db_file) == (10, 10, 10)
+
+
+def test_backfill_from_high_water_mark(tmp_path, dbc_path, capsys):
+    db_file = tmp_path / "backfill.db"
+    write(db_file, make_messages(0, 10))
+
+    # Behind: new frames are left to the backfill instead of decoded
+    write(db_file, make_messages(10, 10), dbc_path)
+    assert "10 frames are not decoded yet" in capsys.readouterr().out
+    assert signal_progress(db_file) == (0, 0, 20)
+
+    assert backfill_signals(db_file, dbc_path) == 20
+    assert signal_progress(db_file) == (20, 20, 20)
+    assert backfill_signals(db_file, dbc_path) == 0
+
+    # Caught up again, so the writer decodes live
+    write(db_file, make_messages(20, 10), dbc_path)
+    assert signal_progress(db_file) == (30, 30, 30)
+
+
+def test_signal_query_uses_index(tmp_path, dbc_path):
+    db_file = tmp_path / "explain.db"
+    write(db_file, make_messages(0, 10), dbc_path)
+
+    db = DatabaseInterface(db_file, explain=True)
+    db.connect()
+    db.get_signal_values("Engine.Rpm", "2025-01-01")
+    db.disconnect()
+
+    assert any("idx_signals_id_ts" in line for line in db.query_plans[0].plan)
@@ -0,0 +1,77 @@
+import asyncio
+import io
+
+import can
+import pytest
+
+from can_logger.sinks import TopSink
+from can_logger.top import HEADER, TopTable
+
+
+def message(arbitration_id, data, timestamp, is_extended_id=False):
+    return can.Message(
+        timestamp=timestamp,
+        arbitration_id=arbitration_id,
+        is_extended_id=is_extended_id,
+        data=data,
+    )
+
+
+def test_rows_keep_last_frame_count_and_rate():
+    table = TopTable("vcan0")
+    table._rendered_at = 100.0
+    table.update(
+        [
+            message(0x200, b"\x01", 100.1),
+            message(0x123, b"\xde\xad", 100.2),
+            message(0x200, b"\x02\x03", 100.5),
+            message(0x1ABCDEF, b"", 100.9, is_extended_id=True),
+        ]
+    )
+
+    lines = table.render(now=101.0).splitlines()
+
+    assert lines[0] == "vcan0  4 frames  4.0 frames/s  3 IDs"
+    assert lines[1] == HEADER
+    assert lines[2].split() == ["123", "[2]", "1", "1.0", "0.80", "DE", "AD"]
+    assert lines[3].split() == ["200", "[2]", "2", "2.0", "0.50", "02", "03"]
+    assert lines[4].split() == ["01ABCDEF", "[0]", "1", "1.0", "0.10"]
+
+
+def test_rates_only_count_frames_since_last_render():
+    table = TopTable()
+    table._rendered_at = 0.0
+    table.update([message(0x100, b"", 0.5)] * 10)
+    table.render(now=1.0)
+    table.update([message(0x100, b"", 1.5)] * 4)
+
+    row = table.render(now=3.0).splitlines()[2].split()
+
+    assert row[2:4] == ["14", "2.0"]
+
+
+def test_render_fits_terminal():
+    table = TopTable()
+    table.update([message(i, bytes(64), 0.0) for i in range(20)])
+
+    lines = table.render(width=40, height=10, now=1.0).splitlines()
+
+    assert len(lines) == 10
+    assert lines[-1] == "... 13 more IDs"
+    assert max(map(len, lines)) == 40
+
+
+@pytest.mark.asyncio
+async def test_top_sink_redraws_at_refresh_interval():
+    output = io.StringIO()
+    sink = TopSink("vcan0", refresh_interval=0.05, file=output)
+    await sink.open()
+    for _ in range(100):
+        await sink.write([message(0x123, b"\x01", 0.0)])
+    await asyncio.sleep(0.12)
+    await sink.close()
+
+    tables = output.getvalue().split("\n\n")
+    # Two refreshes and the final table, independent of the frame count
+    assert 3 <= len([table for table in tables if table]) <= 4
+    assert tables[-2].startswith("vcan0  100 frames")